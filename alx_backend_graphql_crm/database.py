@@ -0,0 +1,87 @@
+"""
+Database configuration helpers for settings.py
+
+Build a DATABASES entry from a URL, so deployments configure the database
+through the environment:
+
+    DATABASE_URL=postgres://crm:secret@db:5432/crm
+    DATABASE_URL=sqlite:////var/lib/crm/db.sqlite3
+"""
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+POSTGRES_SCHEMES = {'postgres', 'postgresql', 'pgsql'}
+
+# Applied to every new SQLite connection. WAL lets readers run alongside
+# the single writer; synchronous=NORMAL is durable in WAL mode and skips an
+# fsync per commit.
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA mmap_size=134217728',
+]
+
+
+def sqlite_config(name, busy_timeout=20):
+    """DATABASES entry for a SQLite file with WAL and tuned pragmas"""
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so transactions
+            # that read before writing (e.g. the stock ledger) wait for each
+            # other instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds a writer waits for the lock
+            'timeout': busy_timeout,
+            'init_command': ';'.join(SQLITE_PRAGMAS),
+        },
+    }
+
+
+def postgres_config(url, pool=False, pool_min_size=2, pool_max_size=10, pool_timeout=10):
+    """
+    DATABASES entry for a postgres:// URL. With `pool`, connections come from
+    a psycopg_pool.ConnectionPool per process (psycopg 3 with the [pool]
+    extra required); query-string parameters become connection OPTIONS.
+    """
+    parts = urlsplit(url)
+    options = dict(parse_qsl(parts.query))
+    if pool:
+        options['pool'] = {
+            'min_size': pool_min_size,
+            'max_size': pool_max_size,
+            'timeout': pool_timeout,
+        }
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': unquote(parts.path.lstrip('/')),
+        'USER': unquote(parts.username or ''),
+        'PASSWORD': unquote(parts.password or ''),
+        'HOST': parts.hostname or '',
+        'PORT': str(parts.port or ''),
+        'OPTIONS': options,
+    }
+
+
+def database_config(url, conn_max_age=60, pool=False, **pool_options):
+    """
+    DATABASES entry for `url` with persistent connections: each thread keeps
+    its connection for `conn_max_age` seconds (None: forever) and Django
+    health-checks it before reuse. A pooled Postgres configuration hands
+    connections back to the pool instead, so CONN_MAX_AGE is 0 there.
+    """
+    scheme = urlsplit(url).scheme
+    if scheme == 'sqlite':
+        # sqlite:////absolute/path or sqlite:///relative/path
+        config = sqlite_config(unquote(url[len('sqlite:///'):]))
+    elif scheme in POSTGRES_SCHEMES:
+        config = postgres_config(url, pool=pool, **pool_options)
+    else:
+        raise ValueError(f"Unsupported DATABASE_URL scheme: {scheme!r}")
+
+    pooled = 'pool' in config['OPTIONS']
+    config['CONN_MAX_AGE'] = 0 if pooled else conn_max_age
+    config['CONN_HEALTH_CHECKS'] = not pooled
+    return config
@@ -10,8 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from kombu import Queue
+
+from .database import database_config, sqlite_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +50,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'crm.middleware.HealthCheckMiddleware',
+    'crm.middleware.RateLimitMiddleware',
+    'crm.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,13 +85,47 @@ WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# DATABASE_URL selects the database (postgres://... or sqlite:///path);
+# the default is the local SQLite file. Connections persist for
+# DB_CONN_MAX_AGE seconds per thread, or come from a psycopg pool per
+# process when DB_POOL=1 (Postgres only). See database.py.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(
+        os.environ.get('DATABASE_URL', f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        pool=os.environ.get('DB_POOL') == '1',
+        pool_min_size=int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        pool_max_size=int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    ),
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # File-backed test database: the in-memory default uses SQLite's shared
+    # cache, which fails concurrent writers with "table is locked" instead
+    # of waiting, and the stock concurrency tests run parallel writers
+    DATABASES['default']['TEST'] = {
+        'NAME': BASE_DIR / 'test_db.sqlite3',
+    }
+
+# Read replicas: aliases in DATABASES that serve GraphQL query operations
+# (see crm/routers.py). Set CRM_REPLICA_DB to the path of a copy of
+# db.sqlite3 to try replica routing locally with two SQLite databases.
+DATABASE_REPLICAS = []
+
+if os.environ.get('CRM_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **sqlite_config(os.environ['CRM_REPLICA_DB']),
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        # Tests read the replica through the primary's test database
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+    DATABASE_REPLICAS.append('replica')
+
+DATABASE_ROUTERS = ['crm.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -128,17 +170,50 @@ GRAPHENE = {
 
 # Django Crontab Configuration
 CRONJOBS = [
-    ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
     ('0 */12 * * *', 'crm.cron.update_low_stock'),
 ]
 
-# Celery Configuration
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+# Celery Configuration (the only place it is set; crm/celery.py reads it)
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_ENABLE_UTC = True
+
+# Queues and routing: long reports and imports get their own workers so
+# they cannot starve notifications. Worker profiles (concurrency, prefetch,
+# queues) are in crm/settings.py WORKER_PROFILES.
+CELERY_TASK_QUEUES = (
+    Queue('default'),
+    Queue('reports'),
+    Queue('imports'),
+    Queue('notifications'),
+)
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'crm.tasks.*crm_report*': {'queue': 'reports'},
+    'crm.tasks.refresh_sales_rollups': {'queue': 'reports'},
+    'crm.tasks.purge_archived_customers': {'queue': 'reports'},
+    'crm.tasks.import_*': {'queue': 'imports'},
+    'crm.tasks.send_order_reminder*': {'queue': 'notifications'},
+    'crm.tasks.finalize_order_reminders': {'queue': 'notifications'},
+}
+# Tasks are idempotent, so acknowledge after they finish: a task on a
+# worker that dies is redelivered instead of lost. Redis redelivers
+# unacknowledged tasks after the visibility timeout, which must exceed the
+# longest task.
+CELERY_TASK_ACKS_LATE = True
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 2 * 60 * 60}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Tasks are fire-and-forget unless they opt in with ignore_result=False
+# (chord headers); kept results expire after an hour
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_RESULT_EXPIRES = 60 * 60
+# Let workers keep database connections across tasks; crm/celery.py closes
+# them per CONN_MAX_AGE instead of after every task
+CELERY_DB_REUSE_MAX = 1000
 
 # Celery Beat Schedule
 from celery.schedules import crontab
@@ -148,4 +223,24 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm.tasks.generate_crm_report',
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
+    'refresh-sales-rollups': {
+        'task': 'crm.tasks.refresh_sales_rollups',
+        'schedule': crontab(minute='*/15'),
+    },
+    'compact-stock-ledger': {
+        'task': 'crm.tasks.compact_stock_ledger',
+        'schedule': crontab(minute=30),
+    },
+    'record-heartbeat': {
+        'task': 'crm.tasks.record_heartbeat',
+        'schedule': crontab(minute='*/5'),
+    },
+    'purge-archived-customers': {
+        'task': 'crm.tasks.purge_archived_customers',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'relay-change-events': {
+        'task': 'crm.tasks.relay_change_events',
+        'schedule': crontab(minute='*'),
+    },
 }
@@ -0,0 +1,138 @@
+"""
+Benchmark GraphQL request throughput under different connection settings.
+
+Runs the same query through Django's WSGI handler, so connections are
+opened and closed exactly as in a deployed server, with:
+  - baseline: CONN_MAX_AGE=0, default SQLite journal (a connection per request)
+  - persistent: CONN_MAX_AGE=60 with health checks
+  - persistent+wal: persistent plus the WAL pragmas from database.py
+
+Run with: python benchmarks/db_connections.py [--requests 2000] [--threads 4]
+Uses a throwaway SQLite database unless DATABASE_URL is set, with rate
+limiting off since every request comes from the same client. Responses
+other than a 200 without GraphQL errors are counted per scenario, and the
+run exits with status 1 if there were any.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/bench.sqlite3"
+
+# Setup Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+import django
+django.setup()
+
+from decimal import Decimal
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.db import connections
+
+from alx_backend_graphql_crm.database import SQLITE_PRAGMAS
+from crm.models import Product
+from crm.settings import RATE_LIMIT_SETTINGS
+
+QUERY = json.dumps({'query': '{ allProducts(first: 20) { edges { node { name price stock } } } }'}).encode()
+
+SCENARIOS = {
+    'baseline': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False,
+                 'init_command': 'PRAGMA journal_mode=DELETE'},
+    'persistent': {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True,
+                   'init_command': 'PRAGMA journal_mode=DELETE'},
+    'persistent+wal': {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True,
+                       'init_command': ';'.join(SQLITE_PRAGMAS)},
+}
+
+
+def request(handler):
+    """Send the query; returns whether it succeeded (200 and no GraphQL errors)"""
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/graphql',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(QUERY)),
+        'wsgi.input': io.BytesIO(QUERY),
+        'wsgi.url_scheme': 'http',
+    }
+    status = []
+    response = handler(environ, lambda line, headers: status.append(int(line.split()[0])))
+    try:
+        body = b''.join(response)
+    finally:
+        # Fires request_finished, which closes connections per CONN_MAX_AGE
+        response.close()
+    if status[0] != 200:
+        return False
+    try:
+        return not json.loads(body).get('errors')
+    except ValueError:
+        return False
+
+
+def configure(scenario):
+    connections.close_all()
+    settings_dict = connections['default'].settings_dict
+    settings_dict['CONN_MAX_AGE'] = scenario['CONN_MAX_AGE']
+    settings_dict['CONN_HEALTH_CHECKS'] = scenario['CONN_HEALTH_CHECKS']
+    if settings_dict['ENGINE'] == 'django.db.backends.sqlite3':
+        settings_dict['OPTIONS']['init_command'] = scenario['init_command']
+
+
+def run(handler, requests, threads):
+    """Returns (requests per second, failed requests)"""
+    def worker(count):
+        try:
+            return sum(not request(handler) for _ in range(count))
+        finally:
+            connections.close_all()
+
+    per_thread = requests // threads
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        errors = sum(pool.map(worker, [per_thread] * threads))
+    return per_thread * threads / (time.perf_counter() - started), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    # Every request comes from one client: measure the database, not the rate limiter
+    RATE_LIMIT_SETTINGS['ENABLED'] = False
+    call_command('migrate', verbosity=0)
+    if not Product.objects.exists():
+        Product.objects.bulk_create([
+            Product(name=f"Product {i}", price=Decimal('9.99'), stock=i) for i in range(50)
+        ])
+
+    handler = WSGIHandler()
+    if not request(handler):  # warm up imports and the schema
+        sys.exit("The benchmark query failed")
+    print(f"{args.requests} requests, {args.threads} threads, {connections['default'].vendor}")
+    failed = 0
+    for name, scenario in SCENARIOS.items():
+        configure(scenario)
+        rate, errors = run(handler, args.requests, args.threads)
+        failed += errors
+        print(f"  {name:<16} {rate:8.1f} req/s" + (f"  {errors} failed" if errors else ""))
+    if failed:
+        sys.exit(f"{failed} request(s) failed: the throughput above includes error responses")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark GraphQL response serialization on a 10k-node allOrders payload.
+
+The payload is the ExecutionResult shape the view encodes for
+  allOrders { edges { node { id totalAmount orderDate customer { id name email }
+                             products { edges { node { id name price } } } } } }
+and is encoded with:
+  - stdlib: json.dumps as graphene-django's GraphQLView does it
+  - crm.encoding.dumps (orjson when installed, else the stdlib fallback)
+  - crm.encoding.iter_dumps, consumed chunk by chunk as a streamed response
+Times are the best of --repeat runs; peak memory is measured separately
+with tracemalloc (the payload itself is excluded).
+
+Run with: python benchmarks/json_encoding.py [--nodes 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Setup Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+import django
+django.setup()
+
+from crm import encoding
+
+
+def make_payload(nodes):
+    return {'data': {'allOrders': {'edges': [
+        {'node': {
+            'id': f"T3JkZXJUeXBlOj{index}",
+            'totalAmount': f"{index % 500 + 0.99:.2f}",
+            'orderDate': f"2026-0{index % 9 + 1}-1{index % 10}T10:{index % 60:02d}:00+00:00",
+            'customer': {'id': f"Q3VzdG9tZXJUeXBlOj{index % 1000}", 'name': f"Customer {index % 1000}",
+                         'email': f"customer{index % 1000}@example.com"},
+            'products': {'edges': [
+                {'node': {'id': f"UHJvZHVjdFR5cGU6{index % 200 + item}", 'name': f"Product {index % 200 + item}",
+                          'price': f"{(index + item) % 90 + 9.5:.2f}"}}
+                for item in range(3)
+            ]},
+        }}
+        for index in range(nodes)
+    ]}}}
+
+
+def stdlib(payload):
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def fast(payload):
+    return encoding.dumps(payload)
+
+
+def streamed(payload):
+    size = 0
+    for chunk in encoding.iter_dumps(payload, min_items=1000):
+        size += len(chunk)
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--nodes', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    payload = make_payload(args.nodes)
+    size = len(fast(payload))
+    backend = 'orjson' if encoding.orjson is not None else 'stdlib fallback'
+    print(f"{args.nodes} nodes, {size / 1e6:.1f} MB of JSON, crm.encoding backend: {backend}")
+    print(f"  {'encoder':<22} {'best time':>10} {'peak memory':>12}")
+    for label, func in (('stdlib json.dumps', stdlib), ('crm.encoding.dumps', fast), ('crm.encoding.iter_dumps', streamed)):
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            func(payload)
+            best = min(best, time.perf_counter() - started)
+        tracemalloc.start()
+        func(payload)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {label:<22} {best * 1000:8.1f}ms {peak / 1e6:10.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
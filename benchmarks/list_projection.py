@@ -0,0 +1,97 @@
+"""
+Benchmark the `customers`, `products` and `orders` list queries with and
+without GRAPHQL_SETTINGS['LIST_PROJECTION'] (see crm/projection.py).
+
+Each query selects plain columns only, so the projection path applies; it
+is executed through the schema (no HTTP) and timed end to end, with peak
+memory measured in a separate tracemalloc run.
+
+Run with: python benchmarks/list_projection.py [--rows 50000]
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/bench.sqlite3"
+
+# Setup Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+import django
+django.setup()
+
+from decimal import Decimal
+from unittest import mock
+
+from django.core.management import call_command
+
+from alx_backend_graphql_crm.schema import schema
+from crm.models import Customer, Order, Product
+from crm.settings import GRAPHQL_SETTINGS
+
+QUERIES = {
+    'customers': '{ customers { id name email phone createdAt } }',
+    'products': '{ products { id name price stock } }',
+    'orders': '{ orders { id totalAmount orderDate } }',
+}
+
+
+def populate(rows):
+    if Customer.objects.count() >= rows:
+        return
+    customers = Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"customer{i}@example.com", phone='+15550000000')
+        for i in range(rows)
+    )
+    Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=Decimal('9.99'), stock=i % 100) for i in range(rows)
+    )
+    Order.objects.bulk_create(
+        Order(customer=customers[i % len(customers)], total_amount=Decimal('19.98')) for i in range(rows)
+    )
+
+
+def execute(name):
+    result = schema.execute(QUERIES[name])
+    if result.errors:
+        raise SystemExit(result.errors)
+    return len(result.data[name])
+
+
+def measure(name, projection):
+    with mock.patch.dict(GRAPHQL_SETTINGS, {'LIST_PROJECTION': projection}):
+        started = time.perf_counter()
+        rows = execute(name)
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        execute(name)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return rows / elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=50_000)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    populate(args.rows)
+    execute('products')  # warm up the schema
+
+    print(f"{args.rows} rows per list")
+    print(f"  {'query':<10} {'path':<11} {'rows/s':>10} {'peak memory':>12}")
+    for name in QUERIES:
+        for label, projection in (('models', False), ('projection', True)):
+            rate, peak = measure(name, projection)
+            print(f"  {name:<10} {label:<11} {rate:10,.0f} {peak / 1e6:10.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,463 @@
+"""
+Load-test the CRM GraphQL API end to end with local stand-ins.
+
+Virtual users (asyncio tasks) replay a weighted mix of operations for
+--duration seconds against one of these targets:
+  - wsgi: Django's WSGI handler in-process, on a --users thread pool (default)
+  - asgi: the ASGI application in-process, through httpx
+  - a URL (--url http://localhost:8000/graphql): a running server, over HTTP
+The operations are createOrder, bulkCreateCustomers, allOrders with filters
+and updateLowStockProducts (see OPERATIONS). In-process targets run on a
+seeded throwaway SQLite database, or on --database when it is given
+(DATABASE_URL is ignored, so a run never floods the configured database
+by accident). Celery runs eagerly, and the beat jobs that follow writes
+fire every --job-interval seconds under the load. Those jobs are the sales
+rollups, stock ledger compaction and change feed relay. Redis is replaced
+by fakeredis when it is installed, and otherwise by the in-memory rate
+limit store and stream publisher. Rate limiting is off unless --rate-limit
+is given, since every virtual user shares one client. A --url run touches
+no local database: it reads customer and product ids from the server and
+leaves seeding, beat jobs and rate limiting to the server.
+
+Throughput, latency percentiles and error rates are printed every
+--interval seconds, then per operation for the whole run. --check exits
+with status 1 when the run breaks a threshold in load_budget.json.
+
+Run with: python benchmarks/load_test.py [--users 8] [--duration 30]
+          [--mix createOrder=3,bulkCreateCustomers=1,allOrders=6,updateLowStockProducts=1]
+          [--target wsgi|asgi] [--url URL] [--database URL] [--check] [--json results.json]
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Read before Django's settings: only an explicit --database replaces the throwaway SQLite
+_database_option = argparse.ArgumentParser(add_help=False)
+_database_option.add_argument('--database')
+os.environ['DATABASE_URL'] = (
+    _database_option.parse_known_args()[0].database or f"sqlite:///{tempfile.mkdtemp()}/load.sqlite3"
+)
+
+# Setup Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+import django
+django.setup()
+
+from decimal import Decimal
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.db import connections
+from graphql_relay import from_global_id
+
+from crm import outbox, ratelimit
+from crm.celery import app as celery_app
+from crm.models import Customer, Order, Product
+from crm.settings import CHANGE_FEED_SETTINGS, RATE_LIMIT_SETTINGS
+from crm.tasks import compact_stock_ledger, refresh_sales_rollups, relay_change_events
+
+BUDGET_FILE = Path(__file__).resolve().parent / 'load_budget.json'
+
+DEFAULT_MIX = 'createOrder=3,bulkCreateCustomers=1,allOrders=6,updateLowStockProducts=1'
+
+ALL_ORDERS = """
+    query Orders($minTotal: Decimal, $customerName: String) {
+        allOrders(first: 20, totalAmount_Gte: $minTotal, customerName: $customerName) {
+            edges { node { id totalAmount orderDate customer { name } products { edges { node { name price } } } } }
+        }
+    }
+"""
+CREATE_ORDER = """
+    mutation CreateOrder($input: CreateOrderInput!) {
+        createOrder(input: $input) { order { id totalAmount } }
+    }
+"""
+BULK_CREATE_CUSTOMERS = """
+    mutation BulkCreate($input: [BulkCustomerInput]!) {
+        bulkCreateCustomers(input: $input) { customers { id } errors }
+    }
+"""
+UPDATE_LOW_STOCK = "mutation { updateLowStockProducts { message } }"
+CATALOG = "{ customers { id } products { id } }"
+
+
+class Catalog:
+    """Ids the operations pick from"""
+
+    def __init__(self, customer_ids, product_ids):
+        self.customer_ids = customer_ids
+        self.product_ids = product_ids
+        self.emails = itertools.count()
+        self.run = f"{int(time.time()):x}"
+
+    @classmethod
+    def from_database(cls):
+        """The ids of the seeded database (in-process targets)"""
+        return cls(
+            list(Customer.objects.values_list('pk', flat=True)),
+            list(Product.objects.values_list('pk', flat=True)),
+        )
+
+    @classmethod
+    async def from_server(cls, target):
+        """The ids the server returns for `customers` and `products` (a --url target)"""
+        status, body = await target.send(CATALOG, {})
+        if not succeeded(status, body):
+            raise SystemExit(f"Could not read customer and product ids from the server: {status} {body[:200]!r}")
+        data = json.loads(body)['data']
+        ids = {name: [int(from_global_id(row['id'])[1]) for row in data[name]] for name in ('customers', 'products')}
+        if not ids['customers'] or len(ids['products']) < 3:
+            raise SystemExit("The server needs at least one customer and three products to load")
+        return cls(ids['customers'], ids['products'])
+
+
+def create_order(rng, catalog):
+    return CREATE_ORDER, {'input': {
+        'customerId': str(rng.choice(catalog.customer_ids)),
+        'productIds': [str(pk) for pk in rng.sample(catalog.product_ids, rng.randint(1, 3))],
+    }}
+
+
+def bulk_create_customers(rng, catalog):
+    return BULK_CREATE_CUSTOMERS, {'input': [
+        {'name': f"Load {number}", 'email': f"load-{catalog.run}-{number}@example.com", 'phone': '+15550001111'}
+        for number in itertools.islice(catalog.emails, 10)
+    ]}
+
+
+def all_orders(rng, catalog):
+    return ALL_ORDERS, {
+        'minTotal': rng.choice([None, '10', '50', '100']),
+        'customerName': rng.choice([None, None, f"Customer {rng.randint(0, 9)}"]),
+    }
+
+
+def update_low_stock_products(rng, catalog):
+    return UPDATE_LOW_STOCK, {}
+
+
+OPERATIONS = {
+    'createOrder': create_order,
+    'bulkCreateCustomers': bulk_create_customers,
+    'allOrders': all_orders,
+    'updateLowStockProducts': update_low_stock_products,
+}
+
+# Beat jobs run eagerly during the load: {name: task}
+JOBS = {
+    'refresh_sales_rollups': refresh_sales_rollups,
+    'compact_stock_ledger': compact_stock_ledger,
+    'relay_change_events': relay_change_events,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name.strip()!r} (choose from {', '.join(OPERATIONS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def succeeded(status, body):
+    if status != 200:
+        return False
+    try:
+        return not json.loads(body).get('errors')
+    except ValueError:
+        return False
+
+
+class WSGITarget:
+    """Django's WSGI handler called in-process from a thread pool"""
+
+    def __init__(self, threads):
+        self.handler = WSGIHandler()
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def _call(self, body):
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': '/graphql',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'HTTP_HOST': 'localhost',
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.url_scheme': 'http',
+        }
+        status = []
+        response = self.handler(environ, lambda line, headers: status.append(int(line.split()[0])))
+        try:
+            return status[0], b''.join(response)
+        finally:
+            response.close()
+
+    async def send(self, query, variables):
+        body = json.dumps({'query': query, 'variables': variables}).encode()
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self._call, body)
+
+    async def close(self):
+        self.pool.submit(connections.close_all).result()
+        self.pool.shutdown()
+
+
+class HTTPTarget:
+    """A URL, or the ASGI application in-process, through httpx"""
+
+    def __init__(self, url=None):
+        import httpx
+
+        if url:
+            self.client = httpx.AsyncClient(timeout=30)
+            self.url = url
+        else:
+            from alx_backend_graphql_crm.asgi import application
+
+            self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=application), timeout=30)
+            self.url = 'http://localhost/graphql'
+
+    async def send(self, query, variables):
+        response = await self.client.post(self.url, json={'query': query, 'variables': variables})
+        return response.status_code, response.content
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def use_stand_ins(rate_limit):
+    """Eager Celery, and fakeredis (or the in-memory stores) for Redis"""
+    celery_app.conf.task_always_eager = True
+    RATE_LIMIT_SETTINGS['ENABLED'] = rate_limit
+    try:
+        import fakeredis
+        import redis
+    except ImportError:
+        publisher = outbox.MemoryStreamPublisher()
+        outbox.get_publisher = lambda: publisher
+        return 'in-memory stores'
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server))
+    RATE_LIMIT_SETTINGS['REDIS_URL'] = CHANGE_FEED_SETTINGS['REDIS_URL'] = 'redis://fakeredis'
+    ratelimit._store = None
+    return 'fakeredis'
+
+
+def populate(customers, products, orders):
+    if Product.objects.exists():
+        return
+    Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=Decimal(f"{5 + i % 95}.99"), stock=i % 40) for i in range(products)
+    )
+    Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"customer{i}@example.com", phone='+15550000000') for i in range(customers)
+    )
+    customer_ids = list(Customer.objects.values_list('pk', flat=True))
+    product_ids = list(Product.objects.values_list('pk', flat=True))
+    created = Order.objects.bulk_create(
+        Order(customer_id=customer_ids[i % len(customer_ids)], total_amount=Decimal(f"{10 + i % 190}.00"))
+        for i in range(orders)
+    )
+    Order.products.through.objects.bulk_create(
+        Order.products.through(order_id=order.pk, product_id=product_ids[i % len(product_ids)])
+        for i, order in enumerate(created)
+    )
+    call_command('rebuild_customer_stats', verbosity=0)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted `values`"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(samples, seconds):
+    """Throughput, latency percentiles (ms) and error rate of (latency, ok) samples"""
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        'requests': len(samples),
+        'rps': len(samples) / seconds if seconds else 0.0,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': latencies[-1] if latencies else 0.0,
+        'error_rate': errors / len(samples) if samples else 0.0,
+    }
+
+
+def format_row(label, summary):
+    return (f"  {label:<24} {summary['requests']:>7} {summary['rps']:>8.1f} {summary['p50_ms']:>8.1f} "
+            f"{summary['p95_ms']:>8.1f} {summary['p99_ms']:>8.1f} {summary['error_rate']:>7.2%}")
+
+
+HEADER = f"  {'':<24} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+
+
+class Recorder:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.samples = []  # (finished at, operation, latency, ok)
+
+    def add(self, operation, latency, ok):
+        self.samples.append((time.perf_counter() - self.started, operation, latency, ok))
+
+
+async def virtual_user(target, mix, catalog, recorder, deadline, seed):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        query, variables = OPERATIONS[name](rng, catalog)
+        started = time.perf_counter()
+        try:
+            status, body = await target.send(query, variables)
+            ok = succeeded(status, body)
+        except Exception:
+            ok = False
+        recorder.add(name, time.perf_counter() - started, ok)
+
+
+async def run_jobs(recorder, interval, deadline):
+    """Fire the beat jobs (eagerly, in a thread) every `interval` seconds"""
+    loop = asyncio.get_running_loop()
+    while time.perf_counter() + interval < deadline:
+        await asyncio.sleep(interval)
+        for name, task in JOBS.items():
+            started = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(None, lambda: task.delay().get())
+                ok = result is not None
+            except Exception:
+                ok = False
+            recorder.add(f"job:{name}", time.perf_counter() - started, ok)
+    await loop.run_in_executor(None, connections.close_all)
+
+
+async def report(recorder, interval, deadline):
+    """Print the requests completed in each `interval`-second window"""
+    print(f"  {'window':<24}" + HEADER[26:])
+    for index in range(int((deadline - recorder.started) // interval)):
+        start, end = index * interval, (index + 1) * interval
+        await asyncio.sleep(max(0.0, recorder.started + end - time.perf_counter()))
+        window = [(latency, ok) for at, name, latency, ok in recorder.samples
+                  if start <= at < end and not name.startswith('job:')]
+        print(format_row(f"{start:.0f}-{end:.0f}s", summarize(window, interval)))
+
+
+async def load(target, mix, catalog, args):
+    if catalog is None:
+        catalog = await Catalog.from_server(target)
+    recorder = Recorder()
+    deadline = recorder.started + args.duration
+    users = [virtual_user(target, mix, catalog, recorder, deadline, args.seed + index) for index in range(args.users)]
+    # A running server has its own beat jobs
+    jobs = [] if args.url else [run_jobs(recorder, args.job_interval, deadline)]
+    await asyncio.gather(
+        *users,
+        *jobs,
+        report(recorder, args.interval, deadline),
+    )
+    await target.close()
+    return recorder, time.perf_counter() - recorder.started
+
+
+def results(recorder, elapsed):
+    by_operation = defaultdict(list)
+    for _, name, latency, ok in recorder.samples:
+        by_operation[name].append((latency, ok))
+    requests = [sample for name, samples in by_operation.items() if not name.startswith('job:') for sample in samples]
+    return {
+        'total': summarize(requests, elapsed),
+        'operations': {name: summarize(samples, elapsed) for name, samples in sorted(by_operation.items())},
+    }
+
+
+def check(summary, budget):
+    """Threshold violations of a run, as messages"""
+    failures = []
+    total = summary['total']
+    if total['rps'] < budget['min_rps']:
+        failures.append(f"throughput {total['rps']:.1f} req/s < {budget['min_rps']}")
+    if total['error_rate'] > budget['max_error_rate']:
+        failures.append(f"error rate {total['error_rate']:.2%} > {budget['max_error_rate']:.2%}")
+    for name, limits in budget['operations'].items():
+        measured = summary['operations'].get(name)
+        if measured is None:
+            continue
+        for key, limit in limits.items():
+            if measured[key] > limit:
+                failures.append(f"{name} {key} {measured[key]:.3f} > {limit}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds per progress report')
+    parser.add_argument('--job-interval', type=float, default=10, help='Seconds between beat job runs')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Default: {DEFAULT_MIX}")
+    parser.add_argument('--target', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--url', help='Load a running server instead of the in-process app')
+    parser.add_argument('--database', help='Database URL for in-process targets (default: a throwaway SQLite)')
+    parser.add_argument('--rate-limit', action='store_true', help='Keep RateLimitMiddleware enabled')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--check', action='store_true', help='Fail when a threshold in load_budget.json is broken')
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    if args.url:
+        if args.database:
+            parser.error('--database only applies to in-process targets')
+        target, catalog = HTTPTarget(args.url), None
+        print(f"{args.users} users for {args.duration:.0f}s against {args.url}")
+    else:
+        redis_stand_in = use_stand_ins(args.rate_limit)
+        call_command('migrate', verbosity=0)
+        populate(args.customers, args.products, args.orders)
+        catalog = Catalog.from_database()
+        target = HTTPTarget() if args.target == 'asgi' else WSGITarget(args.users)
+        print(f"{args.users} users for {args.duration:.0f}s against {args.target} "
+              f"({connections['default'].vendor}, eager Celery, {redis_stand_in})")
+    recorder, elapsed = asyncio.run(load(target, args.mix, catalog, args))
+    summary = results(recorder, elapsed)
+
+    print(f"\nWhole run ({elapsed:.1f}s)")
+    print(HEADER)
+    for name, operation in summary['operations'].items():
+        print(format_row(name, operation))
+    print(format_row('total', summary['total']))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(summary, indent=2))
+    if args.check:
+        failures = check(summary, json.loads(BUDGET_FILE.read_text()))
+        for failure in failures:
+            print(f"FAILED: {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Startup-time benchmark for the web, cron and worker entry points.
+
+Each scenario runs in a fresh interpreter under `python -X importtime`; the
+reported time is the sum of all module import times (fastest of --runs),
+which tracks what a process imports before doing any work. Budgets (import
+time and module count) and the modules each scenario must not import are
+in startup_budget.json. The module count does not depend on machine load,
+so it is the stricter of the two.
+
+Run with: python benchmarks/startup.py [--runs 5] [--top 10] [--check]
+--check exits with status 1 when a scenario is over budget or imports a
+forbidden module.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BUDGET_FILE = Path(__file__).resolve().parent / 'startup_budget.json'
+
+SETUP = "import django; django.setup()"
+
+SCENARIOS = {
+    # Every management command, cron script and test run
+    'django_setup': SETUP,
+    # A web process ready to serve (middleware loaded, /graphql resolved)
+    'wsgi': (
+        "from alx_backend_graphql_crm.wsgi import application; "
+        "from django.urls import resolve; resolve('/graphql')"
+    ),
+    # django-crontab importing the low stock job
+    'cron_job': f"{SETUP}; import crm.cron",
+    # cron_jobs/send_order_reminders.py dispatching by task name
+    'cron_dispatch': "from crm.celery import app",
+    # A Celery worker with its tasks registered
+    'worker': (
+        "from celery.app.utils import find_app; app = find_app('crm'); "
+        f"{SETUP}; app.loader.import_default_modules()"
+    ),
+}
+
+
+def measure(code):
+    """Return ({module: (self_us, cumulative_us, depth)}, total import ms) for one run"""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'alx_backend_graphql_crm.settings'}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise SystemExit(f"Scenario failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(own), int(cumulative), depth)
+    return modules, sum(own for own, _, _ in modules.values()) / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help='Show the N slowest top-level imports per scenario')
+    parser.add_argument('--check', action='store_true', help='Fail when over budget')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario', help=f"Default: all of {', '.join(SCENARIOS)}")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    budgets = json.loads(BUDGET_FILE.read_text())
+    failures = []
+    for name in args.scenarios or SCENARIOS:
+        runs = [measure(SCENARIOS[name]) for _ in range(args.runs)]
+        modules = runs[-1][0]
+        total = min(total for _, total in runs)
+        budget = budgets[name]
+        forbidden = sorted(module for module in budget.get('forbid', []) if module in modules)
+
+        status = 'ok'
+        if total > budget['ms'] or len(modules) > budget['modules']:
+            status = 'OVER BUDGET'
+            failures.append(name)
+        if forbidden:
+            status = f"imports {', '.join(forbidden)}"
+            failures.append(name)
+        print(f"{name:<14} {total:7.1f} ms  (budget {budget['ms']}), {len(modules)} modules (budget {budget['modules']})  {status}")
+
+        if args.top:
+            # Top-level imports only: their cumulative times don't overlap
+            top = sorted(
+                ((cumulative, module) for module, (_, cumulative, depth) in modules.items() if depth == 0),
+                reverse=True,
+            )[:args.top]
+            for cumulative, module in top:
+                print(f"    {cumulative / 1000:7.1f} ms  {module}")
+
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
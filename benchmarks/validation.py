@@ -0,0 +1,80 @@
+"""
+Microbenchmark for crm/validation.py over synthetic customer rows.
+
+Compares the previous per-row phone check (re.match with an inline pattern
+per call) with the batch validators, and times full customer-row
+validation without the database lookup.
+
+Run with: python benchmarks/validation.py [--rows 1000000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Setup Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+import django
+django.setup()
+
+from crm.validation import validate_customers, validate_emails, validate_phones
+
+
+def legacy_validate_phone(phone):
+    """The per-row check previously in crm/schema.py"""
+    if not phone:
+        return True, None
+    pattern = r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$'
+    if re.match(pattern, phone):
+        return True, None
+    return False, "Phone must be in format +1234567890 or 123-456-7890"
+
+
+def make_rows(count, seed=42):
+    rng = random.Random(seed)
+    phones = [
+        lambda: f"+{rng.randrange(10 ** 10, 10 ** 13)}",
+        lambda: f"{rng.randrange(100, 999)}-{rng.randrange(100, 999)}-{rng.randrange(1000, 9999)}",
+        lambda: '',
+        lambda: f"({rng.randrange(100, 999)}) 555 {rng.randrange(1000, 9999)}",  # invalid
+    ]
+    return [
+        {
+            'name': f"Customer {index}",
+            'email': f"user{index}@Example.com" if index % 50 else f"user{index}.example.com",
+            'phone': rng.choice(phones)(),
+        }
+        for index in range(count)
+    ]
+
+
+def timed(label, rows, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<34} {elapsed:7.3f}s  {rows / elapsed / 1e6:6.2f}M rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    phones = [row['phone'] for row in rows]
+    emails = [row['email'] for row in rows]
+
+    print(f"{args.rows} rows")
+    timed('legacy per-row phone check', args.rows, lambda: [legacy_validate_phone(p) for p in phones])
+    timed('validate_phones (+ E.164)', args.rows, lambda: validate_phones(phones))
+    timed('validate_emails', args.rows, lambda: validate_emails(emails))
+    timed('validate_customers (no DB)', args.rows, lambda: validate_customers(rows, check_existing=False))
+
+
+if __name__ == '__main__':
+    main()
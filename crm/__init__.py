@@ -1,8 +1,17 @@
 """
 CRM app initialization
 """
-# This will make sure the app is always imported when
-# Django starts so that shared_task will use this app.
-from .celery import app as celery_app
+# The Celery app is imported on first use (`celery -A crm`, crm.tasks or
+# crm.celery_app) rather than here, so web processes and management
+# commands that never touch Celery don't configure it at startup.
+
+
+def __getattr__(name):
+    if name == 'celery_app':
+        from .celery import app
+
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ('celery_app',)
@@ -0,0 +1,96 @@
+"""
+Connection aggregates for CRM application
+The `aggregates` block of allOrders/allProducts/allCustomers is computed
+with one aggregate query over the connection's filtered queryset, before
+pagination, without fetching rows. Orders filtered into the archive
+(CombinedOrders) aggregate the hot and archived querysets and merge them.
+"""
+from decimal import Decimal
+
+from django.db.models import Avg, Count, Max, Min, Sum
+
+from .archive import CombinedOrders
+
+CENT = Decimal('0.01')
+
+FUNCTIONS = {'count': Count, 'sum': Sum, 'avg': Avg, 'min': Min, 'max': Max}
+
+# Aggregate name -> (function, column)
+ORDER_AGGREGATES = {
+    'count': ('count', 'pk'),
+    'sum_total_amount': ('sum', 'total_amount'),
+    'avg_total_amount': ('avg', 'total_amount'),
+    'min_total_amount': ('min', 'total_amount'),
+    'max_total_amount': ('max', 'total_amount'),
+    'min_order_date': ('min', 'order_date'),
+    'max_order_date': ('max', 'order_date'),
+}
+PRODUCT_AGGREGATES = {
+    'count': ('count', 'pk'),
+    # Live stock levels (the queryset is annotated by with_current_stock)
+    'sum_stock': ('sum', 'current_stock'),
+    'min_stock': ('min', 'current_stock'),
+    'max_stock': ('max', 'current_stock'),
+    'avg_price': ('avg', 'price'),
+    'min_price': ('min', 'price'),
+    'max_price': ('max', 'price'),
+}
+CUSTOMER_AGGREGATES = {
+    'count': ('count', 'pk'),
+    'sum_lifetime_value': ('sum', 'stats__lifetime_value'),
+    'avg_lifetime_value': ('avg', 'stats__lifetime_value'),
+    'sum_order_count': ('sum', 'stats__order_count'),
+    'min_created_at': ('min', 'created_at'),
+    'max_created_at': ('max', 'created_at'),
+}
+
+
+def _aggregate(queryset, spec):
+    """Run `spec` as one query; averages come back as (sum, count) pairs"""
+    expressions = {}
+    for name, (function, column) in spec.items():
+        if function == 'avg':
+            expressions[f'{name}__sum'] = Sum(column)
+            expressions[f'{name}__count'] = Count(column)
+        else:
+            expressions[name] = FUNCTIONS[function](column)
+    return queryset.order_by().aggregate(**expressions)
+
+
+def _merge(first, second, spec):
+    merged = {}
+    for name, (function, _) in spec.items():
+        keys = [f'{name}__sum', f'{name}__count'] if function == 'avg' else [name]
+        for key in keys:
+            values = [value for value in (first[key], second[key]) if value is not None]
+            if not values:
+                merged[key] = None
+            elif function == 'min':
+                merged[key] = min(values)
+            elif function == 'max':
+                merged[key] = max(values)
+            else:
+                merged[key] = sum(values)
+    return merged
+
+
+def compute(iterable, spec):
+    """Aggregates of a connection's iterable (a queryset or CombinedOrders)"""
+    if isinstance(iterable, CombinedOrders):
+        totals = _merge(_aggregate(iterable.hot, spec), _aggregate(iterable.archived, spec), spec)
+    else:
+        totals = _aggregate(iterable, spec)
+
+    result = {}
+    for name, (function, _) in spec.items():
+        if function == 'avg':
+            total, count = totals[f'{name}__sum'], totals[f'{name}__count']
+            result[name] = (Decimal(total) / count).quantize(CENT) if count else None
+        elif function in ('count', 'sum'):
+            result[name] = totals[name] or 0
+        else:
+            result[name] = totals[name]
+        if isinstance(result[name], Decimal):
+            # SQLite sums decimals as floats
+            result[name] = result[name].quantize(CENT)
+    return result
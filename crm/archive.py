@@ -0,0 +1,330 @@
+"""
+Order archival for CRM application
+Orders from closed months (older than ARCHIVE_SETTINGS['HOT_MONTHS']) move
+from the Order table into ArchivedOrder / ArchivedOrderItem, and each
+archived month is exported to one compressed file (gzip NDJSON, or Parquet
+when pyarrow is installed). On Postgres the archive table is range-
+partitioned by month, so date-bounded archive reads only scan the matching
+partitions. Queries without a date range only ever read the Order table;
+OrderFilter chains archived rows in when its date range reaches back into
+archived periods (see CombinedOrders).
+
+Run with: python manage.py archive_orders
+"""
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Customer, Order
+from .settings import ARCHIVE_SETTINGS
+from .signals import stats_updates_paused
+
+EXTENSIONS = {
+    'ndjson': 'ndjson.gz',
+    'parquet': 'parquet',
+}
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def archive_cutoff(hot_months=None, now=None):
+    """Start of the oldest month kept in the Order table"""
+    if hot_months is None:
+        hot_months = ARCHIVE_SETTINGS['HOT_MONTHS']
+    now = timezone.localtime(now or timezone.now())
+    return add_months(month_start(now), 1 - hot_months)
+
+
+def archived_until():
+    """order_date of the newest archived order, or None if nothing is archived"""
+    return ArchivedOrder.objects.aggregate(newest=Max('order_date'))['newest']
+
+
+def ensure_partition(start):
+    """Create the monthly archive partition starting at `start` (Postgres only)"""
+    if connection.vendor != 'postgresql':
+        return
+    end = add_months(start, 1)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS crm_order_archive_p{start:%Y_%m} "
+            f"PARTITION OF crm_order_archive "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+
+
+def move_orders(start, end, batch_size=None):
+    """
+    Move orders dated in [start, end) to the archive tables, `batch_size`
+    orders per transaction. CustomerStats are left as they are: archived
+    orders still count towards them. Returns the number of orders moved.
+    """
+    if batch_size is None:
+        batch_size = ARCHIVE_SETTINGS['BATCH_SIZE']
+    through = Order.products.through
+    moved = 0
+    while True:
+        with transaction.atomic(), stats_updates_paused():
+            orders = list(
+                Order.objects.select_for_update()
+                .filter(order_date__gte=start, order_date__lt=end)
+                .order_by('pk')[:batch_size]
+            )
+            if not orders:
+                return moved
+            ids = [order.pk for order in orders]
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(
+                    id=order.pk,
+                    customer_id=order.customer_id,
+                    total_amount=order.total_amount,
+                    order_date=order.order_date,
+                    created_at=order.created_at,
+                    updated_at=order.updated_at,
+                )
+                for order in orders
+            ], ignore_conflicts=True)
+            ArchivedOrderItem.objects.bulk_create([
+                ArchivedOrderItem(order_id=order_id, product_id=product_id)
+                for order_id, product_id in through.objects.filter(order_id__in=ids)
+                .values_list('order_id', 'product_id')
+            ], ignore_conflicts=True)
+            Order.objects.filter(pk__in=ids).delete()
+            moved += len(ids)
+
+
+def _product_ids(order_ids):
+    product_ids = defaultdict(list)
+    for order_id, product_id in (
+        ArchivedOrderItem.objects.filter(order_id__in=order_ids)
+        .order_by('pk')
+        .values_list('order_id', 'product_id')
+    ):
+        product_ids[order_id].append(product_id)
+    return product_ids
+
+
+def _records(start, end, chunk_size=2000):
+    """Yield lists of export records for the archived orders in [start, end)"""
+    rows = (
+        ArchivedOrder.objects.filter(order_date__gte=start, order_date__lt=end)
+        .order_by('order_date', 'pk')
+        .values('id', 'customer_id', 'total_amount', 'order_date', 'created_at', 'updated_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        product_ids = _product_ids([row['id'] for row in chunk])
+        for row in chunk:
+            row['product_ids'] = product_ids[row['id']]
+        yield chunk
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _write_ndjson(path, chunks):
+    with gzip.open(path, 'wt', encoding='utf-8') as handle:
+        for chunk in chunks:
+            handle.writelines(
+                json.dumps(record, default=_json_default, separators=(',', ':')) + '\n'
+                for record in chunk
+            )
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def _write_parquet(path, chunks):
+    pa, pq = _import_pyarrow()
+    timestamp = pa.timestamp('us', tz='UTC')
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('customer_id', pa.int64()),
+        ('total_amount', pa.decimal128(10, 2)),
+        ('order_date', timestamp),
+        ('created_at', timestamp),
+        ('updated_at', timestamp),
+        ('product_ids', pa.list_(pa.int64())),
+    ])
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+
+
+def export_path(start, directory=None, fmt=None):
+    directory = directory or ARCHIVE_SETTINGS['DIR']
+    fmt = fmt or ARCHIVE_SETTINGS['FORMAT']
+    return os.path.join(directory, f"orders-{start:%Y-%m}.{EXTENSIONS[fmt]}")
+
+
+def export_month(start, directory=None, fmt=None):
+    """
+    Write every archived order of the month starting at `start` to its
+    export file, replacing any previous export atomically. Returns the path.
+    """
+    fmt = fmt or ARCHIVE_SETTINGS['FORMAT']
+    path = export_path(start, directory, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    writer = _write_parquet if fmt == 'parquet' else _write_ndjson
+    try:
+        writer(tmp_path, _records(start, add_months(start, 1)))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+def closed_months(cutoff):
+    """Starts of the months from the oldest hot or archived order up to `cutoff`"""
+    hot = Order.objects.filter(order_date__lt=cutoff).aggregate(oldest=Min('order_date'))['oldest']
+    archived = ArchivedOrder.objects.aggregate(oldest=Min('order_date'))['oldest']
+    oldest = [value for value in (hot, archived) if value is not None]
+    if not oldest:
+        return []
+    month = month_start(timezone.localtime(min(oldest)))
+    months = []
+    while month < cutoff:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def archive_orders(cutoff=None, directory=None, fmt=None, batch_size=None):
+    """
+    Archive every month before `cutoff` (default: archive_cutoff()) and
+    export it. Months with nothing new to move are only exported if their
+    file is missing. Yields (month_start, moved, path or None) per month.
+    """
+    cutoff = cutoff or archive_cutoff()
+    if (fmt or ARCHIVE_SETTINGS['FORMAT']) == 'parquet':
+        # Fail before moving anything rather than after the first month
+        _import_pyarrow()
+    for start in closed_months(cutoff):
+        ensure_partition(start)
+        moved = move_orders(start, add_months(start, 1), batch_size)
+        path = export_path(start, directory, fmt)
+        if moved or (
+            not os.path.exists(path)
+            and ArchivedOrder.objects.filter(order_date__gte=start, order_date__lt=add_months(start, 1)).exists()
+        ):
+            yield start, moved, export_month(start, directory, fmt)
+        else:
+            yield start, moved, None
+
+
+def as_orders(archived):
+    """
+    Unsaved Order instances for ArchivedOrder rows, with their customer and
+    `archived_product_ids` attached (OrderType resolves products from them).
+    """
+    archived = list(archived)
+    product_ids = _product_ids([row.id for row in archived])
+    customers = Customer.objects.in_bulk({row.customer_id for row in archived})
+    orders = []
+    for row in archived:
+        order = Order(
+            id=row.id,
+            customer_id=row.customer_id,
+            total_amount=row.total_amount,
+            order_date=row.order_date,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+        )
+        order._state.adding = False
+        if row.customer_id in customers:
+            order.customer = customers[row.customer_id]
+        order.archived_product_ids = product_ids[row.id]
+        orders.append(order)
+    return orders
+
+
+def get_order(pk):
+    """An archived order as an Order instance, or None"""
+    return next(iter(as_orders(ArchivedOrder.objects.filter(pk=pk))), None)
+
+
+class CombinedOrders:
+    """
+    Read-only sequence of hot Orders followed by archived ones (or the
+    archived ones first with `oldest_first`), for connection pagination.
+    Both querysets are ordered by date in the same direction and every
+    archived order predates the Order table, so a slice reads one table and
+    then the other without merging. Counts are computed once and shared
+    between slices.
+    """
+
+    def __init__(self, hot, archived, start=0, stop=None, counts=None, oldest_first=False):
+        self.hot = hot
+        self.archived = archived
+        self.start = start
+        self.stop = stop
+        self.oldest_first = oldest_first
+        self._counts = counts if counts is not None else {}
+
+    def _count(self, name):
+        if name not in self._counts:
+            self._counts[name] = getattr(self, name).count()
+        return self._counts[name]
+
+    def __len__(self):
+        total = self._count('hot') + self._count('archived')
+        stop = total if self.stop is None else min(self.stop, total)
+        return max(0, stop - min(self.start, total))
+
+    count = __len__
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError("CombinedOrders does not support slice steps")
+            start, stop, _ = key.indices(len(self))
+            return CombinedOrders(
+                self.hot, self.archived, self.start + start, self.start + max(start, stop), self._counts,
+                self.oldest_first,
+            )
+        index = range(len(self))[key]
+        return next(iter(self[index:index + 1]))
+
+    def __iter__(self):
+        parts = [('hot', lambda rows: rows), ('archived', as_orders)]
+        if self.oldest_first:
+            parts.reverse()
+        (first, read_first), (second, read_second) = parts
+        first_count = self._count(first)
+        start, stop = self.start, self.start + len(self)
+        if start < first_count:
+            yield from read_first(getattr(self, first)[start:min(stop, first_count)])
+        if stop > first_count:
+            yield from read_second(getattr(self, second)[max(start - first_count, 0):stop - first_count])
@@ -0,0 +1,162 @@
+"""
+Product catalogue cache for CRM application
+Product names and prices are read far more often than they change, so
+CreateOrder and the `products` of orders read them through a bounded,
+process-local LRU of compact records (see crm/projection.py) instead of
+querying Product each time. Every Product update or delete bumps the
+shared `product_catalog` CacheVersion; a reader checks the version once
+per request (see Loader.products) and a process whose cache is older
+starts over, so a changed price is never served after its transaction
+commits. Stock is not cached: it lives in the stock ledger.
+"""
+import threading
+from collections import OrderedDict
+
+from django.db.models import F
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+from .models import CacheVersion, Product
+from .projection import record_class
+from .settings import GRAPHQL_SETTINGS
+
+VERSION_NAME = 'product_catalog'
+
+# Product fields kept in the cache (ProductType fields except stock)
+FIELDS = ('id', 'name', 'price', 'created_at', 'updated_at')
+
+
+def current_version():
+    return CacheVersion.objects.filter(name=VERSION_NAME).values_list('version', flat=True).first() or 0
+
+
+def bump_version():
+    """Invalidate every process's product cache; call in the transaction changing the product"""
+    if not CacheVersion.objects.filter(name=VERSION_NAME).update(version=F('version') + 1):
+        CacheVersion.objects.get_or_create(name=VERSION_NAME, defaults={'version': 1})
+
+
+class ProductCache:
+    """LRU of product records by id, valid for one catalogue version"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.version = None
+        self.hits = self.misses = self.invalidations = 0
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sync(self, version):
+        """Drop every record when the catalogue has moved past `version`"""
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self.invalidations += 1
+                self._records.clear()
+                self.version = version
+
+    def get_many(self, ids):
+        """{id: record} for the existing products among `ids`, loading misses in one query"""
+        ids = set(ids)
+        found = {}
+        with self._lock:
+            for pk in ids:
+                record = self._records.get(pk)
+                if record is not None:
+                    self._records.move_to_end(pk)
+                    found[pk] = record
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+            version = self.version
+        missing = ids - found.keys()
+        if not missing:
+            return found
+
+        record = record_class(Product, FIELDS)
+        loaded = {row[0]: record._make(row) for row in Product.objects.filter(pk__in=missing).values_list(*FIELDS)}
+        found.update(loaded)
+        with self._lock:
+            if self.version == version:
+                # Not stored when a sync cleared the cache meanwhile: the rows may predate it
+                self._records.update(loaded)
+                while len(self._records) > self.max_size:
+                    self._records.popitem(last=False)
+        return found
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._records),
+            'max_size': self.max_size,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self.version = None
+            self.hits = self.misses = self.invalidations = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process's product cache, or None when PRODUCT_CACHE_SIZE is 0"""
+    global _cache
+    if _cache is None and GRAPHQL_SETTINGS['PRODUCT_CACHE_SIZE']:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ProductCache(GRAPHQL_SETTINGS['PRODUCT_CACHE_SIZE'])
+    return _cache
+
+
+def sync():
+    cache = get_cache()
+    if cache is not None:
+        cache.sync(current_version())
+
+
+def get_products(ids):
+    """{id: product record} for `ids`; call sync() first once per request"""
+    cache = get_cache()
+    if cache is None:
+        record = record_class(Product, FIELDS)
+        return {row[0]: record._make(row) for row in Product.objects.filter(pk__in=set(ids)).values_list(*FIELDS)}
+    return cache.get_many(ids)
+
+
+def stats():
+    """Hit-rate metrics of the process's product cache (None when disabled)"""
+    cache = get_cache()
+    return cache.stats() if cache is not None else None
+
+
+def _selects(selection_set, fragments, names, visiting=frozenset()):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            if selection.name.value in names:
+                return True
+            if selection.selection_set and _selects(selection.selection_set, fragments, names, visiting):
+                return True
+        elif isinstance(selection, InlineFragmentNode):
+            if _selects(selection.selection_set, fragments, names, visiting):
+                return True
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            if name in fragments and name not in visiting:
+                if _selects(fragments[name].selection_set, fragments, names, visiting | {name}):
+                    return True
+    return False
+
+
+def servable(info):
+    """Whether the product field being resolved only selects cached fields (no stock)"""
+    return not any(
+        node.selection_set is not None and _selects(node.selection_set, info.fragments, {'stock'})
+        for node in info.field_nodes
+    )
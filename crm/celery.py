@@ -3,6 +3,8 @@ Celery configuration for CRM application
 """
 import os
 from celery import Celery
+from celery.signals import celeryd_init, task_postrun, task_prerun
+from django.db import close_old_connections
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
@@ -18,11 +20,40 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
-# Celery configuration
-app.conf.broker_url = 'redis://localhost:6379/0'
-app.conf.result_backend = 'redis://localhost:6379/0'
-app.conf.task_serializer = 'json'
-app.conf.accept_content = ['json']
-app.conf.result_serializer = 'json'
-app.conf.timezone = 'UTC'
-app.conf.enable_utc = True
+
+# Worker profiles from WORKER_PROFILES in crm/settings.py:
+#     CRM_WORKER_PROFILE=reports celery -A crm worker -n reports@%h
+# Explicit -Q/-c/--prefetch-multiplier options take precedence. Concurrency
+# and prefetch must be in the config before the worker parses its options.
+WORKER_PROFILE = os.environ.get('CRM_WORKER_PROFILE')
+
+if WORKER_PROFILE:
+    from .settings import WORKER_PROFILES
+
+    # Namespaced keys, so they override the CELERY_* Django settings
+    app.conf.update(
+        CELERY_WORKER_CONCURRENCY=WORKER_PROFILES[WORKER_PROFILE]['concurrency'],
+        CELERY_WORKER_PREFETCH_MULTIPLIER=WORKER_PROFILES[WORKER_PROFILE]['prefetch_multiplier'],
+    )
+
+
+@celeryd_init.connect
+def select_profile_queues(sender=None, instance=None, options=None, **kwargs):
+    """Consume only the worker profile's queues unless -Q was given"""
+    if WORKER_PROFILE and not (options or {}).get('queues'):
+        from .settings import WORKER_PROFILES
+
+        instance.app.amqp.queues.select(WORKER_PROFILES[WORKER_PROFILE]['queues'])
+
+
+# Database connections in workers follow CONN_MAX_AGE/CONN_HEALTH_CHECKS
+# around each task, as Django does around each request. Celery's Django
+# fixup would otherwise close them before and after every task; with
+# CELERY_DB_REUSE_MAX set it only does so when a worker process starts and
+# every 2 * CELERY_DB_REUSE_MAX tasks.
+@task_prerun.connect
+@task_postrun.connect
+def close_stale_db_connections(sender=None, **kwargs):
+    # Eager tasks run inside the caller's request or transaction
+    if not getattr(sender.request, 'is_eager', False):
+        close_old_connections()
@@ -0,0 +1,116 @@
+"""
+Connection counts for CRM application
+With GRAPHQL_SETTINGS['APPROXIMATE_COUNTS'] on, forward-paginated filter
+connections no longer run COUNT(*) for every page: a page fetches one extra
+row to know whether there is a next page, and `totalCount` is only counted
+when it is selected. It is then the planner's row estimate on Postgres
+(when above EXACT_COUNT_THRESHOLD), or a COUNT(*) cached for
+COUNT_CACHE_TTL seconds per filtered query; `isExact` tells clients which.
+"""
+import hashlib
+import json
+from functools import partial
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models.query import QuerySet
+from graphene.relay.connection import connection_adapter, page_info_adapter
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql_relay import connection_from_array_slice, get_offset_with_default
+
+from .loaders import get_loader
+from .settings import GRAPHQL_SETTINGS
+
+CACHE_PREFIX = 'crm:count:'
+
+
+def cache_key(queryset):
+    """Cache key for the count of a filtered queryset (its SQL and parameters)"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.sha256(f"{queryset.db}|{sql}|{params!r}".encode()).hexdigest()
+    return CACHE_PREFIX + digest
+
+
+def planner_estimate(queryset):
+    """Rows the Postgres planner expects `queryset` to return"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def approximate_count(queryset):
+    """Return (count, is_exact) for `queryset`"""
+    key = cache_key(queryset)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, False
+    if connections[queryset.db].vendor == 'postgresql':
+        estimate = planner_estimate(queryset)
+        if estimate >= GRAPHQL_SETTINGS['EXACT_COUNT_THRESHOLD']:
+            return estimate, False
+    count = queryset.count()
+    cache.set(key, count, GRAPHQL_SETTINGS['COUNT_CACHE_TTL'])
+    return count, True
+
+
+def total_count(connection):
+    """Return (totalCount, isExact) for a resolved connection"""
+    if getattr(connection, 'length', None) is not None:
+        return connection.length, getattr(connection, 'length_is_exact', True)
+    connection.length, connection.length_is_exact = approximate_count(connection.iterable)
+    return connection.length, connection.length_is_exact
+
+
+class ApproximateCountConnectionField(DjangoFilterConnectionField):
+    """
+    DjangoFilterConnectionField that pages forward without counting the
+    filtered queryset (see the module docstring). Backward pagination,
+    offsets and non-queryset results are counted exactly, as before. The
+    nodes of a page prime the request's loader (see crm/loaders.py).
+    """
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver, max_limit,
+                            enforce_first_or_last, root, info, **args):
+        resolved = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver, max_limit,
+            enforce_first_or_last, root, info, **args
+        )
+        edges = getattr(resolved, 'edges', None)
+        if edges is not None:
+            get_loader(info.context).prime_related(edge.node for edge in edges)
+        return resolved
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        iterable = maybe_queryset(iterable)
+        first = args.get('first') or max_limit
+        if (not GRAPHQL_SETTINGS['APPROXIMATE_COUNTS'] or not isinstance(iterable, QuerySet) or not first
+                or any(args.get(name) is not None for name in ('last', 'before', 'offset'))):
+            return super().resolve_connection(connection, args, iterable, max_limit)
+
+        slice_start = get_offset_with_default(args.get('after'), -1) + 1
+        # One extra row tells whether there is a next page
+        rows = list(iterable[slice_start:slice_start + first + 1])
+        resolved = connection_from_array_slice(
+            rows,
+            {**args, 'first': first},
+            slice_start=slice_start,
+            array_length=slice_start + len(rows),
+            array_slice_length=len(rows),
+            connection_type=partial(connection_adapter, connection),
+            edge_type=connection.Edge,
+            page_info_type=page_info_adapter,
+        )
+        resolved.iterable = iterable
+        if len(rows) <= first:
+            # Last page: the total is known
+            resolved.length, resolved.length_is_exact = slice_start + len(rows), True
+        else:
+            resolved.length = None
+        return resolved
@@ -12,41 +12,35 @@ if [ -d "venv" ]; then
     source venv/bin/activate 2>/dev/null || source venv/Scripts/activate 2>/dev/null
 fi
 
-# Execute Python command to delete inactive customers
-python manage.py shell << 'EOF'
+# Archive inactive customers (a soft delete: nothing cascades here); the
+# purge_archived_customers task deletes them and their orders in throttled
+# batches once CUSTOMER_RETENTION_DAYS have passed
+# (--no-imports: skip the shell's automatic import of every model)
+python manage.py shell --no-imports << 'EOF'
 import os
 import django
-from datetime import datetime, timedelta
+from datetime import timedelta
 from django.utils import timezone
-from django.db.models import Q, Max
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 django.setup()
 
-from crm.models import Customer, Order
+from crm.joblog import job_log
+from crm.retention import archive_customers, inactive_customers
 
 # Calculate date one year ago
 one_year_ago = timezone.now() - timedelta(days=365)
 
-# Find customers with no orders since a year ago
 # Customers who either have no orders at all, or their most recent order was more than a year ago
-customers_to_delete = Customer.objects.annotate(
-    last_order_date=Max('orders__order_date')
-).filter(
-    Q(orders__isnull=True) | Q(last_order_date__lt=one_year_ago)
-).distinct()
+# (read from the CustomerStats rollup instead of aggregating over every order)
+with job_log('customer_cleanup') as log:
+    count = archive_customers(inactive_customers(days=365))
 
-# Count before deletion
-count = customers_to_delete.count()
+    # Log the result
+    log.info(
+        f"Archived {count} inactive customer(s) with no orders since {one_year_ago.strftime('%Y-%m-%d')}",
+        archived=count,
+    )
 
-# Delete the customers
-customers_to_delete.delete()
-
-# Log the result
-log_message = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Deleted {count} inactive customer(s) with no orders since {one_year_ago.strftime('%Y-%m-%d')}\n"
-
-with open('/tmp/customer_cleanup_log.txt', 'a') as f:
-    f.write(log_message)
-
-print(f"Deleted {count} inactive customer(s)")
+print(f"Archived {count} inactive customer(s)")
 EOF
@@ -0,0 +1,91 @@
+"""
+JSON encoding for CRM GraphQL responses
+Uses orjson when it is installed (pip install orjson) and the standard
+library otherwise; both write Decimal as a string and dates/datetimes in
+ISO 8601. iter_dumps encodes long lists a slice at a time, so a large
+response can be streamed without holding the whole document in memory.
+"""
+import datetime
+import json
+import uuid
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Bytes collected before iter_dumps yields a chunk
+STREAM_CHUNK_SIZE = 64 * 1024
+# List items encoded per call when streaming a long list
+STREAM_SLICE_ITEMS = 200
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _PRETTY = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+
+    def dumps(value, pretty=False):
+        """Encode `value` as UTF-8 JSON bytes"""
+        return orjson.dumps(value, default=_default, option=_PRETTY if pretty else 0)
+else:
+    def dumps(value, pretty=False):
+        """Encode `value` as UTF-8 JSON bytes"""
+        if pretty:
+            text = json.dumps(value, default=_default, sort_keys=True, indent=2, separators=(',', ': '))
+        else:
+            text = json.dumps(value, default=_default, ensure_ascii=False, separators=(',', ':'))
+        return text.encode('utf-8')
+
+
+def largest_list(value):
+    """Length of the longest list reachable from `value` through objects"""
+    if isinstance(value, dict):
+        return max((largest_list(item) for item in value.values()), default=0)
+    if isinstance(value, list):
+        return len(value)
+    return 0
+
+
+def _pieces(value, min_items):
+    if isinstance(value, list) and len(value) >= min_items:
+        # Items are encoded a slice at a time, without their brackets
+        yield b'['
+        for start in range(0, len(value), STREAM_SLICE_ITEMS):
+            yield (b',' if start else b'') + dumps(value[start:start + STREAM_SLICE_ITEMS])[1:-1]
+        yield b']'
+    elif isinstance(value, dict) and largest_list(value) >= min_items:
+        yield b'{'
+        for index, (key, item) in enumerate(value.items()):
+            yield (b',' if index else b'') + dumps(key) + b':'
+            yield from _pieces(item, min_items)
+        yield b'}'
+    else:
+        yield dumps(value)
+
+
+def iter_dumps(value, min_items=1000, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encode `value` as JSON in chunks of about `chunk_size` bytes. Lists of
+    at least `min_items` items reachable through objects (such as a
+    connection's edges) are encoded a slice of items at a time; everything
+    else is encoded in one call.
+    """
+    buffer, size = [], 0
+    for piece in _pieces(value, min_items):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
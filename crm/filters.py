@@ -1,5 +1,6 @@
 import django_filters
-from .models import Customer, Product, Order
+from .archive import CombinedOrders, archived_until
+from .models import ArchivedOrder, ArchivedOrderItem, Customer, Product, Order
 
 
 class CustomerFilter(django_filters.FilterSet):
@@ -8,6 +9,22 @@ class CustomerFilter(django_filters.FilterSet):
     created_at__gte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_at__lte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+    # Order rollup filters (served from CustomerStats, no aggregation over Order)
+    order_count__gte = django_filters.NumberFilter(field_name='stats__order_count', lookup_expr='gte')
+    order_count__lte = django_filters.NumberFilter(field_name='stats__order_count', lookup_expr='lte')
+    lifetime_value__gte = django_filters.NumberFilter(field_name='stats__lifetime_value', lookup_expr='gte')
+    lifetime_value__lte = django_filters.NumberFilter(field_name='stats__lifetime_value', lookup_expr='lte')
+    last_order_date__gte = django_filters.DateTimeFilter(field_name='stats__last_order_date', lookup_expr='gte')
+    last_order_date__lte = django_filters.DateTimeFilter(field_name='stats__last_order_date', lookup_expr='lte')
+    order_by = django_filters.OrderingFilter(
+        fields=(
+            ('name', 'name'),
+            ('created_at', 'created_at'),
+            ('stats__order_count', 'order_count'),
+            ('stats__lifetime_value', 'lifetime_value'),
+            ('stats__last_order_date', 'last_order_date'),
+        )
+    )
 
     class Meta:
         model = Customer
@@ -22,19 +39,25 @@ class ProductFilter(django_filters.FilterSet):
     name_icontains = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
     price__gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     price__lte = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
-    stock__gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
-    stock__lte = django_filters.NumberFilter(field_name='stock', lookup_expr='lte')
-    stock = django_filters.NumberFilter(field_name='stock', lookup_expr='exact')
+    # Stock filters match the live ledger level (Product.objects.with_current_stock())
+    stock__gte = django_filters.NumberFilter(method='filter_current_stock', lookup_expr='gte')
+    stock__lte = django_filters.NumberFilter(method='filter_current_stock', lookup_expr='lte')
+    stock = django_filters.NumberFilter(method='filter_current_stock', lookup_expr='exact')
     low_stock = django_filters.BooleanFilter(method='filter_low_stock')
 
     class Meta:
         model = Product
         fields = ['name', 'price', 'stock']
 
+    def filter_current_stock(self, queryset, name, value):
+        """Compare the live stock level (snapshot plus unfolded movements)"""
+        lookup_expr = self.filters[name].lookup_expr
+        return queryset.with_current_stock().filter(**{f'current_stock__{lookup_expr}': value})
+
     def filter_low_stock(self, queryset, name, value):
         """Filter products with low stock (e.g., stock < 10)"""
         if value:
-            return queryset.filter(stock__lt=10)
+            return queryset.with_current_stock().filter(current_stock__lt=10)
         return queryset
 
 
@@ -46,7 +69,77 @@ class OrderFilter(django_filters.FilterSet):
     customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
     product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains')
     product_id = django_filters.NumberFilter(field_name='products__id', lookup_expr='exact')
+    order_by = django_filters.OrderingFilter(
+        fields=(
+            ('order_date', 'order_date'),
+            ('total_amount', 'total_amount'),
+            ('created_at', 'created_at'),
+        )
+    )
 
     class Meta:
         model = Order
         fields = ['total_amount', 'order_date', 'customer', 'products']
+
+    # Filters applied unchanged to ArchivedOrder
+    ARCHIVE_LOOKUPS = [
+        'total_amount', 'total_amount__gte', 'total_amount__lte',
+        'order_date', 'order_date__gte', 'order_date__lte',
+    ]
+    # orderBy values CombinedOrders can serve: {ordering: oldest first}
+    ARCHIVE_ORDERINGS = {(): False, ('-order_date',): False, ('order_date',): True}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        archived = self.filter_archive()
+        if archived is None:
+            return queryset
+        ordering = tuple(self.form.cleaned_data.get('order_by') or ())
+        if ordering not in self.ARCHIVE_ORDERINGS:
+            raise Exception(
+                f"orderBy '{','.join(ordering)}' is not supported when the order date range reaches "
+                f"archived orders (archived until {archived_until():%Y-%m-%d}): use 'order_date' or '-order_date'"
+            )
+        if self.ARCHIVE_ORDERINGS[ordering]:
+            return CombinedOrders(
+                queryset.order_by('order_date', 'pk'), archived.order_by('order_date', 'pk'), oldest_first=True
+            )
+        return CombinedOrders(queryset.order_by('-order_date', '-pk'), archived)
+
+    def filter_archive(self):
+        """
+        Archived orders matching the filters, or None when the date range does
+        not reach back into archived periods. Queries without a date range
+        never touch the archive.
+        """
+        data = self.form.cleaned_data
+        date_from = data.get('order_date__gte') or data.get('order_date')
+        date_to = data.get('order_date__lte') or data.get('order_date')
+        if date_from is None and date_to is None:
+            return None
+        newest = archived_until()
+        if newest is None or (date_from is not None and date_from > newest):
+            return None
+
+        archived = ArchivedOrder.objects.filter(
+            customer_id__in=Customer.all_objects.values('pk'),
+            **{name: data[name] for name in self.ARCHIVE_LOOKUPS if data.get(name) is not None}
+        )
+        if data.get('customer'):
+            archived = archived.filter(customer_id=data['customer'].pk)
+        if data.get('customer_name'):
+            archived = archived.filter(
+                customer_id__in=Customer.all_objects.filter(name__icontains=data['customer_name']).values('pk')
+            )
+        product_filters = []
+        if data.get('products'):
+            product_filters.append([product.pk for product in data['products']])
+        if data.get('product_id') is not None:
+            product_filters.append([int(data['product_id'])])
+        if data.get('product_name'):
+            product_filters.append(Product.objects.filter(name__icontains=data['product_name']).values('pk'))
+        for product_ids in product_filters:
+            archived = archived.filter(
+                pk__in=ArchivedOrderItem.objects.filter(product_id__in=product_ids).values('order_id')
+            )
+        return archived.order_by('-order_date', '-pk')
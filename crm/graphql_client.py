@@ -0,0 +1,127 @@
+"""
+Shared GraphQL client for CRM cron jobs and Celery tasks
+
+Instead of building a new transport (and TCP connection) per run, each
+process keeps one connected gql session backed by a pooled requests
+session with timeouts and retries. Only queries are retried after a
+request may have reached the server: a mutation is retried solely on
+connection errors, so a retry can never apply it twice. gql and requests
+are imported on first use, so importing this module is cheap.
+
+Usage:
+    from crm.graphql_client import execute
+    result = execute(gql("query { hello }"))
+"""
+import os
+import threading
+import time
+
+from .settings import GRAPHQL_ENDPOINT, GRAPHQL_SETTINGS
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def _retry_policy():
+    """Transport-level retries: connection errors only, where nothing was sent"""
+    from urllib3.util.retry import Retry
+
+    return Retry(
+        total=GRAPHQL_SETTINGS['CLIENT_RETRIES'],
+        connect=GRAPHQL_SETTINGS['CLIENT_RETRIES'],
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=GRAPHQL_SETTINGS['CLIENT_BACKOFF_FACTOR'],
+    )
+
+
+def is_mutation(request):
+    """Whether a gql request (or document) contains a mutation"""
+    from graphql import OperationDefinitionNode, OperationType
+
+    document = getattr(request, 'document', request)
+    return any(
+        isinstance(definition, OperationDefinitionNode) and definition.operation == OperationType.MUTATION
+        for definition in document.definitions
+    )
+
+
+def _retryable(error, attempt):
+    code = getattr(error, 'code', None)
+    return attempt < GRAPHQL_SETTINGS['CLIENT_RETRIES'] and (code is None or code in RETRY_STATUS_CODES)
+
+
+def _backoff(attempt):
+    return GRAPHQL_SETTINGS['CLIENT_BACKOFF_FACTOR'] * (2 ** attempt)
+
+
+def get_session():
+    """
+    Return this process's connected GraphQL session, creating it on first
+    use. Forked Celery worker children get their own session (and sockets).
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _lock:
+        if _session is None or _session_pid != pid:
+            from gql import Client
+            from gql.transport.requests import RequestsHTTPTransport
+            from requests.adapters import HTTPAdapter
+
+            transport = RequestsHTTPTransport(
+                url=GRAPHQL_ENDPOINT,
+                timeout=GRAPHQL_SETTINGS['CLIENT_TIMEOUT'],
+            )
+            client = Client(transport=transport, fetch_schema_from_transport=False)
+            session = client.connect_sync()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=GRAPHQL_SETTINGS['CLIENT_POOL_SIZE'],
+                max_retries=_retry_policy(),
+            )
+            for prefix in ('http://', 'https://'):
+                transport.session.mount(prefix, adapter)
+            _session = session
+            _session_pid = pid
+    return _session
+
+
+def close_session():
+    """Close this process's session (e.g. on worker shutdown)"""
+    global _session, _session_pid
+    with _lock:
+        if _session is not None and _session_pid == os.getpid():
+            _session.client.close_sync()
+        _session = None
+        _session_pid = None
+
+
+def execute(query, **kwargs):
+    """
+    Execute a gql query over the shared pooled session. Queries are retried
+    on network errors and 429/5xx responses with exponential backoff;
+    mutations are not (the session still retries failed connects).
+    """
+    session = get_session()
+    if is_mutation(query):
+        return session.execute(query, **kwargs)
+
+    import requests
+    from gql.transport.exceptions import TransportServerError
+
+    attempt = 0
+    while True:
+        try:
+            return session.execute(query, **kwargs)
+        except (requests.ConnectionError, requests.Timeout, TransportServerError) as e:
+            if not _retryable(e, attempt):
+                raise
+            time.sleep(_backoff(attempt))
+            attempt += 1
+
@@ -0,0 +1,119 @@
+"""
+Health checks for CRM application
+Readiness checks for the database, Celery broker, migrations, Celery
+workers and the beat heartbeat, with a process-local result cache so
+/readyz answers from memory.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from .settings import HEALTH_SETTINGS
+
+
+def check_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def _broker_connection():
+    from .celery import app
+
+    # Fail fast instead of kombu's default reconnect loop
+    return app.connection_for_write(connect_timeout=HEALTH_SETTINGS['CHECK_TIMEOUT'])
+
+
+def check_broker():
+    with _broker_connection() as conn:
+        conn.ensure_connection(max_retries=0)
+
+
+def check_migrations():
+    # Only /readyz needs the migration loader; keep it out of startup
+    from django.db.migrations.executor import MigrationExecutor
+
+    executor = MigrationExecutor(connection)
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    if plan:
+        raise Exception(f"{len(plan)} unapplied migration(s)")
+
+
+def check_celery_workers():
+    from .celery import app
+
+    with _broker_connection() as conn:
+        conn.ensure_connection(max_retries=0)
+        replies = app.control.ping(timeout=HEALTH_SETTINGS['CHECK_TIMEOUT'], connection=conn)
+    if not replies:
+        raise Exception("No Celery workers replied to ping")
+
+
+def check_heartbeat():
+    """Fail when the record_heartbeat task has not run within HEARTBEAT_MAX_AGE seconds"""
+    from .models import HealthCheckSample
+
+    latest = HealthCheckSample.objects.order_by('-created_at').values_list('created_at', flat=True).first()
+    if latest is None:
+        raise Exception("No heartbeat recorded")
+    age = timezone.now() - latest
+    if age > timedelta(seconds=HEALTH_SETTINGS['HEARTBEAT_MAX_AGE']):
+        raise Exception(f"Last heartbeat {int(age.total_seconds())}s ago")
+
+
+CHECKS = {
+    'database': check_database,
+    'broker': check_broker,
+    'migrations': check_migrations,
+    'celery': check_celery_workers,
+    'heartbeat': check_heartbeat,
+}
+
+
+def run_checks(names=None):
+    """
+    Run the named readiness checks (default: HEALTH_SETTINGS['CHECKS']) and
+    return {name: {'ok', 'latency_ms', 'error'}}.
+    """
+    results = {}
+    for name in names or HEALTH_SETTINGS['CHECKS']:
+        started = time.perf_counter()
+        try:
+            CHECKS[name]()
+            ok, error = True, ''
+        except Exception as e:
+            ok, error = False, str(e)
+        results[name] = {
+            'ok': ok,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+            'error': error,
+        }
+    return results
+
+
+_cache_lock = threading.Lock()
+_cached = {'at': None, 'results': None}
+
+
+def cached_checks():
+    """
+    Return readiness results no older than HEALTH_SETTINGS['CACHE_TTL']
+    seconds. One caller refreshes an expired entry while concurrent callers
+    keep getting the previous result.
+    """
+    now = time.monotonic()
+    at, results = _cached['at'], _cached['results']
+    if results is not None and now - at < HEALTH_SETTINGS['CACHE_TTL']:
+        return results
+    if not _cache_lock.acquire(blocking=results is None):
+        return results
+    try:
+        if _cached['results'] is None or time.monotonic() - _cached['at'] >= HEALTH_SETTINGS['CACHE_TTL']:
+            _cached['results'] = run_checks()
+            _cached['at'] = time.monotonic()
+        return _cached['results']
+    finally:
+        _cache_lock.release()
@@ -0,0 +1,150 @@
+"""
+Job logging for CRM cron jobs and Celery tasks
+
+Records are buffered in memory for the duration of a job and written as
+JSON lines in a single append when the job finishes. Writes and size-based
+rotation happen under an exclusive lock on a sidecar ``.lock`` file, so
+concurrent cron processes and Celery worker processes never interleave or
+rotate underneath each other.
+
+Usage:
+    with job_log('heartbeat') as log:
+        log.info("CRM is alive")
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to unlocked appends
+    fcntl = None
+
+from .settings import CRON_SETTINGS
+
+# Job name -> CRON_SETTINGS key holding its log path
+LOG_FILE_SETTINGS = {
+    'heartbeat': 'HEARTBEAT_LOG_FILE',
+    'customer_cleanup': 'CUSTOMER_CLEANUP_LOG_FILE',
+    'order_reminders': 'ORDER_REMINDERS_LOG_FILE',
+    'low_stock_updates': 'LOW_STOCK_UPDATES_LOG_FILE',
+    'crm_report': 'CRM_REPORT_LOG_FILE',
+    'sales_rollups': 'SALES_ROLLUPS_LOG_FILE',
+    'stock_compaction': 'STOCK_COMPACTION_LOG_FILE',
+    'change_relay': 'CHANGE_RELAY_LOG_FILE',
+}
+
+
+def log_path(job):
+    """Return the configured log file for a job"""
+    return CRON_SETTINGS[LOG_FILE_SETTINGS[job]]
+
+
+class JobLogger:
+    """Buffers structured records for one job run and flushes them at once"""
+
+    def __init__(self, job, path=None, max_bytes=None, backup_count=None):
+        self.job = job
+        self.path = path or log_path(job)
+        self.max_bytes = max_bytes if max_bytes is not None else CRON_SETTINGS['LOG_MAX_BYTES']
+        self.backup_count = (
+            backup_count if backup_count is not None else CRON_SETTINGS['LOG_BACKUP_COUNT']
+        )
+        self.records = []
+        self.started = time.monotonic()
+
+    def log(self, level, message, **fields):
+        record = {
+            'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'job': self.job,
+            'level': level,
+            'message': message,
+            'elapsed_ms': round((time.monotonic() - self.started) * 1000, 3),
+        }
+        record.update(fields)
+        self.records.append(record)
+
+    def info(self, message, **fields):
+        self.log('info', message, **fields)
+
+    def warning(self, message, **fields):
+        self.log('warning', message, **fields)
+
+    def error(self, message, **fields):
+        self.log('error', message, **fields)
+
+    def finish(self, status='ok', **fields):
+        """Append the closing record carrying the total job duration"""
+        self.log(
+            'error' if status == 'error' else 'info',
+            'job finished',
+            status=status,
+            duration_ms=round((time.monotonic() - self.started) * 1000, 3),
+            **fields,
+        )
+
+    def flush(self):
+        """Write all buffered records in one append and clear the buffer"""
+        if not self.records:
+            return
+        data = ''.join(
+            json.dumps(record, default=str, separators=(',', ':')) + '\n'
+            for record in self.records
+        ).encode('utf-8')
+        self.records = []
+        with _locked(self.path):
+            self._rotate_if_needed(len(data))
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+
+    def _rotate_if_needed(self, incoming):
+        if not self.max_bytes or self.backup_count < 1:
+            return
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size + incoming <= self.max_bytes:
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+@contextmanager
+def _locked(path):
+    """Hold an exclusive lock on `path`.lock for the duration of the block"""
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(f"{path}.lock", os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+@contextmanager
+def job_log(job, **kwargs):
+    """
+    Collect records for one job run; on exit append a closing record with
+    the duration (status 'error' if the block raised) and flush once.
+    """
+    logger = JobLogger(job, **kwargs)
+    try:
+        yield logger
+    except BaseException as e:
+        logger.finish(status='error', error=str(e))
+        logger.flush()
+        raise
+    logger.finish()
+    logger.flush()
@@ -0,0 +1,106 @@
+"""
+Request-scoped lookups for CRM application
+Resolvers fetch single customers, products and orders through a loader
+stored on the request (the GraphQL context), so repeated lookups of the
+same row within a request, or across the operations of a batched request,
+hit the database once. List resolvers prime the loader with the foreign
+keys of the rows they return (prime_related()), and a lookup fetches every
+pending row of its kind with one in_bulk(), so `orders { customer }` reads
+the customers in one query rather than one per customer. Mutations clear
+the loader (see crm/views.py).
+"""
+from . import archive, catalog
+from .models import ArchivedOrder, Customer, Order, Product
+
+# Loader name -> queryset the rows are fetched from
+QUERYSETS = {
+    # Archived customers included: their orders still resolve their customer
+    'customer': lambda: Customer.all_objects.select_related('stats'),
+    'product': lambda: Product.objects.with_current_stock(),
+    'order': lambda: Order.objects.all(),
+}
+
+# Model -> (loader name, foreign key attribute) pairs primed for its rows
+RELATIONS = {
+    Order: [('customer', 'customer_id')],
+}
+
+
+class Loader:
+    def __init__(self):
+        self._cache = {}
+        self._pending = {}
+        self._catalog_synced = False
+
+    def prime(self, name, pks):
+        """Queue `pks` so the next load(name, ...) fetches them in the same query"""
+        pending = self._pending.setdefault(name, set())
+        pending.update(str(pk) for pk in pks if pk is not None and (name, str(pk)) not in self._cache)
+
+    def prime_related(self, rows):
+        """Prime the RELATIONS foreign keys of model instances `rows`"""
+        rows = [row for row in rows if type(row) in RELATIONS]
+        for model in {type(row) for row in rows}:
+            for name, attname in RELATIONS[model]:
+                self.prime(name, [getattr(row, attname) for row in rows if type(row) is model])
+
+    def load(self, name, pk):
+        """The row `pk` from QUERYSETS[name], or None when it doesn't exist"""
+        key = (name, str(pk))
+        if key not in self._cache:
+            pks = self._pending.pop(name, set()) | {str(pk)}
+            self._fetch(name, [pk for pk in pks if (name, pk) not in self._cache])
+        return self._cache[key]
+
+    def _fetch(self, name, pks):
+        """Cache the rows `pks` of QUERYSETS[name] (None for missing ones)"""
+        valid = [int(pk) for pk in pks if pk.isdigit()]
+        rows = QUERYSETS[name]().in_bulk(valid) if valid else {}
+        if name == 'order':
+            # Falls back to the order archive
+            missing = [pk for pk in valid if pk not in rows]
+            if missing:
+                archived = archive.as_orders(ArchivedOrder.objects.filter(pk__in=missing))
+                rows.update((order.pk, order) for order in archived)
+        for pk in pks:
+            self._cache[(name, pk)] = rows.get(int(pk)) if pk.isdigit() else None
+
+    def customer(self, pk):
+        return self.load('customer', pk)
+
+    def product(self, pk):
+        return self.load('product', pk)
+
+    def order(self, pk):
+        return self.load('order', pk)
+
+    def products(self, pks):
+        """
+        {id: record} of product names and prices from the process-wide
+        product cache, checked against the catalogue version once per loader
+        """
+        if not self._catalog_synced:
+            catalog.sync()
+            self._catalog_synced = True
+        return catalog.get_products(pks)
+
+    def clear(self):
+        self._cache.clear()
+        self._pending.clear()
+        self._catalog_synced = False
+
+
+def get_loader(context):
+    """The loader for a GraphQL context (a fresh one when there's no request)"""
+    if context is None:
+        return Loader()
+    loader = getattr(context, 'crm_loader', None)
+    if loader is None:
+        loader = context.crm_loader = Loader()
+    return loader
+
+
+def clear_loader(context):
+    loader = getattr(context, 'crm_loader', None)
+    if loader is not None:
+        loader.clear()
@@ -0,0 +1,51 @@
+"""
+Move orders from closed months out of the Order table and export them.
+Run with: python manage.py archive_orders [--hot-months 12] [--format parquet]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import archive
+from crm.settings import ARCHIVE_SETTINGS
+
+
+class Command(BaseCommand):
+    help = 'Archive orders older than the hot period and export each archived month'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hot-months', type=int, default=ARCHIVE_SETTINGS['HOT_MONTHS'],
+            help='Months kept in the Order table, including the current one '
+                 f"(default: {ARCHIVE_SETTINGS['HOT_MONTHS']})",
+        )
+        parser.add_argument(
+            '--dir', default=ARCHIVE_SETTINGS['DIR'],
+            help=f"Export directory (default: {ARCHIVE_SETTINGS['DIR']})",
+        )
+        parser.add_argument(
+            '--format', choices=sorted(archive.EXTENSIONS), default=ARCHIVE_SETTINGS['FORMAT'],
+            help=f"Export format (default: {ARCHIVE_SETTINGS['FORMAT']})",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=ARCHIVE_SETTINGS['BATCH_SIZE'],
+            help=f"Orders moved per transaction (default: {ARCHIVE_SETTINGS['BATCH_SIZE']})",
+        )
+
+    def handle(self, *args, **options):
+        if options['hot_months'] < 1:
+            raise CommandError('--hot-months must be at least 1')
+        cutoff = archive.archive_cutoff(options['hot_months'])
+        total = 0
+        try:
+            for start, moved, path in archive.archive_orders(
+                cutoff, options['dir'], options['format'], options['batch_size']
+            ):
+                total += moved
+                if moved or path:
+                    self.stdout.write(
+                        f"{start:%Y-%m}: archived {moved} order(s)" + (f" -> {path}" if path else '')
+                    )
+        except ImportError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total} order(s) dated before {cutoff:%Y-%m-%d}"
+        ))
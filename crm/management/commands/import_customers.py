@@ -0,0 +1,70 @@
+"""
+Import customers from a CSV file with name, email and phone columns.
+Run with: python manage.py import_customers customers.csv [--dry-run]
+"""
+import csv
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from crm import outbox
+from crm.models import Customer, CustomerStats
+from crm.validation import validate_customers
+
+
+class Command(BaseCommand):
+    help = 'Validate and bulk-insert customers from a CSV file (columns: name, email, phone)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows validated and inserted per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Validate only; report errors without inserting anything',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            handle = open(options['path'], newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        imported = rejected = 0
+        with handle:
+            reader = csv.DictReader(handle)
+            missing = {'name', 'email'} - set(reader.fieldnames or [])
+            if missing:
+                raise CommandError(f"Missing column(s): {', '.join(sorted(missing))}")
+
+            line = 1  # header
+            while True:
+                rows = list(islice(reader, options['batch_size']))
+                if not rows:
+                    break
+                customers, errors = validate_customers(rows)
+                for index in sorted(errors):
+                    for message in errors[index]:
+                        self.stderr.write(f"Line {line + index + 1}: {message}")
+                valid = [Customer(**customer) for customer in customers if customer is not None]
+                if valid and not options['dry_run']:
+                    with transaction.atomic():
+                        created = Customer.objects.bulk_create(valid)
+                        # bulk_create skips the post_save signal that creates stats rows
+                        CustomerStats.objects.bulk_create(
+                            [CustomerStats(customer=customer) for customer in created],
+                            ignore_conflicts=True,
+                        )
+                        # ...and the one that records change events
+                        outbox.record_many(created)
+                imported += len(valid)
+                rejected += len(errors)
+                line += len(rows)
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {imported} customer(s), rejected {rejected} row(s)"
+        ))
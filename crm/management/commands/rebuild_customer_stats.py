@@ -0,0 +1,22 @@
+"""
+Rebuild the CustomerStats rollup from the Order and archived order tables.
+Run with: python manage.py rebuild_customer_stats
+"""
+from django.core.management.base import BaseCommand
+
+from crm.models import CustomerStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute order count, lifetime value and last order date for every customer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of customers recomputed per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        total = CustomerStats.objects.rebuild(batch_size=options['batch_size'])
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {total} customer(s)"))
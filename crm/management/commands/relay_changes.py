@@ -0,0 +1,32 @@
+"""
+Publish the change outbox to the Redis stream (see crm/outbox.py).
+Run with: python manage.py relay_changes [--once] [--interval 1.0]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import outbox
+
+
+class Command(BaseCommand):
+    help = 'Relay change events to the Redis stream, continuously or once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Publish pending events and exit')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds to wait when no events are pending (default: 1.0)',
+        )
+
+    def handle(self, *args, **options):
+        publisher = outbox.get_publisher()
+        if publisher is None:
+            raise CommandError("CHANGE_FEED_SETTINGS['REDIS_URL'] is not set")
+        if options['once']:
+            published = outbox.relay(publisher)
+            self.stdout.write(self.style.SUCCESS(f"Published {published} change event(s)"))
+            return
+        self.stdout.write(f"Relaying change events to {outbox.CHANGE_FEED_SETTINGS['STREAM']}")
+        try:
+            outbox.run_relay(publisher, options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,172 @@
+"""
+Middleware for CRM application
+"""
+import json
+import math
+import time
+
+from django.http import JsonResponse
+from graphql import GraphQLError, OperationType
+
+from . import catalog, ratelimit
+from .health import cached_checks
+from .routers import replica_reads, replicas
+from .settings import DB_ROUTING_SETTINGS, RATE_LIMIT_SETTINGS
+
+
+def graphql_operations(request):
+    """
+    Return [(query, operationName, variables)] for a GraphQL request
+    payload. Raises ValueError when the payload cannot be read.
+    """
+    if request.method == 'GET':
+        payloads = [request.GET]
+    elif request.content_type == 'application/graphql':
+        return [(request.body.decode('utf-8'), None, {})]
+    elif request.content_type == 'application/json':
+        payload = json.loads(request.body.decode('utf-8') or '{}')
+        payloads = payload if isinstance(payload, list) else [payload]
+    else:
+        payloads = [request.POST]
+    operations = []
+    for item in payloads:
+        variables = item.get('variables') or {}
+        if isinstance(variables, str):
+            variables = json.loads(variables)
+        if not isinstance(variables, dict):
+            raise ValueError('variables must be an object')
+        operations.append((item.get('query') or '', item.get('operationName'), variables))
+    return operations
+
+
+class HealthCheckMiddleware:
+    """
+    Answer /healthz (liveness) and /readyz (readiness) before the rest of
+    the middleware stack runs, so probes skip sessions, auth, URL resolution
+    and the ALLOWED_HOSTS check (probes usually address the pod by IP).
+    Must be listed first in MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == '/healthz':
+            return JsonResponse({'status': 'ok', 'product_cache': catalog.stats()})
+        if request.path == '/readyz':
+            checks = cached_checks()
+            ready = all(result['ok'] for result in checks.values())
+            return JsonResponse(
+                {'status': 'ok' if ready else 'unavailable', 'checks': checks},
+                status=200 if ready else 503,
+            )
+        return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route GraphQL `query` operations to the read replicas and `mutation`
+    operations (and everything else) to the primary. After a mutation the
+    client gets a short-lived cookie that pins its reads to the primary,
+    so it reads its own writes despite replication lag.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path != DB_ROUTING_SETTINGS['GRAPHQL_PATH'] or not replicas():
+            return self.get_response(request)
+
+        cookie = DB_ROUTING_SETTINGS['STICKY_COOKIE']
+        mutation = self._is_mutation(request)
+        sticky = self._sticky_until(request.COOKIES.get(cookie)) > time.time()
+
+        with replica_reads(not mutation and not sticky):
+            response = self.get_response(request)
+
+        if mutation:
+            seconds = DB_ROUTING_SETTINGS['STICKY_PRIMARY_SECONDS']
+            response.set_cookie(
+                cookie, str(time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+    @staticmethod
+    def _sticky_until(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _is_mutation(self, request):
+        """True unless every operation in the request is a query"""
+        try:
+            operations = graphql_operations(request)
+        except (ValueError, AttributeError):
+            # Unreadable payload: let the view report it, from the primary
+            return True
+        return any(self._operation_type(query, name) != OperationType.QUERY
+                   for query, name, _ in operations)
+
+    @staticmethod
+    def _operation_type(query, operation_name):
+        if 'mutation' not in query and 'subscription' not in query:
+            # Fast path: no keyword, so only query operations are possible
+            return OperationType.QUERY
+        try:
+            document = ratelimit.parse_query(query)
+        except GraphQLError:
+            return None
+        operation = ratelimit.select_operation(document, operation_name)
+        return operation.operation if operation else None
+
+
+class RateLimitMiddleware:
+    """
+    Charge each GraphQL request its query complexity against the client's
+    token bucket (see crm/ratelimit.py). Requests over the limit get a 429
+    with a GraphQL error and a Retry-After header, before any resolver or
+    database work happens.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (not RATE_LIMIT_SETTINGS['ENABLED']
+                or request.path != DB_ROUTING_SETTINGS['GRAPHQL_PATH']
+                or request.method not in ('GET', 'POST')):
+            return self.get_response(request)
+        try:
+            operations = graphql_operations(request)
+        except (ValueError, AttributeError):
+            return self.get_response(request)
+
+        cost = sum(ratelimit.query_complexity(query, variables, name) for query, name, variables in operations)
+        retry_after = ratelimit.consume(ratelimit.client_key(request), cost)
+        if retry_after is None:
+            return self.get_response(request)
+        return self._limited(cost, retry_after)
+
+    @staticmethod
+    def _limited(cost, retry_after):
+        if retry_after == math.inf:
+            message = (
+                f"Query complexity {cost} exceeds the limit of {RATE_LIMIT_SETTINGS['CAPACITY']}; "
+                "request smaller pages with first/last"
+            )
+            return JsonResponse(
+                {'errors': [{'message': message, 'extensions': {'code': 'QUERY_TOO_COMPLEX', 'cost': cost}}]},
+                status=400,
+            )
+        seconds = math.ceil(retry_after)
+        response = JsonResponse(
+            {'errors': [{
+                'message': f"Rate limit exceeded, retry in {seconds} second(s)",
+                'extensions': {'code': 'RATE_LIMITED', 'cost': cost, 'retryAfter': round(retry_after, 3)},
+            }]},
+            status=429,
+        )
+        response['Retry-After'] = str(seconds)
+        return response
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:23
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_customer_stats(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    CustomerStats = apps.get_model('crm', 'CustomerStats')
+    customers = Customer.objects.annotate(
+        num_orders=models.Count('orders'),
+        total=models.Sum('orders__total_amount'),
+        last=models.Max('orders__order_date'),
+    ).values_list('pk', 'num_orders', 'total', 'last').iterator()
+    batch = []
+    for pk, num_orders, total, last in customers:
+        batch.append(CustomerStats(
+            customer_id=pk,
+            order_count=num_orders,
+            lifetime_value=total or Decimal('0.00'),
+            last_order_date=last,
+        ))
+        if len(batch) >= 1000:
+            CustomerStats.objects.bulk_create(batch)
+            batch = []
+    CustomerStats.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='crm.customer')),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('lifetime_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('last_order_date', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'customer stats',
+                'indexes': [models.Index(fields=['last_order_date'], name='crm_custome_last_or_c49c9a_idx'), models.Index(fields=['lifetime_value'], name='crm_custome_lifetim_da8459_idx'), models.Index(fields=['order_count'], name='crm_custome_order_c_8e1bc5_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_customer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_orderreminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthCheckSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('ok', models.BooleanField()),
+                ('latency_ms', models.FloatField()),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['name', 'created_at'], name='crm_healthc_name_26bcc5_idx'), models.Index(fields=['created_at'], name='crm_healthc_created_71a222_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:10
+
+from django.db import migrations, models
+
+
+def partition_order_archive(apps, schema_editor):
+    """
+    On Postgres, recreate crm_order_archive as a table range-partitioned on
+    order_date. Monthly partitions are added by crm.archive as periods are
+    archived; the default partition catches anything outside them.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP TABLE crm_order_archive')
+    schema_editor.execute(
+        'CREATE TABLE crm_order_archive ('
+        ' id bigint NOT NULL,'
+        ' customer_id bigint NOT NULL,'
+        ' total_amount numeric(10, 2) NOT NULL,'
+        ' order_date timestamp with time zone NOT NULL,'
+        ' created_at timestamp with time zone NOT NULL,'
+        ' updated_at timestamp with time zone NOT NULL,'
+        ' archived_at timestamp with time zone NOT NULL,'
+        ' PRIMARY KEY (id, order_date)'
+        ') PARTITION BY RANGE (order_date)'
+    )
+    schema_editor.execute('CREATE INDEX crm_orderarchive_date_idx ON crm_order_archive (order_date)')
+    schema_editor.execute('CREATE INDEX crm_orderarchive_cust_idx ON crm_order_archive (customer_id)')
+    schema_editor.execute('CREATE TABLE crm_order_archive_default PARTITION OF crm_order_archive DEFAULT')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_stockmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('customer_id', models.BigIntegerField()),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order_date', models.DateTimeField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'crm_order_archive',
+                'ordering': ['-order_date'],
+                'indexes': [models.Index(fields=['order_date'], name='crm_orderarchive_date_idx'), models.Index(fields=['customer_id'], name='crm_orderarchive_cust_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField()),
+                ('product_id', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'crm_order_archive_item',
+                'indexes': [models.Index(fields=['product_id'], name='crm_orderarchive_prod_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order_id', 'product_id'), name='crm_orderarchive_item_uniq')],
+            },
+        ),
+        migrations.RunPython(partition_order_archive, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_archivedorder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('max_order_id', models.BigIntegerField()),
+                ('customers', models.PositiveIntegerField(blank=True, null=True)),
+                ('orders', models.PositiveIntegerField(blank=True, null=True)),
+                ('revenue', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReportChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField()),
+                ('orders', models.PositiveIntegerField(blank=True, null=True)),
+                ('revenue', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='crm.reportrun')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('run', 'first_id'), name='crm_reportchunk_run_first_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:40
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_reportrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('entity', models.CharField(max_length=20)),
+                ('entity_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated')], max_length=20)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'crm_change_event',
+                'ordering': ['id'],
+                'indexes': [
+                    models.Index(fields=['created_at'], name='crm_changeevent_created_idx'),
+                    models.Index(condition=models.Q(('published_at__isnull', True)), fields=['id'], name='crm_changeevent_unpub_idx'),
+                ],
+            },
+        ),
+    ]
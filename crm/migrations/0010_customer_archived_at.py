@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:25
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_changeevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='email',
+            field=models.EmailField(max_length=254, validators=[django.core.validators.EmailValidator()]),
+        ),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(condition=models.Q(('archived_at__isnull', True)), fields=('email',), name='crm_customer_active_email_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('archived_at__isnull', True)), fields=['created_at'], name='crm_customer_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('archived_at__isnull', False)), fields=['archived_at'], name='crm_customer_archived_idx'),
+        ),
+        migrations.AlterField(
+            model_name='changeevent',
+            name='action',
+            field=models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('archived', 'Archived')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:10
+
+from django.db import migrations, models
+
+
+def create_product_catalog_version(apps, schema_editor):
+    CacheVersion = apps.get_model('crm', 'CacheVersion')
+    CacheVersion.objects.get_or_create(name='product_catalog')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0010_customer_archived_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_product_catalog_version, migrations.RunPython.noop),
+    ]
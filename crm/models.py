@@ -1,29 +1,92 @@
-from django.db import models
+from django.db import models, IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import EmailValidator, RegexValidator
 from decimal import Decimal
 
 
+class CustomerQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(archived_at__isnull=True)
+
+    def archived(self):
+        return self.filter(archived_at__isnull=False)
+
+
+class ActiveCustomerManager(models.Manager.from_queryset(CustomerQuerySet)):
+    """Customers that have not been archived (see crm/retention.py)"""
+
+    def get_queryset(self):
+        return super().get_queryset().active()
+
+
 class Customer(models.Model):
     name = models.CharField(max_length=100)
-    email = models.EmailField(unique=True, validators=[EmailValidator()])
+    # Unique among active customers (see Meta.constraints), so an archived
+    # customer's email can sign up again
+    email = models.EmailField(validators=[EmailValidator()])
     phone = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Soft delete: archived customers are hidden from `objects` and purged
+    # with their orders after CRON_SETTINGS['CUSTOMER_RETENTION_DAYS']
+    archived_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ActiveCustomerManager()
+    all_objects = CustomerQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.name} ({self.email})"
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['email'], condition=Q(archived_at__isnull=True), name='crm_customer_active_email_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['created_at'], condition=Q(archived_at__isnull=True), name='crm_customer_active_idx'
+            ),
+            models.Index(
+                fields=['archived_at'], condition=Q(archived_at__isnull=False), name='crm_customer_archived_idx'
+            ),
+        ]
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_current_stock(self):
+        """
+        Annotate `current_stock`: the stock snapshot plus every StockMovement
+        not yet folded into it by compaction.
+        """
+        if 'current_stock' in self.query.annotations:
+            return self
+        unfolded = (
+            StockMovement.objects.filter(product=OuterRef('pk'), folded=False)
+            .order_by()
+            .values('product')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        return self.annotate(
+            current_stock=F('stock') + Coalesce(Subquery(unfolded, output_field=IntegerField()), 0)
+        )
 
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Snapshot as of the last ledger compaction; the live level is
+    # Product.objects.with_current_stock() (see crm/stock.py)
     stock = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} - ${self.price}"
 
@@ -44,3 +107,378 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-order_date']
+        indexes = [
+            models.Index(fields=['order_date']),
+        ]
+
+
+class StockMovement(models.Model):
+    """
+    Append-only stock ledger. Writers insert signed movements instead of
+    updating Product.stock; compaction periodically adds unfolded movements
+    to the product snapshot and flags them as folded.
+    """
+    RESERVATION = 'reservation'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (RESERVATION, 'Order reservation'),
+        (RESTOCK, 'Restock'),
+        (ADJUSTMENT, 'Adjustment'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    quantity = models.IntegerField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    order = models.ForeignKey(
+        Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements'
+    )
+    folded = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity:+d} x product #{self.product_id}"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', 'created_at']),
+            models.Index(
+                fields=['product'], condition=Q(folded=False), name='crm_stockmove_unfolded_idx'
+            ),
+        ]
+
+
+class CustomerStatsManager(models.Manager):
+    """Incremental maintenance of the CustomerStats rollup."""
+
+    def ensure(self, customer_id):
+        """Create an empty stats row for a customer if it does not exist yet"""
+        try:
+            with transaction.atomic():
+                self.get_or_create(customer_id=customer_id)
+        except IntegrityError:
+            # Created concurrently by another writer
+            pass
+
+    def record_order(self, order):
+        """Fold a newly created order into its customer's stats"""
+        updated = self.filter(customer_id=order.customer_id).update(
+            order_count=F('order_count') + 1,
+            lifetime_value=F('lifetime_value') + order.total_amount,
+            last_order_date=Greatest(
+                Coalesce('last_order_date', Value(order.order_date)),
+                Value(order.order_date),
+            ),
+        )
+        if not updated:
+            # Customer predates the rollup table; compute from scratch
+            self.refresh([order.customer_id])
+
+    def forget_order(self, order):
+        """Remove a deleted order from its customer's stats"""
+        latest = Order.objects.filter(
+            customer_id=order.customer_id
+        ).order_by('-order_date').values('order_date')[:1]
+        latest_archived = ArchivedOrder.objects.filter(
+            customer_id=order.customer_id
+        ).order_by('-order_date').values('order_date')[:1]
+        self.filter(customer_id=order.customer_id).update(
+            order_count=F('order_count') - 1,
+            lifetime_value=F('lifetime_value') - order.total_amount,
+            last_order_date=Coalesce(Subquery(latest), Subquery(latest_archived)),
+        )
+
+    def refresh(self, customer_ids):
+        """Recompute stats for the given customers from the Order and archive tables"""
+        totals = {}
+        for model in (Order, ArchivedOrder):
+            for row in (
+                model.objects.filter(customer_id__in=customer_ids)
+                .order_by()
+                .values('customer_id')
+                .annotate(
+                    order_count=Count('id'),
+                    lifetime_value=Sum('total_amount'),
+                    last_order_date=Max('order_date'),
+                )
+            ):
+                total = totals.setdefault(row['customer_id'], {
+                    'order_count': 0, 'lifetime_value': Decimal('0.00'), 'last_order_date': None,
+                })
+                total['order_count'] += row['order_count']
+                total['lifetime_value'] += row['lifetime_value'] or Decimal('0.00')
+                if total['last_order_date'] is None or row['last_order_date'] > total['last_order_date']:
+                    total['last_order_date'] = row['last_order_date']
+        # Archived customers keep their stats until they are purged
+        existing = Customer.all_objects.filter(pk__in=customer_ids).values_list('pk', flat=True)
+        rows = []
+        for customer_id in existing:
+            row = totals.get(customer_id, {})
+            rows.append(self.model(
+                customer_id=customer_id,
+                order_count=row.get('order_count', 0),
+                lifetime_value=row.get('lifetime_value') or Decimal('0.00'),
+                last_order_date=row.get('last_order_date'),
+            ))
+        self.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['customer'],
+            update_fields=['order_count', 'lifetime_value', 'last_order_date', 'updated_at'],
+        )
+
+    def rebuild(self, batch_size=1000):
+        """Recompute stats for every customer, batch by batch. Returns the count."""
+        total = 0
+        last_pk = 0
+        while True:
+            ids = list(
+                Customer.all_objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+            with transaction.atomic():
+                self.refresh(ids)
+            total += len(ids)
+            last_pk = ids[-1]
+
+
+class CustomerStats(models.Model):
+    """
+    Per-customer order rollup, maintained incrementally by the Order signals
+    in crm/signals.py so reads never have to aggregate over Order.
+    Rebuild with: python manage.py rebuild_customer_stats
+    """
+    customer = models.OneToOneField(
+        Customer, on_delete=models.CASCADE, primary_key=True, related_name='stats'
+    )
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_value = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    last_order_date = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CustomerStatsManager()
+
+    def __str__(self):
+        return f"Stats for customer #{self.customer_id}: {self.order_count} orders, ${self.lifetime_value}"
+
+    class Meta:
+        verbose_name_plural = 'customer stats'
+        indexes = [
+            models.Index(fields=['last_order_date']),
+            models.Index(fields=['lifetime_value']),
+            models.Index(fields=['order_count']),
+        ]
+
+
+class DailyRevenue(models.Model):
+    """Revenue and order count per calendar day, maintained by crm.rollups"""
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    order_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.date}: {self.order_count} orders, ${self.revenue}"
+
+    class Meta:
+        ordering = ['date']
+
+
+class DailyProductSales(models.Model):
+    """Units sold per product per calendar day, maintained by crm.rollups"""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.date}: {self.units} x product #{self.product_id}"
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_daily_product_sales'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Highest Order id already folded into a rollup"""
+    name = models.CharField(max_length=100, unique=True)
+    last_order_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ order #{self.last_order_id}"
+
+
+class CacheVersion(models.Model):
+    """
+    Named version counter shared by every process. Bumped when the cached
+    data changes; process-local caches clear themselves when it moves (see
+    crm/catalog.py).
+    """
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class OrderReminder(models.Model):
+    """
+    Idempotency record for order reminders: one row per order per reminder
+    run date, so a retried batch skips orders it has already reminded.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reminders')
+    reminder_date = models.DateField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reminder for order #{self.order_id} on {self.reminder_date}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'reminder_date'], name='unique_order_reminder_per_day'),
+        ]
+
+
+class HealthCheckSample(models.Model):
+    """Latency history of readiness checks, recorded by the heartbeat task"""
+    name = models.CharField(max_length=50)
+    ok = models.BooleanField()
+    latency_ms = models.FloatField()
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} {'ok' if self.ok else 'failed'} in {self.latency_ms}ms"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['name', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    """
+    Order from a closed period, moved out of the Order table by
+    `manage.py archive_orders` (see crm/archive.py). Keeps the original
+    order id. On Postgres the table is range-partitioned by month on
+    order_date; elsewhere it is a plain table.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer_id = models.BigIntegerField()
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    order_date = models.DateTimeField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived order #{self.id} - ${self.total_amount}"
+
+    class Meta:
+        db_table = 'crm_order_archive'
+        ordering = ['-order_date']
+        indexes = [
+            models.Index(fields=['order_date'], name='crm_orderarchive_date_idx'),
+            models.Index(fields=['customer_id'], name='crm_orderarchive_cust_idx'),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    """Product lines of an ArchivedOrder (the archived Order.products rows)"""
+    order_id = models.BigIntegerField()
+    product_id = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'crm_order_archive_item'
+        constraints = [
+            models.UniqueConstraint(fields=['order_id', 'product_id'], name='crm_orderarchive_item_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['product_id'], name='crm_orderarchive_prod_idx'),
+        ]
+
+
+class ReportRun(models.Model):
+    """
+    Checkpoint of one CRM report run (see crm/reports.py). A retried run with
+    the same key resumes from its computed chunks; `finished_at` marks the
+    report as written.
+    """
+    key = models.CharField(max_length=50, unique=True)
+    max_order_id = models.BigIntegerField()
+    customers = models.PositiveIntegerField(null=True, blank=True)
+    orders = models.PositiveIntegerField(null=True, blank=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Report {self.key} ({'finished' if self.finished_at else 'in progress'})"
+
+
+class ReportChunk(models.Model):
+    """Partial order aggregates of a ReportRun for the id range [first_id, last_id]"""
+    run = models.ForeignKey(ReportRun, on_delete=models.CASCADE, related_name='chunks')
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    orders = models.PositiveIntegerField(null=True, blank=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Report {self.run_id} orders #{self.first_id}-#{self.last_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'first_id'], name='crm_reportchunk_run_first_uniq'),
+        ]
+
+
+class ChangeEvent(models.Model):
+    """
+    Transactional outbox: one row per Customer, Product or Order change,
+    written in the same transaction as the change (see crm/outbox.py).
+    The id is the change feed cursor; `published_at` is set once the relay
+    has pushed the event to the Redis stream.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    ARCHIVED = 'archived'
+    DELETED = 'deleted'
+    ACTION_CHOICES = [
+        (CREATED, 'Created'),
+        (UPDATED, 'Updated'),
+        (ARCHIVED, 'Archived'),
+        (DELETED, 'Deleted'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    entity = models.CharField(max_length=20)
+    entity_id = models.BigIntegerField()
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.entity} #{self.entity_id} {self.action}"
+
+    class Meta:
+        db_table = 'crm_change_event'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['created_at'], name='crm_changeevent_created_idx'),
+            models.Index(
+                fields=['id'], condition=Q(published_at__isnull=True), name='crm_changeevent_unpub_idx'
+            ),
+        ]
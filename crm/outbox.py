@@ -0,0 +1,237 @@
+"""
+Change feed for CRM application
+Mutations record a ChangeEvent for every Customer, Product and Order they
+create or update, in the same transaction as the change, so the outbox
+never disagrees with the tables. Consumers sync incrementally either by
+paging the `changesSince(cursor, limit)` query, or by reading the Redis
+stream that relay() publishes the outbox to. Stock reserved by an order
+is not a separate product event: the order event lists its product ids.
+
+Event ids are allocated when the event is inserted, not when it commits,
+so both readers leave out events younger than SETTLE_SECONDS: a
+transaction that commits a lower id after a consumer's cursor has moved
+past it would otherwise lose that event for good. This only holds while
+every writer commits within SETTLE_SECONDS of recording its events, so
+events are recorded as the last statement of their transaction, including
+the batch jobs (import_customers, archive_customers, the purge).
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import encoding
+from .models import ChangeEvent, Customer, Order, Product
+from .settings import CHANGE_FEED_SETTINGS
+
+CUSTOMER = 'customer'
+PRODUCT = 'product'
+ORDER = 'order'
+
+
+def customer_payload(customer):
+    return {
+        'id': customer.pk,
+        'name': customer.name,
+        'email': customer.email,
+        'phone': customer.phone,
+        'created_at': customer.created_at,
+        'updated_at': customer.updated_at,
+        'archived_at': customer.archived_at,
+    }
+
+
+def product_payload(product):
+    return {
+        'id': product.pk,
+        'name': product.name,
+        'price': product.price,
+        # The live level when the product carries the ledger annotation
+        'stock': getattr(product, 'current_stock', product.stock),
+        'created_at': product.created_at,
+        'updated_at': product.updated_at,
+    }
+
+
+def order_payload(order, product_ids=None):
+    if product_ids is None:
+        product_ids = list(order.products.values_list('pk', flat=True))
+    return {
+        'id': order.pk,
+        'customer_id': order.customer_id,
+        'product_ids': sorted(product_ids),
+        'total_amount': order.total_amount,
+        'order_date': order.order_date,
+        'created_at': order.created_at,
+        'updated_at': order.updated_at,
+    }
+
+
+def _event(instance, action, **extra):
+    if isinstance(instance, Customer):
+        entity, payload = CUSTOMER, customer_payload(instance)
+    elif isinstance(instance, Product):
+        entity, payload = PRODUCT, product_payload(instance)
+    elif isinstance(instance, Order):
+        entity, payload = ORDER, order_payload(instance, **extra)
+    else:
+        raise TypeError(f"No change events for {type(instance).__name__}")
+    return ChangeEvent(entity=entity, entity_id=instance.pk, action=action, payload=payload)
+
+
+def record(instance, action=ChangeEvent.CREATED, **extra):
+    """
+    Record a change of `instance`; call inside the transaction that made
+    it, as its last statement (see the module docstring)
+    """
+    event = _event(instance, action, **extra)
+    event.save()
+    return event
+
+
+def record_many(instances, action=ChangeEvent.CREATED, product_ids=None):
+    """
+    Record changes of several instances with one insert. Orders read their
+    products from `product_ids` ({order id: product ids}) when it is given.
+    """
+    ChangeEvent.objects.bulk_create([
+        _event(instance, action, product_ids=product_ids.get(instance.pk, []))
+        if product_ids is not None and isinstance(instance, Order) else _event(instance, action)
+        for instance in instances
+    ])
+
+
+def decode_cursor(cursor):
+    """The event id a changesSince cursor points after (None/'' is the start)"""
+    if not cursor:
+        return 0
+    try:
+        value = int(cursor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if value < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return value
+
+
+def _settled():
+    # Events created before this are committed, or their transaction failed,
+    # so no lower id can appear behind a cursor handed out now; provided
+    # their writer committed within SETTLE_SECONDS (see the module docstring)
+    return timezone.now() - timedelta(seconds=CHANGE_FEED_SETTINGS['SETTLE_SECONDS'])
+
+
+def changes_since(cursor=None, limit=None):
+    """
+    Up to `limit` events after `cursor`, oldest first. Returns (events,
+    next cursor, has_more); the next cursor is `cursor` itself when there
+    is nothing new.
+    """
+    after = decode_cursor(cursor)
+    limit = min(limit or CHANGE_FEED_SETTINGS['DEFAULT_LIMIT'], CHANGE_FEED_SETTINGS['MAX_LIMIT'])
+    events = list(ChangeEvent.objects.filter(pk__gt=after, created_at__lte=_settled()).order_by('pk')[:limit + 1])
+    has_more = len(events) > limit
+    events = events[:limit]
+    return events, str(events[-1].pk if events else after), has_more
+
+
+def stream_fields(event):
+    """A ChangeEvent as the field/value pairs of its stream entry"""
+    return {
+        'cursor': str(event.pk),
+        'entity': event.entity,
+        'entity_id': str(event.entity_id),
+        'action': event.action,
+        'payload': encoding.dumps(event.payload),
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+class MemoryStreamPublisher:
+    """Stream entries kept in process memory (tests and development)"""
+
+    def __init__(self):
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def publish(self, events):
+        with self._lock:
+            self.entries.extend(stream_fields(event) for event in events)
+
+
+class RedisStreamPublisher:
+    """Stream entries appended to a Redis stream with XADD, one pipeline per batch"""
+
+    def __init__(self, url, stream, maxlen):
+        import redis
+
+        self.stream = stream
+        self.maxlen = maxlen
+        self.client = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5)
+
+    def publish(self, events):
+        pipeline = self.client.pipeline(transaction=False)
+        for event in events:
+            pipeline.xadd(self.stream, stream_fields(event), maxlen=self.maxlen, approximate=True)
+        pipeline.execute()
+
+
+def get_publisher():
+    """The configured Redis stream publisher, or None without a REDIS_URL"""
+    url = CHANGE_FEED_SETTINGS['REDIS_URL']
+    if not url:
+        return None
+    return RedisStreamPublisher(url, CHANGE_FEED_SETTINGS['STREAM'], CHANGE_FEED_SETTINGS['STREAM_MAXLEN'])
+
+
+def relay(publisher, batch_size=None):
+    """
+    Publish unpublished events in id order, one batch per transaction, and
+    mark them published. Like changesSince, unsettled events wait for the
+    next run so the stream stays in id order. The batch is row-locked, so concurrent relays
+    take turns instead of publishing out of order. Delivery is at least
+    once: a batch whose transaction fails after publishing is published
+    again, and consumers skip cursors they have seen. Returns the number
+    of events published.
+    """
+    batch_size = batch_size or CHANGE_FEED_SETTINGS['RELAY_BATCH_SIZE']
+    published = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                ChangeEvent.objects.select_for_update()
+                .filter(published_at__isnull=True, created_at__lte=_settled())
+                .order_by('pk')[:batch_size]
+            )
+            if not events:
+                return published
+            publisher.publish(events)
+            ChangeEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                published_at=timezone.now()
+            )
+        published += len(events)
+
+
+def run_relay(publisher, interval=1.0, stop=None):
+    """Relay continuously, sleeping `interval` seconds when the outbox is empty"""
+    while stop is None or not stop.is_set():
+        if not relay(publisher):
+            time.sleep(interval)
+
+
+def prune(days=None):
+    """
+    Delete events older than the retention window; returns the count. With
+    a REDIS_URL only published events are deleted, so the relay never skips
+    one. Without one nothing publishes them and they expire by age alone:
+    changesSince consumers must sync at least every RETENTION_DAYS.
+    """
+    days = CHANGE_FEED_SETTINGS['RETENTION_DAYS'] if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    expired = ChangeEvent.objects.filter(created_at__lt=cutoff)
+    if CHANGE_FEED_SETTINGS['REDIS_URL']:
+        expired = expired.filter(published_at__isnull=False)
+    deleted, _ = expired.delete()
+    return deleted
@@ -0,0 +1,90 @@
+"""
+Column projection for large CRM list queries
+When GRAPHQL_SETTINGS['LIST_PROJECTION'] is on and a list query
+(`customers`, `products`, `orders`) selects only plain columns, the rows
+are fetched with values_list() into lightweight named tuples instead of
+model instances; graphene resolves the fields from their attributes.
+Selecting anything else (relations, computed fields, fields with
+arguments) falls back to the model queryset.
+"""
+from collections import namedtuple
+from functools import lru_cache
+from operator import itemgetter
+
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+from .settings import GRAPHQL_SETTINGS
+
+# Rows fetched from the database per round trip
+ITERATOR_CHUNK_SIZE = 2000
+
+
+@lru_cache(maxsize=64)
+def record_class(model, attrs):
+    """A named tuple class for `model` rows carrying `attrs`"""
+    record = namedtuple(f"{model.__name__}Record", attrs)
+    record.model = model
+    if 'id' in attrs:
+        # Node ids are resolved from `pk`
+        record.pk = property(itemgetter(attrs.index('id')))
+    return record
+
+
+def is_record_of(root, graphql_type):
+    return getattr(root, 'model', None) is graphql_type._meta.model and isinstance(root, tuple)
+
+
+def _selected(selection_set, fragments, names):
+    """Add the selected field names to `names`; False when one has arguments or subfields"""
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            if selection.arguments or selection.selection_set:
+                return False
+            names.add(selection.name.value)
+        elif isinstance(selection, InlineFragmentNode):
+            if not _selected(selection.selection_set, fragments, names):
+                return False
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is None or not _selected(fragment.selection_set, fragments, names):
+                return False
+    return True
+
+
+def columns(info, plain_columns):
+    """
+    The columns to fetch for the current list field, or None when its
+    selection isn't limited to `plain_columns` ({field name: column}).
+    """
+    names = set()
+    for node in info.field_nodes:
+        if node.selection_set is None or not _selected(node.selection_set, info.fragments, names):
+            return None
+    names.discard('__typename')
+    fields = {to_snake_case(name) for name in names}
+    if not fields or not fields.issubset(plain_columns):
+        return None
+    return tuple(sorted({plain_columns[field] for field in fields}))
+
+
+def project(info, queryset, plain_columns):
+    """
+    `queryset` itself, or an iterator of records when projection is on and
+    only `plain_columns` are selected.
+    """
+    if not GRAPHQL_SETTINGS['LIST_PROJECTION']:
+        return queryset
+    attrs = columns(info, plain_columns)
+    if attrs is None:
+        return queryset
+    record = record_class(queryset.model, attrs)
+    return map(record._make, queryset.values_list(*attrs).iterator(chunk_size=ITERATOR_CHUNK_SIZE))
+
+
+class ProjectedTypeMixin:
+    """Lets a DjangoObjectType accept records from project()"""
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        return is_record_of(root, cls) or super().is_type_of(root, info)
@@ -0,0 +1,237 @@
+"""
+Query complexity rate limiting for CRM application
+Each client (API key, or IP address without one) has a token bucket that
+refills at a constant rate. A GraphQL request costs its query complexity:
+every selected field costs 1, and a connection multiplies the cost of its
+nodes by the page size requested with `first`/`last`. Without either, a
+top-level connection is priced at the maximum page size and a connection
+nested in another (the products of each order) at NESTED_PAGE_SIZE, the
+typical number of rows per parent. Buckets live in process memory, or in Redis when
+RATE_LIMIT_SETTINGS['REDIS_URL'] is set so all processes share them.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from functools import lru_cache
+
+from graphql import GraphQLError, parse
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode, VariableNode
+
+from .settings import GRAPHQL_SETTINGS, RATE_LIMIT_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+PAGE_ARGUMENTS = ('first', 'last')
+
+
+@lru_cache(maxsize=256)
+def parse_query(query):
+    """Parse a query document, cached for clients repeating the same query"""
+    return parse(query, no_location=True)
+
+
+def select_operation(document, operation_name):
+    """The operation a request executes, or None when it is ambiguous"""
+    operations = [
+        definition for definition in document.definitions
+        if hasattr(definition, 'operation')
+    ]
+    for operation in operations:
+        if operation_name is None or (operation.name and operation.name.value == operation_name):
+            if operation_name is not None or len(operations) == 1:
+                return operation
+    return None
+
+
+def _page_size(field, variables, nested):
+    max_size = GRAPHQL_SETTINGS['PAGINATION_MAX_PAGE_SIZE']
+    for argument in field.arguments:
+        if argument.name.value in PAGE_ARGUMENTS:
+            node = argument.value
+            value = variables.get(node.name.value) if isinstance(node, VariableNode) else getattr(node, 'value', None)
+            try:
+                return max(0, min(int(value), max_size))
+            except (TypeError, ValueError):
+                return max_size
+    return min(RATE_LIMIT_SETTINGS['NESTED_PAGE_SIZE'], max_size) if nested else max_size
+
+
+def _has_edges(selection_set, fragments, visiting):
+    # Whether a field selects `edges`, directly or through fragments
+    for selection in selection_set.selections if selection_set else ():
+        if isinstance(selection, FieldNode):
+            if selection.name.value == 'edges':
+                return True
+        elif isinstance(selection, InlineFragmentNode):
+            if _has_edges(selection.selection_set, fragments, visiting):
+                return True
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            if name in fragments and name not in visiting:
+                if _has_edges(fragments[name].selection_set, fragments, visiting | {name}):
+                    return True
+    return False
+
+
+def _selection_cost(selection_set, fragments, variables, visiting, nested=False):
+    cost = 0
+    for selection in selection_set.selections if selection_set else ():
+        if isinstance(selection, FieldNode):
+            children = selection.selection_set
+            if children is None:
+                cost += 1
+                continue
+            connection = _has_edges(children, fragments, visiting)
+            child_cost = _selection_cost(children, fragments, variables, visiting, nested or connection)
+            if connection:
+                child_cost *= _page_size(selection, variables, nested)
+            cost += 1 + child_cost
+        elif isinstance(selection, InlineFragmentNode):
+            cost += _selection_cost(selection.selection_set, fragments, variables, visiting, nested)
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            if name in fragments and name not in visiting:
+                cost += _selection_cost(
+                    fragments[name].selection_set, fragments, variables, visiting | {name}, nested
+                )
+    return cost
+
+
+def query_complexity(query, variables=None, operation_name=None):
+    """
+    Estimated cost of executing `query`. Unparsable or ambiguous documents
+    cost 1: the view rejects them without touching the database.
+    """
+    try:
+        document = parse_query(query)
+    except GraphQLError:
+        return 1
+    operation = select_operation(document, operation_name)
+    if operation is None:
+        return 1
+    fragments = {
+        definition.name.value: definition for definition in document.definitions
+        if not hasattr(definition, 'operation')
+    }
+    return max(1, _selection_cost(operation.selection_set, fragments, variables or {}, frozenset()))
+
+
+class MemoryStore:
+    """Token buckets in process memory"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, capacity, rate):
+        """Take `cost` tokens; returns (allowed, tokens left)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            if key not in self._buckets and len(self._buckets) >= self.max_keys:
+                self._prune(now, capacity, rate)
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens
+
+    def _prune(self, now, capacity, rate):
+        # Buckets that have refilled completely are the same as no bucket
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * rate < capacity
+        }
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisStore:
+    """Token buckets in Redis, updated atomically by a Lua script"""
+
+    SCRIPT = """
+        local capacity, rate, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or capacity
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        local allowed = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url, prefix):
+        import redis
+
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, cost, capacity, rate):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[capacity, rate, cost])
+        return bool(allowed), float(tokens)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                url = RATE_LIMIT_SETTINGS['REDIS_URL']
+                _store = RedisStore(url, RATE_LIMIT_SETTINGS['KEY_PREFIX']) if url else MemoryStore()
+    return _store
+
+
+def client_key(request):
+    """The API key (hashed) when the request has one, otherwise the client IP"""
+    api_key = request.headers.get(RATE_LIMIT_SETTINGS['API_KEY_HEADER'])
+    if api_key:
+        return 'key:' + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+    address = request.META.get('REMOTE_ADDR', '')
+    if RATE_LIMIT_SETTINGS['TRUST_X_FORWARDED_FOR']:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            address = forwarded.split(',')[0].strip()
+    return 'ip:' + address
+
+
+def consume(key, cost):
+    """
+    Charge `cost` to the bucket `key`. Returns None when the request may
+    run, otherwise the number of seconds to wait before retrying (math.inf
+    when the request costs more than a full bucket).
+    """
+    capacity = RATE_LIMIT_SETTINGS['CAPACITY']
+    rate = RATE_LIMIT_SETTINGS['REFILL_PER_SECOND']
+    if cost > capacity:
+        return math.inf
+    try:
+        allowed, tokens = get_store().take(key, cost, capacity, rate)
+    except Exception as e:
+        # A rate limiter outage must not take the API down with it
+        logger.warning("Rate limit store unavailable, allowing request: %s", e)
+        return None
+    if allowed:
+        return None
+    return (cost - tokens) / rate
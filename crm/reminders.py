@@ -0,0 +1,71 @@
+"""
+Order reminders for CRM application
+Keyset pagination over recent orders and idempotent per-batch delivery,
+driven by the send_order_reminders Celery pipeline in crm/tasks.py.
+"""
+from django.db import transaction
+
+from .joblog import job_log
+from .models import Order, OrderReminder
+
+
+def iter_order_id_ranges(since, batch_size):
+    """
+    Yield (first_id, last_id) pk ranges covering orders placed since `since`,
+    each holding at most `batch_size` orders. Only range boundaries are read,
+    never the orders themselves.
+    """
+    recent = Order.objects.filter(order_date__gte=since).order_by('pk')
+    last_id = 0
+    while True:
+        page = recent.filter(pk__gt=last_id).values_list('pk', flat=True)
+        first_id = page.first()
+        if first_id is None:
+            return
+        end_id = page[batch_size - 1:batch_size].first()
+        if end_id is None:
+            end_id = page.last()
+        yield first_id, end_id
+        last_id = end_id
+
+
+def send_batch(first_id, last_id, since, reminder_date):
+    """
+    Send reminders for orders in the pk range [first_id, last_id] placed since
+    `since`, skipping orders already reminded on `reminder_date`.
+    Returns the number of reminders sent.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.filter(pk__gte=first_id, pk__lte=last_id, order_date__gte=since)
+            .select_related('customer')
+            .only('id', 'order_date', 'customer__email')
+            .order_by('pk')
+        )
+        already_sent = set(
+            OrderReminder.objects.filter(
+                order_id__in=[order.pk for order in orders], reminder_date=reminder_date
+            ).values_list('order_id', flat=True)
+        )
+        pending = [order for order in orders if order.pk not in already_sent]
+        if not pending:
+            return 0
+
+        OrderReminder.objects.bulk_create(
+            [OrderReminder(order=order, reminder_date=reminder_date) for order in pending],
+            ignore_conflicts=True,
+        )
+        _deliver(pending)
+    return len(pending)
+
+
+def _deliver(orders):
+    """Log one reminder record per order, flushed in a single write"""
+    with job_log('order_reminders') as log:
+        for order in orders:
+            log.info(
+                "Order reminder",
+                order_id=order.pk,
+                customer_email=order.customer.email,
+                order_date=order.order_date.isoformat(),
+            )
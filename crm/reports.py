@@ -0,0 +1,132 @@
+"""
+Weekly CRM report for CRM application
+The report is built in checkpointed chunks: a run fixes the highest order
+id when it starts and splits [1, max_order_id] into id ranges. Each chunk
+aggregates its range (hot and archived orders share the id space) and
+stores its partial totals, so chunks run in parallel on the report workers
+and a retried run only computes what is missing. Finishing a run merges the
+chunks and writes the JSON report atomically, exactly once per run.
+"""
+import json
+import os
+import tempfile
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .models import ArchivedOrder, Customer, Order, ReportChunk, ReportRun
+from .settings import CRON_SETTINGS
+
+CENT = Decimal('0.01')
+
+
+def _max_order_id():
+    return max(
+        Order.objects.aggregate(max_id=Max('pk'))['max_id'] or 0,
+        ArchivedOrder.objects.aggregate(max_id=Max('pk'))['max_id'] or 0,
+    )
+
+
+def start_run(key, chunk_size=None):
+    """
+    Return (run, pending chunk ids) for the run `key`, creating the run and
+    its chunks on first use. Orders created after that are left to the
+    next run.
+    """
+    chunk_size = chunk_size or CRON_SETTINGS['REPORT_CHUNK_SIZE']
+    with transaction.atomic():
+        run, created = ReportRun.objects.get_or_create(
+            key=key, defaults={'max_order_id': _max_order_id()}
+        )
+        if created:
+            ReportChunk.objects.bulk_create([
+                ReportChunk(run=run, first_id=first_id, last_id=min(first_id + chunk_size - 1, run.max_order_id))
+                for first_id in range(1, run.max_order_id + 1, chunk_size)
+            ])
+    pending = list(
+        run.chunks.filter(computed_at__isnull=True).order_by('first_id').values_list('pk', flat=True)
+    )
+    return run, pending
+
+
+def _range_totals(first_id, last_id):
+    """
+    (orders, revenue) of the hot and archived orders with ids in
+    [first_id, last_id], read in one statement so that archive.move_orders
+    committing meanwhile cannot make an order count twice or not at all
+    """
+    hot, archived = (
+        model.objects.filter(pk__gte=first_id, pk__lte=last_id).order_by().values('total_amount')
+        for model in (Order, ArchivedOrder)
+    )
+    sql, params = hot.union(archived, all=True).query.sql_with_params()
+    with connections[hot.db].cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*), SUM(total_amount) FROM ({sql}) AS orders", params)
+        orders, revenue = cursor.fetchone()
+    # SQLite sums decimals as floats
+    return orders, Decimal(str(revenue)) if revenue is not None else Decimal('0.00')
+
+
+def compute_chunk(chunk_id):
+    """Aggregate one chunk's id range; a computed chunk is left as it is"""
+    chunk = ReportChunk.objects.get(pk=chunk_id)
+    if chunk.computed_at:
+        return chunk
+    orders, revenue = _range_totals(chunk.first_id, chunk.last_id)
+    ReportChunk.objects.filter(pk=chunk_id, computed_at__isnull=True).update(
+        orders=orders, revenue=revenue.quantize(CENT), computed_at=timezone.now()
+    )
+    chunk.refresh_from_db()
+    return chunk
+
+
+def result(run):
+    return {
+        'run': run.key,
+        'customers': run.customers,
+        'orders': run.orders,
+        'revenue': f"{run.revenue:.2f}",
+        'max_order_id': run.max_order_id,
+        'generated_at': run.finished_at.isoformat(),
+    }
+
+
+def write_json(path, data):
+    """Write `data` to `path` through a temporary file and an atomic rename"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.crm_report.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as handle:
+            json.dump(data, handle, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def finish_run(run_id):
+    """
+    Merge the chunks of a run and write the report file. Returns
+    (result, finished_now); a run that was already finished is returned
+    without writing anything.
+    """
+    with transaction.atomic():
+        run = ReportRun.objects.select_for_update().get(pk=run_id)
+        if run.finished_at:
+            return result(run), False
+        pending = run.chunks.filter(computed_at__isnull=True).count()
+        if pending:
+            raise Exception(f"Report {run.key}: {pending} chunk(s) not computed yet")
+        totals = run.chunks.aggregate(orders=Sum('orders'), revenue=Sum('revenue'))
+        run.customers = Customer.objects.count()
+        run.orders = totals['orders'] or 0
+        run.revenue = Decimal(totals['revenue'] or 0).quantize(CENT)
+        run.finished_at = timezone.now()
+        run.save(update_fields=['customers', 'orders', 'revenue', 'finished_at'])
+        data = result(run)
+        # Written inside the transaction: if the write fails the run stays
+        # unfinished and the retry writes it
+        write_json(CRON_SETTINGS['CRM_REPORT_FILE'], data)
+    return data, True
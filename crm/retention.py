@@ -0,0 +1,134 @@
+"""
+Customer retention for CRM application
+Inactive customers are archived (soft-deleted: `archived_at` is set and
+Customer.objects no longer returns them) instead of being deleted with
+their orders in one cascading statement. purge_archived_customers() later
+removes customers archived longer than the retention period, with their
+hot and archived orders, in small transactions with a pause between
+batches so the purge never holds locks or floods the WAL for long. Each
+batch reconciles the sales rollup days of the folded orders it deletes and
+records a `deleted` change event for each purged customer and order.
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import archive, outbox, rollups
+from .models import ArchivedOrder, ArchivedOrderItem, ChangeEvent, Customer, Order
+from .settings import CRON_SETTINGS
+from .signals import stats_updates_paused
+
+
+def inactive_customers(days=None, now=None):
+    """Active customers with no order in the last `days` days (read from CustomerStats)"""
+    days = CRON_SETTINGS['INACTIVE_CUSTOMER_DAYS'] if days is None else days
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return Customer.objects.filter(
+        Q(stats__isnull=True)
+        | Q(stats__last_order_date__isnull=True)
+        | Q(stats__last_order_date__lt=cutoff)
+    )
+
+
+def archive_customers(queryset, batch_size=None):
+    """
+    Archive the customers in `queryset`, one batch per transaction, and
+    record an `archived` change event for each. Returns the number archived.
+    """
+    batch_size = batch_size or CRON_SETTINGS['CUSTOMER_PURGE_BATCH_SIZE']
+    archived = 0
+    while True:
+        with transaction.atomic():
+            customers = list(queryset.filter(archived_at__isnull=True).order_by('pk')[:batch_size])
+            if not customers:
+                return archived
+            now = timezone.now()
+            Customer.all_objects.filter(pk__in=[customer.pk for customer in customers]).update(
+                archived_at=now, updated_at=now
+            )
+            for customer in customers:
+                customer.archived_at = customer.updated_at = now
+            outbox.record_many(customers, ChangeEvent.ARCHIVED)
+        archived += len(customers)
+
+
+def _days(orders):
+    """{order id: sales rollup days} of purged orders"""
+    return {order.pk: [timezone.localtime(order.order_date).date()] for order in orders}
+
+
+def _product_ids(order_ids):
+    """{order id: product ids} of hot orders"""
+    product_ids = defaultdict(list)
+    for order_id, product_id in (
+        Order.products.through.objects.filter(order_id__in=order_ids).values_list('order_id', 'product_id')
+    ):
+        product_ids[order_id].append(product_id)
+    return product_ids
+
+
+def _purge_orders(customer_ids, batch_size, pause):
+    """Delete the hot and archived orders of `customer_ids` in batches; returns the count"""
+    purged = 0
+    while True:
+        with transaction.atomic(), stats_updates_paused():
+            orders = list(Order.objects.filter(customer_id__in=customer_ids).order_by('pk')[:batch_size])
+            if not orders:
+                break
+            ids = [order.pk for order in orders]
+            product_ids = _product_ids(ids)
+            # Cascades to the products and reminders of the orders
+            Order.objects.filter(pk__in=ids).delete()
+            rollups.reconcile_orders(_days(orders))
+            # Last, so the events are committed right after they are written
+            outbox.record_many(orders, ChangeEvent.DELETED, product_ids=product_ids)
+        purged += len(orders)
+        time.sleep(pause)
+    while True:
+        with transaction.atomic():
+            orders = archive.as_orders(
+                ArchivedOrder.objects.filter(customer_id__in=customer_ids).order_by('pk')[:batch_size]
+            )
+            if not orders:
+                return purged
+            ids = [order.pk for order in orders]
+            ArchivedOrderItem.objects.filter(order_id__in=ids).delete()
+            ArchivedOrder.objects.filter(pk__in=ids).delete()
+            rollups.reconcile_orders(_days(orders))
+            outbox.record_many(orders, ChangeEvent.DELETED, product_ids={
+                order.pk: order.archived_product_ids for order in orders
+            })
+        purged += len(orders)
+        time.sleep(pause)
+
+
+def purge_archived_customers(retention_days=None, batch_size=None, pause=None, now=None):
+    """
+    Physically delete customers archived more than `retention_days` ago and
+    all their orders, `batch_size` rows per transaction, sleeping `pause`
+    seconds between transactions. Safe to interrupt and re-run. Returns
+    (customers, orders) deleted.
+    """
+    retention_days = CRON_SETTINGS['CUSTOMER_RETENTION_DAYS'] if retention_days is None else retention_days
+    batch_size = batch_size or CRON_SETTINGS['CUSTOMER_PURGE_BATCH_SIZE']
+    pause = CRON_SETTINGS['CUSTOMER_PURGE_PAUSE_SECONDS'] if pause is None else pause
+    cutoff = (now or timezone.now()) - timedelta(days=retention_days)
+    customers = orders = 0
+    while True:
+        customer_ids = list(
+            Customer.all_objects.filter(archived_at__lt=cutoff).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not customer_ids:
+            return customers, orders
+        orders += _purge_orders(customer_ids, batch_size, pause)
+        with transaction.atomic():
+            purged = list(Customer.all_objects.filter(pk__in=customer_ids))
+            # Cascades to CustomerStats; no orders are left to cascade to
+            Customer.all_objects.filter(pk__in=customer_ids).delete()
+            outbox.record_many(purged, ChangeEvent.DELETED)
+        customers += len(customer_ids)
+        time.sleep(pause)
@@ -0,0 +1,269 @@
+"""
+Time-bucketed sales rollups for CRM application
+Fold new orders into DailyRevenue / DailyProductSales past a watermark, and
+read revenue series from the pre-aggregated rows. Folding only adds: when an
+order behind the watermark is edited or deleted (see crm/signals.py and the
+purge in crm/retention.py), reconcile_orders() recomputes its days from the
+hot and archived orders, once per transaction however many orders it
+touched. Orders past the watermark are skipped: folding reads them as they
+are. rebuild_sales_rollups() recomputes every day.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+
+from .models import ArchivedOrder, ArchivedOrderItem, DailyProductSales, DailyRevenue, Order, RollupWatermark
+from .settings import CRON_SETTINGS
+
+SALES_ROLLUP = 'sales'
+
+GRANULARITIES = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def refresh_sales_rollups(batch_size=None, settle_seconds=None):
+    """
+    Fold orders created since the last run into the daily rollups.
+    Processes at most `batch_size` orders per transaction and returns the
+    number of orders folded in. Orders younger than `settle_seconds` are left
+    for the next run so that in-flight transactions (and CreateOrder's
+    products.set()) commit before the watermark passes them.
+    """
+    if batch_size is None:
+        batch_size = CRON_SETTINGS['ROLLUP_BATCH_SIZE']
+    if settle_seconds is None:
+        settle_seconds = CRON_SETTINGS['ROLLUP_SETTLE_SECONDS']
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+                name=SALES_ROLLUP
+            )
+            ids = list(
+                Order.objects.filter(pk__gt=watermark.last_order_id, created_at__lte=cutoff)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return processed
+            upper = ids[-1]
+            orders = Order.objects.filter(pk__gt=watermark.last_order_id, pk__lte=upper)
+
+            processed += _fold_orders(orders)
+            watermark.last_order_id = upper
+            watermark.save(update_fields=['last_order_id', 'updated_at'])
+
+
+def _fold_orders(orders):
+    """Add a batch of orders to the daily rollup rows; returns the order count"""
+    folded = 0
+    daily = (
+        orders.order_by()
+        .annotate(day=TruncDate('order_date'))
+        .values('day')
+        .annotate(revenue=Sum('total_amount'), order_count=Count('id'))
+    )
+    for row in daily:
+        updated = DailyRevenue.objects.filter(date=row['day']).update(
+            revenue=F('revenue') + row['revenue'],
+            order_count=F('order_count') + row['order_count'],
+        )
+        if not updated:
+            DailyRevenue.objects.create(
+                date=row['day'], revenue=row['revenue'], order_count=row['order_count']
+            )
+        folded += row['order_count']
+
+    units = (
+        Order.products.through.objects.filter(order__in=orders)
+        .annotate(day=TruncDate('order__order_date'))
+        .values('day', 'product_id')
+        .annotate(units=Count('id'))
+        .order_by()
+    )
+    for row in units:
+        updated = DailyProductSales.objects.filter(
+            date=row['day'], product_id=row['product_id']
+        ).update(units=F('units') + row['units'])
+        if not updated:
+            DailyProductSales.objects.create(
+                date=row['day'], product_id=row['product_id'], units=row['units']
+            )
+    return folded
+
+
+def _recompute_days(days, last_order_id):
+    """Replace the rollup rows of `days` (under the watermark lock)"""
+    folded = {'pk__lte': last_order_id, 'order_date__date__in': days}
+    revenue = {day: [Decimal('0.00'), 0] for day in days}
+    for model in (Order, ArchivedOrder):
+        for row in (
+            model.objects.filter(**folded).order_by()
+            .annotate(day=TruncDate('order_date'))
+            .values('day')
+            .annotate(revenue=Sum('total_amount'), order_count=Count('id'))
+        ):
+            revenue[row['day']][0] += row['revenue'] or Decimal('0.00')
+            revenue[row['day']][1] += row['order_count']
+
+    units = {}
+    for row in (
+        Order.products.through.objects.filter(
+            order__pk__lte=last_order_id, order__order_date__date__in=days
+        )
+        .annotate(day=TruncDate('order__order_date'))
+        .values('day', 'product_id')
+        .annotate(units=Count('id'))
+        .order_by()
+    ):
+        units[row['day'], row['product_id']] = row['units']
+    archived_days = dict(
+        ArchivedOrder.objects.filter(**folded).annotate(day=TruncDate('order_date')).values_list('pk', 'day')
+    )
+    for order_id, product_id in ArchivedOrderItem.objects.filter(
+        order_id__in=archived_days
+    ).values_list('order_id', 'product_id'):
+        key = (archived_days[order_id], product_id)
+        units[key] = units.get(key, 0) + 1
+
+    DailyRevenue.objects.filter(date__in=days).delete()
+    DailyRevenue.objects.bulk_create([
+        DailyRevenue(date=day, revenue=total, order_count=count)
+        for day, (total, count) in revenue.items() if count
+    ])
+    DailyProductSales.objects.filter(date__in=days).delete()
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(date=day, product_id=product_id, units=count)
+        for (day, product_id), count in units.items()
+    ])
+
+
+def reconcile_days(days):
+    """
+    Recompute the rollup rows of `days` from the folded orders (ids up to
+    the watermark) in the Order and archive tables, replacing what folding
+    added. Orders past the watermark are left for refresh_sales_rollups().
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=SALES_ROLLUP)
+        _recompute_days(days, watermark.last_order_id)
+
+
+def reconcile_orders(orders):
+    """
+    Reconcile the days of edited or deleted orders ({order id: days}) that
+    the watermark has reached; returns the days recomputed. Call inside the
+    transaction that changed the orders, or after it commits: a fold
+    running meanwhile has then either read the orders as changed, or holds
+    the watermark lock until its batch commits and the orders count as
+    folded here.
+    """
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=SALES_ROLLUP)
+        days = sorted({
+            day for order_id, order_days in orders.items() if order_id <= watermark.last_order_id
+            for day in order_days
+        })
+        if days:
+            _recompute_days(days, watermark.last_order_id)
+    return days
+
+
+class _PendingReconciliation:
+    """The orders a transaction edited or deleted, reconciled once it commits"""
+
+    def __init__(self):
+        self.orders = {}
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        reconcile_orders(self.orders)
+
+
+def reconcile_on_commit(order_id, days):
+    """
+    Reconcile the days of an edited or deleted order after the current
+    transaction commits, with the other orders it changes
+    """
+    connection = transaction.get_connection()
+    pending = next(
+        (func for _, func, _ in connection.run_on_commit
+         if isinstance(func, _PendingReconciliation) and not func.done),
+        None,
+    )
+    if pending is not None:
+        pending.orders.setdefault(order_id, set()).update(days)
+        return
+    pending = _PendingReconciliation()
+    pending.orders[order_id] = set(days)
+    transaction.on_commit(pending)
+
+
+def rebuild_sales_rollups(days_per_batch=100):
+    """
+    Recompute every day that has orders or rollup rows, `days_per_batch`
+    days per transaction, e.g. after deleting orders in bulk. Returns the
+    number of days recomputed.
+    """
+    days = set()
+    for model in (Order, ArchivedOrder):
+        days.update(
+            model.objects.order_by().annotate(day=TruncDate('order_date')).values_list('day', flat=True).distinct()
+        )
+    days.update(DailyRevenue.objects.order_by().values_list('date', flat=True))
+    days.update(DailyProductSales.objects.order_by().values_list('date', flat=True).distinct())
+    days = sorted(days)
+    for start in range(0, len(days), days_per_batch):
+        reconcile_days(days[start:start + days_per_batch])
+    return len(days)
+
+
+def revenue_series(date_from, date_to, granularity='day'):
+    """
+    Return [{'period', 'revenue', 'order_count'}] for the inclusive date range,
+    aggregated from DailyRevenue rows at the requested granularity.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(
+            f"Granularity must be one of: {', '.join(GRANULARITIES)}"
+        )
+    rows = DailyRevenue.objects.filter(date__gte=date_from, date__lte=date_to)
+    trunc = GRANULARITIES[granularity]
+    if trunc is None:
+        return list(rows.values('revenue', 'order_count', period=F('date')).order_by('date'))
+    return [
+        {
+            'period': row['period'],
+            'revenue': Decimal(row['revenue'] or 0).quantize(Decimal('0.01')),
+            'order_count': row['order_count'] or 0,
+        }
+        for row in rows.annotate(period=trunc('date'))
+        .values('period')
+        .annotate(revenue=Sum('revenue'), order_count=Sum('order_count'))
+        .order_by('period')
+    ]
+
+
+def product_sales(date_from, date_to, limit=None):
+    """Return [{'product_id', 'units'}] for the inclusive date range, best sellers first"""
+    rows = (
+        DailyProductSales.objects.filter(date__gte=date_from, date__lte=date_to)
+        .values('product_id')
+        .annotate(units=Sum('units'))
+        .order_by('-units', 'product_id')
+    )
+    if limit is not None:
+        rows = rows[:limit]
+    return list(rows)
@@ -0,0 +1,56 @@
+"""
+Database routing for CRM application
+
+GraphQL query operations read from the replicas listed in
+settings.DATABASE_REPLICAS; mutations, anything outside a GraphQL request
+(admin, cron jobs, Celery tasks) and all writes use the primary `default`
+database. ReplicaRoutingMiddleware decides the route per request.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+_use_replicas = ContextVar('crm_use_replicas', default=False)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route reads in this block to the replicas (or force the primary)"""
+    token = _use_replicas.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replicas.get():
+            aliases = replicas()
+            if aliases:
+                return random.choice(aliases)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {PRIMARY, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        if db in replicas():
+            return False
+        return None
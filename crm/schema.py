@@ -1,34 +1,202 @@
 import graphene
-from graphene_django import DjangoObjectType, DjangoFilterConnectionField
+from graphene_django import DjangoObjectType
 from graphene import relay
+from graphene.types.generic import GenericScalar
 from django.db import transaction
+from django.db.models.query import QuerySet
 from decimal import Decimal
-import re
 from crm.models import Product
-from .models import Customer, Product, Order
+from .models import ChangeEvent, Customer, CustomerStats, Product, Order
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from . import aggregates, catalog, counts, outbox, projection, rollups, stock, validation
+from .loaders import get_loader
+from .settings import CRM_SETTINGS
+
+
+# Connection aggregates (see crm/aggregates.py), computed over the filtered
+# queryset before pagination
+class OrderAggregatesType(graphene.ObjectType):
+    count = graphene.Int()
+    sum_total_amount = graphene.Decimal()
+    avg_total_amount = graphene.Decimal()
+    min_total_amount = graphene.Decimal()
+    max_total_amount = graphene.Decimal()
+    min_order_date = graphene.DateTime()
+    max_order_date = graphene.DateTime()
+
+
+class ProductAggregatesType(graphene.ObjectType):
+    count = graphene.Int()
+    sum_stock = graphene.Int()
+    min_stock = graphene.Int()
+    max_stock = graphene.Int()
+    avg_price = graphene.Decimal()
+    min_price = graphene.Decimal()
+    max_price = graphene.Decimal()
+
+
+class CustomerAggregatesType(graphene.ObjectType):
+    count = graphene.Int()
+    sum_lifetime_value = graphene.Decimal()
+    avg_lifetime_value = graphene.Decimal()
+    sum_order_count = graphene.Int()
+    min_created_at = graphene.DateTime()
+    max_created_at = graphene.DateTime()
+
+
+class CountedConnection(relay.Connection):
+    """totalCount/isExact for the filter connections (see crm/counts.py)"""
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+    is_exact = graphene.Boolean(description="False when totalCount is an estimate or a cached count")
+
+    def resolve_total_count(self, info):
+        return counts.total_count(self)[0]
+
+    def resolve_is_exact(self, info):
+        return counts.total_count(self)[1]
+
+
+class OrderConnection(CountedConnection):
+    class Meta:
+        abstract = True
+
+    aggregates = graphene.Field(OrderAggregatesType)
+
+    def resolve_aggregates(self, info):
+        return aggregates.compute(self.iterable, aggregates.ORDER_AGGREGATES)
+
+
+class ProductConnection(CountedConnection):
+    class Meta:
+        abstract = True
+
+    aggregates = graphene.Field(ProductAggregatesType)
+
+    def resolve_aggregates(self, info):
+        return aggregates.compute(self.iterable, aggregates.PRODUCT_AGGREGATES)
+
+
+class CustomerConnection(CountedConnection):
+    class Meta:
+        abstract = True
+
+    aggregates = graphene.Field(CustomerAggregatesType)
+
+    def resolve_aggregates(self, info):
+        return aggregates.compute(self.iterable, aggregates.CUSTOMER_AGGREGATES)
 
 
 # GraphQL Types
-class CustomerType(DjangoObjectType):
+class CustomerType(projection.ProjectedTypeMixin, DjangoObjectType):
+    lifetime_value = graphene.Decimal()
+    order_count = graphene.Int()
+    last_order_date = graphene.DateTime()
+
     class Meta:
         model = Customer
         fields = ('id', 'name', 'email', 'phone', 'created_at', 'updated_at')
         interfaces = (relay.Node,)
+        connection_class = CustomerConnection
+
+    @staticmethod
+    def _stats(customer):
+        try:
+            return customer.stats
+        except CustomerStats.DoesNotExist:
+            return None
+
+    def resolve_lifetime_value(self, info):
+        stats = CustomerType._stats(self)
+        return stats.lifetime_value if stats else Decimal('0.00')
+
+    def resolve_order_count(self, info):
+        stats = CustomerType._stats(self)
+        return stats.order_count if stats else 0
 
+    def resolve_last_order_date(self, info):
+        stats = CustomerType._stats(self)
+        return stats.last_order_date if stats else None
 
-class ProductType(DjangoObjectType):
+
+class ProductType(projection.ProjectedTypeMixin, DjangoObjectType):
     class Meta:
         model = Product
         fields = ('id', 'name', 'price', 'stock', 'created_at', 'updated_at')
         interfaces = (relay.Node,)
+        connection_class = ProductConnection
+
+    def resolve_stock(self, info):
+        # Live level from the stock ledger; list resolvers annotate it up front
+        current = getattr(self, 'current_stock', None)
+        if current is None:
+            current = stock.current_stock(self)
+        return current
 
 
-class OrderType(DjangoObjectType):
+class OrderType(projection.ProjectedTypeMixin, DjangoObjectType):
     class Meta:
         model = Order
         fields = ('id', 'customer', 'products', 'total_amount', 'order_date', 'created_at', 'updated_at')
         interfaces = (relay.Node,)
+        connection_class = OrderConnection
+
+    def resolve_customer(self, info):
+        # Orders of the same customer share one lookup per request
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loader(info.context).customer(self.customer_id)
+
+    def resolve_products(self, info):
+        # Archived orders (crm/archive.py) carry their product ids
+        product_ids = getattr(self, 'archived_product_ids', None)
+        if not catalog.servable(info):
+            # Stock is selected: read the live levels with the rows
+            if product_ids is not None:
+                return Product.objects.with_current_stock().filter(pk__in=product_ids)
+            return self.products.with_current_stock()
+        if product_ids is None:
+            product_ids = Order.products.through.objects.filter(order_id=self.pk).values_list('product_id', flat=True)
+        records = get_loader(info.context).products(product_ids)
+        # Product ordering: newest first
+        return sorted(records.values(), key=lambda record: (record.created_at, record.id), reverse=True)
+
+
+class RevenueGranularity(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+
+
+class RevenueBucketType(graphene.ObjectType):
+    period = graphene.Date()
+    revenue = graphene.Decimal()
+    order_count = graphene.Int()
+
+
+class ProductSalesType(graphene.ObjectType):
+    product = graphene.Field(ProductType)
+    units = graphene.Int()
+
+
+class ChangeEventType(graphene.ObjectType):
+    cursor = graphene.String()
+    entity = graphene.String()
+    entity_id = graphene.ID()
+    action = graphene.String()
+    payload = GenericScalar()
+    created_at = graphene.DateTime()
+
+    def resolve_cursor(self, info):
+        return str(self.pk)
+
+
+class ChangeFeedType(graphene.ObjectType):
+    events = graphene.List(ChangeEventType)
+    cursor = graphene.String(description="Pass as `cursor` to fetch the events after this page")
+    has_more = graphene.Boolean()
 
 
 # Input Types
@@ -56,6 +224,11 @@ class CreateOrderInput(graphene.InputObjectType):
     order_date = graphene.DateTime()
 
 
+class StockDeltaInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    delta = graphene.Int(required=True)
+
+
 # Response Types
 class CreateCustomerResponse(graphene.ObjectType):
     customer = graphene.Field(CustomerType)
@@ -75,17 +248,6 @@ class CreateOrderResponse(graphene.ObjectType):
     order = graphene.Field(OrderType)
 
 
-# Validation helpers
-def validate_phone(phone):
-    """Validate phone format: +1234567890 or 123-456-7890"""
-    if not phone:
-        return True, None
-    pattern = r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$'
-    if re.match(pattern, phone):
-        return True, None
-    return False, "Phone must be in format +1234567890 or 123-456-7890"
-
-
 # Mutations
 class CreateCustomer(graphene.Mutation):
     class Arguments:
@@ -94,22 +256,14 @@ class CreateCustomer(graphene.Mutation):
     Output = CreateCustomerResponse
 
     def mutate(self, info, input):
-        # Validate email uniqueness
-        if Customer.objects.filter(email=input.email).exists():
-            raise Exception("Email already exists")
-
-        # Validate phone format
-        if input.phone:
-            is_valid, error_msg = validate_phone(input.phone)
-            if not is_valid:
-                raise Exception(error_msg)
-
-        customer = Customer(
-            name=input.name,
-            email=input.email,
-            phone=input.phone or ""
-        )
-        customer.save()
+        customers, errors = validation.validate_customers([input])
+        if errors:
+            raise Exception(errors[0][0])
+
+        with transaction.atomic():
+            customer = Customer(**customers[0])
+            customer.save()
+            outbox.record(customer)
 
         return CreateCustomerResponse(
             customer=customer,
@@ -128,30 +282,22 @@ class BulkCreateCustomers(graphene.Mutation):
         customers = []
         errors = []
 
-        for idx, customer_data in enumerate(input):
+        # Validate the whole batch up front: formats, duplicates, existing emails
+        cleaned, row_errors = validation.validate_customers(input)
+
+        for idx, customer_data in enumerate(cleaned):
+            if customer_data is None:
+                errors.extend(f"Row {idx + 1}: {message}" for message in row_errors[idx])
+                continue
             try:
-                # Validate email uniqueness
-                if Customer.objects.filter(email=customer_data.email).exists():
-                    errors.append(f"Row {idx + 1}: Email '{customer_data.email}' already exists")
-                    continue
-
-                # Validate phone format
-                if customer_data.phone:
-                    is_valid, error_msg = validate_phone(customer_data.phone)
-                    if not is_valid:
-                        errors.append(f"Row {idx + 1}: {error_msg}")
-                        continue
-
-                customer = Customer(
-                    name=customer_data.name,
-                    email=customer_data.email,
-                    phone=customer_data.phone or ""
-                )
+                customer = Customer(**customer_data)
                 customer.save()
                 customers.append(customer)
             except Exception as e:
                 errors.append(f"Row {idx + 1}: {str(e)}")
 
+        outbox.record_many(customers)
+
         return BulkCreateCustomersResponse(
             customers=customers,
             errors=errors
@@ -170,16 +316,20 @@ class CreateProduct(graphene.Mutation):
             raise Exception("Price must be positive")
 
         # Validate stock is non-negative
-        stock = input.stock if input.stock is not None else 0
+        stock = input.stock if input.stock is not None else CRM_SETTINGS['PRODUCT']['DEFAULT_STOCK']
         if stock < 0:
             raise Exception("Stock cannot be negative")
 
-        product = Product(
-            name=input.name,
-            price=input.price,
-            stock=stock
-        )
-        product.save()
+        with transaction.atomic():
+            product = Product(
+                name=input.name,
+                price=input.price,
+                stock=stock
+            )
+            product.save()
+            # No movements yet: the snapshot is the live level
+            product.current_stock = product.stock
+            outbox.record(product)
 
         return CreateProductResponse(product=product)
 
@@ -201,25 +351,33 @@ class CreateOrder(graphene.Mutation):
         if not input.product_ids or len(input.product_ids) == 0:
             raise Exception("At least one product must be selected")
 
-        # Validate all products exist
-        products = []
+        # Validate all products exist (names and prices come from the product cache)
+        product_ids = []
         for product_id in input.product_ids:
             try:
-                product = Product.objects.get(pk=product_id)
-                products.append(product)
-            except Product.DoesNotExist:
+                product_ids.append(int(product_id))
+            except (TypeError, ValueError):
                 raise Exception(f"Invalid product ID: {product_id}")
+        records = get_loader(info.context).products(product_ids)
+        products = []
+        for product_id in product_ids:
+            if product_id not in records:
+                raise Exception(f"Invalid product ID: {product_id}")
+            products.append(records[product_id])
 
         # Calculate total amount
         total_amount = sum(product.price for product in products)
 
-        # Create order
-        order = Order(
-            customer=customer,
-            total_amount=total_amount
-        )
-        order.save()
-        order.products.set(products)
+        # Create order and reserve its stock in the ledger
+        with transaction.atomic():
+            order = Order(
+                customer=customer,
+                total_amount=total_amount
+            )
+            order.save()
+            order.products.set([product.pk for product in products])
+            stock.reserve_for_order(order, products)
+            outbox.record(order, product_ids=[product.pk for product in products])
 
         return CreateOrderResponse(order=order)
 
@@ -233,20 +391,15 @@ class UpdateLowStockProductsResponse(graphene.ObjectType):
 class UpdateLowStockProducts(graphene.Mutation):
     """
     Mutation to update low stock products (stock < 10) by incrementing their stock by 10.
+    Restocks are recorded as StockMovement entries rather than product saves.
     """
     Output = UpdateLowStockProductsResponse
 
+    @transaction.atomic
     def mutate(self, info):
-        # Query products with stock < 10
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        
-        # Update each product's stock by incrementing by 10
-        updated_products = []
-        for product in low_stock_products:
-            product.stock += 10
-            product.save()
-            updated_products.append(product)
-        
+        updated_products = stock.restock_low_stock(threshold=10, increment=10)
+        outbox.record_many(updated_products, ChangeEvent.UPDATED)
+
         message = f"Successfully updated {len(updated_products)} product(s) with low stock"
         
         return UpdateLowStockProductsResponse(
@@ -255,6 +408,60 @@ class UpdateLowStockProducts(graphene.Mutation):
         )
 
 
+class AdjustStockResponse(graphene.ObjectType):
+    products = graphene.List(ProductType)
+    errors = graphene.List(graphene.String)
+
+
+class AdjustStock(graphene.Mutation):
+    """
+    Apply a batch of stock deltas in one transaction. Deltas for the same
+    product are summed; a delta that would make stock negative is rejected
+    and reported in `errors`, the rest are applied.
+    """
+    class Arguments:
+        deltas = graphene.List(StockDeltaInput, required=True)
+
+    Output = AdjustStockResponse
+
+    @transaction.atomic
+    def mutate(self, info, deltas):
+        errors = []
+        pairs = []
+        for idx, item in enumerate(deltas):
+            try:
+                pairs.append((int(item.product_id), item.delta))
+            except (TypeError, ValueError):
+                errors.append(f"Row {idx + 1}: Invalid product ID: {item.product_id}")
+        if errors:
+            return AdjustStockResponse(products=[], errors=errors)
+
+        merged = stock.merge_deltas(pairs)
+        applied, rejected, missing = stock.adjust_stock(merged)
+        outbox.record_many(applied, ChangeEvent.UPDATED)
+
+        for product_id in missing:
+            errors.append(f"Invalid product ID: {product_id}")
+        for product in rejected:
+            errors.append(
+                f"Product {product.id} ('{product.name}'): stock {product.stock} "
+                f"cannot be adjusted by {merged[product.id]}"
+            )
+
+        return AdjustStockResponse(products=applied, errors=errors)
+
+
+# Fields the `customers`, `products` and `orders` lists can resolve from
+# projected columns (see crm/projection.py): {field: column}
+CUSTOMER_COLUMNS = {field: field for field in ('id', 'name', 'email', 'phone', 'created_at', 'updated_at')}
+# ProductType.resolve_stock reads the current_stock annotation
+PRODUCT_COLUMNS = {
+    **{field: field for field in ('id', 'name', 'price', 'created_at', 'updated_at')},
+    'stock': 'current_stock',
+}
+ORDER_COLUMNS = {field: field for field in ('id', 'total_amount', 'order_date', 'created_at', 'updated_at')}
+
+
 # Query class (if needed for queries)
 class Query(graphene.ObjectType):
     # Simple queries (kept for backward compatibility)
@@ -265,70 +472,108 @@ class Query(graphene.ObjectType):
     orders = graphene.List(OrderType)
     order = graphene.Field(OrderType, id=graphene.ID())
 
-    # Filtered connection queries
-    all_customers = DjangoFilterConnectionField(
+    # Pre-aggregated sales rollups (see crm/rollups.py)
+    revenue_series = graphene.List(
+        RevenueBucketType,
+        date_from=graphene.Date(required=True, name='from'),
+        date_to=graphene.Date(required=True, name='to'),
+        granularity=RevenueGranularity(default_value='day'),
+    )
+    product_sales = graphene.List(
+        ProductSalesType,
+        date_from=graphene.Date(required=True, name='from'),
+        date_to=graphene.Date(required=True, name='to'),
+        limit=graphene.Int(),
+    )
+
+    changes_since = graphene.Field(
+        ChangeFeedType,
+        cursor=graphene.String(),
+        limit=graphene.Int(),
+        description="Customer, product and order changes after `cursor`, oldest first",
+    )
+
+    # Filtered connection queries (forward pages skip COUNT(*) with APPROXIMATE_COUNTS)
+    all_customers = counts.ApproximateCountConnectionField(
         CustomerType,
         filterset_class=CustomerFilter,
         order_by=graphene.List(of_type=graphene.String)
     )
-    all_products = DjangoFilterConnectionField(
+    all_products = counts.ApproximateCountConnectionField(
         ProductType,
         filterset_class=ProductFilter,
         order_by=graphene.List(of_type=graphene.String)
     )
-    all_orders = DjangoFilterConnectionField(
+    all_orders = counts.ApproximateCountConnectionField(
         OrderType,
         filterset_class=OrderFilter,
         order_by=graphene.List(of_type=graphene.String)
     )
 
     def resolve_customers(self, info):
-        return Customer.objects.all()
+        return projection.project(info, Customer.objects.select_related('stats'), CUSTOMER_COLUMNS)
 
     def resolve_customer(self, info, id):
-        try:
-            return Customer.objects.get(pk=id)
-        except Customer.DoesNotExist:
-            return None
+        customer = get_loader(info.context).customer(id)
+        return customer if customer is not None and customer.archived_at is None else None
 
     def resolve_products(self, info):
-        return Product.objects.all()
+        return projection.project(info, Product.objects.with_current_stock(), PRODUCT_COLUMNS)
 
     def resolve_product(self, info, id):
-        try:
-            return Product.objects.get(pk=id)
-        except Product.DoesNotExist:
-            return None
+        return get_loader(info.context).product(id)
 
     def resolve_orders(self, info):
-        return Order.objects.all()
+        orders = projection.project(info, Order.objects.all(), ORDER_COLUMNS)
+        if isinstance(orders, QuerySet):
+            # Their customers are then read in one query
+            orders = list(orders)
+            get_loader(info.context).prime_related(orders)
+        return orders
 
     def resolve_order(self, info, id):
-        try:
-            return Order.objects.get(pk=id)
-        except Order.DoesNotExist:
-            return None
+        # Falls back to the order archive
+        return get_loader(info.context).order(id)
+
+    def resolve_revenue_series(self, info, date_from, date_to, granularity='day'):
+        if date_from > date_to:
+            raise Exception("'from' must not be after 'to'")
+        granularity = getattr(granularity, 'value', granularity)
+        return [
+            RevenueBucketType(**bucket)
+            for bucket in rollups.revenue_series(date_from, date_to, granularity)
+        ]
+
+    def resolve_product_sales(self, info, date_from, date_to, limit=None):
+        if date_from > date_to:
+            raise Exception("'from' must not be after 'to'")
+        rows = rollups.product_sales(date_from, date_to, limit)
+        products = Product.objects.with_current_stock().in_bulk([row['product_id'] for row in rows])
+        return [
+            ProductSalesType(product=products.get(row['product_id']), units=row['units'])
+            for row in rows
+        ]
+
+    def resolve_changes_since(self, info, cursor=None, limit=None):
+        if limit is not None and limit <= 0:
+            raise Exception("limit must be positive")
+        events, next_cursor, has_more = outbox.changes_since(cursor, limit)
+        return ChangeFeedType(events=events, cursor=next_cursor, has_more=has_more)
 
     def resolve_all_customers(self, info, **kwargs):
-        queryset = Customer.objects.all()
-        order_by = kwargs.get('order_by')
-        if order_by:
-            queryset = queryset.order_by(*order_by)
-        return queryset
+        # Ordering is applied by CustomerFilter's `order_by` filter
+        return Customer.objects.select_related('stats')
 
     def resolve_all_products(self, info, **kwargs):
-        queryset = Product.objects.all()
+        queryset = Product.objects.with_current_stock()
         order_by = kwargs.get('order_by')
         if order_by:
             queryset = queryset.order_by(*order_by)
         return queryset
 
     def resolve_all_orders(self, info, **kwargs):
-        queryset = Order.objects.all()
-        order_by = kwargs.get('order_by')
-        if order_by:
-            queryset = queryset.order_by(*order_by)
-        return queryset
+        # Ordering is applied by OrderFilter's `order_by` filter
+        return Order.objects.all()
 
 
 # Mutation class
@@ -337,4 +582,5 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
-    update_low_stock_products = UpdateLowStockProducts.Field()
\ No newline at end of file
+    update_low_stock_products = UpdateLowStockProducts.Field()
+    adjust_stock = AdjustStock.Field()
\ No newline at end of file
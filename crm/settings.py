@@ -28,6 +28,9 @@ CRM_SETTINGS = {
     'ORDER': {
         'TOTAL_AMOUNT_MAX_DIGITS': 10,
         'TOTAL_AMOUNT_DECIMAL_PLACES': 2,
+        # createOrder fails when a product has fewer units left than ordered;
+        # False accepts such orders and lets live stock go negative
+        'REJECT_INSUFFICIENT_STOCK': True,
     },
 }
 
@@ -35,37 +38,148 @@ CRM_SETTINGS = {
 GRAPHQL_SETTINGS = {
     'PAGINATION_DEFAULT_PAGE_SIZE': 20,
     'PAGINATION_MAX_PAGE_SIZE': 100,
+    'MAX_BATCH_SIZE': 20,  # Operations accepted in one batched (JSON array) request
+    'LIST_PROJECTION': False,  # Resolve plain-column list queries from values_list() rows (crm/projection.py)
+    'STREAM_MIN_ITEMS': 1000,  # Stream responses holding a list this long (None: never stream)
+    'PRODUCT_CACHE_SIZE': 10000,  # Product records cached per process (crm/catalog.py); 0 disables
+    # Connection totalCount (see crm/counts.py)
+    'APPROXIMATE_COUNTS': False,  # Forward pages skip COUNT(*); totalCount is estimated or cached
+    'COUNT_CACHE_TTL': 60,  # Seconds a counted totalCount is reused for the same filters
+    'EXACT_COUNT_THRESHOLD': 10000,  # Postgres: count exactly below this planner estimate
+    # Shared client used by cron jobs and Celery tasks (see crm/graphql_client.py)
+    'CLIENT_TIMEOUT': 10,  # Seconds per request
+    'CLIENT_RETRIES': 3,  # Retries on connection errors, and on 429/5xx responses to queries (not mutations)
+    'CLIENT_BACKOFF_FACTOR': 0.5,  # Sleep backoff * 2**attempt between retries
+    'CLIENT_POOL_SIZE': 10,  # Keep-alive connections per process
 }
 
 # Cron Job Settings
 # Note: CRONJOBS configuration is in alx_backend_graphql_crm/settings.py
 # The cron jobs are:
-# - log_crm_heartbeat: Runs every 5 minutes
 # - update_low_stock: Runs every 12 hours (0 */12 * * *)
 # 
 # Celery Beat Schedule
 # Note: CELERY_BEAT_SCHEDULE is configured in alx_backend_graphql_crm/settings.py
 # django_celery_beat must be in INSTALLED_APPS for Celery Beat to work
-# The scheduled task is:
+# The scheduled tasks are:
 # - generate_crm_report: Runs every Monday at 6:00 AM
+# - refresh_sales_rollups: Runs every 15 minutes
+# - record_heartbeat: Runs every 5 minutes (replaces the log_crm_heartbeat cron job)
+# - purge_archived_customers: Runs daily at 3:30 AM (see crm/retention.py)
+# - relay_change_events: Runs every minute (publishes the change outbox, see crm/outbox.py)
+# - compact_stock_ledger: Runs every hour
 CRON_SETTINGS = {
     'HEARTBEAT_LOG_FILE': '/tmp/crm_heartbeat_log.txt',
     'CUSTOMER_CLEANUP_LOG_FILE': '/tmp/customer_cleanup_log.txt',
     'ORDER_REMINDERS_LOG_FILE': '/tmp/order_reminders_log.txt',
     'LOW_STOCK_UPDATES_LOG_FILE': '/tmp/low_stock_updates_log.txt',
+    'CRM_REPORT_LOG_FILE': '/tmp/crm_report_log.txt',
+    'CRM_REPORT_FILE': '/tmp/crm_report.json',  # Latest report, replaced atomically
+    'REPORT_CHUNK_SIZE': 50000,  # Order ids per generate_crm_report_chunk task
+    'SALES_ROLLUPS_LOG_FILE': '/tmp/crm_rollups_log.txt',
+    'STOCK_COMPACTION_LOG_FILE': '/tmp/stock_compaction_log.txt',
+    'CHANGE_RELAY_LOG_FILE': '/tmp/crm_change_relay_log.txt',
+    'LOG_MAX_BYTES': 10 * 1024 * 1024,  # Rotate job logs (see crm/joblog.py) past this size
+    'LOG_BACKUP_COUNT': 5,  # Rotated job log files to keep (file.1 ... file.N)
     'INACTIVE_CUSTOMER_DAYS': 365,  # Days before considering customer inactive
+    'CUSTOMER_RETENTION_DAYS': 90,  # Days archived customers are kept before they are purged
+    'CUSTOMER_PURGE_BATCH_SIZE': 500,  # Customers or orders deleted per transaction
+    'CUSTOMER_PURGE_PAUSE_SECONDS': 0.2,  # Pause between purge transactions
     'ORDER_REMINDER_DAYS': 7,  # Days to look back for order reminders
+    'ORDER_REMINDER_BATCH_SIZE': 1000,  # Orders per send_order_reminder_batch task
     'LOW_STOCK_THRESHOLD': 10,  # Stock level threshold for low stock alerts
     'STOCK_INCREMENT': 10,  # Amount to increment stock when restocking
+    'STOCK_COMPACTION_BATCH_SIZE': 10000,  # Ledger movements folded per transaction
+    'ROLLUP_BATCH_SIZE': 10000,  # Orders folded into the sales rollups per transaction
+    'ROLLUP_SETTLE_SECONDS': 60,  # Orders younger than this wait for the next rollup run
     'DJANGO_CRONTAB_ENABLED': True,  # Flag to indicate django_crontab is configured
 }
 
+# Health Check Settings (see crm/health.py)
+HEALTH_SETTINGS = {
+    'CHECKS': ['database', 'broker', 'migrations', 'celery'],  # Checks behind /readyz
+    'CACHE_TTL': 10,  # Seconds a /readyz result is served from memory
+    'CHECK_TIMEOUT': 1.0,  # Seconds allowed for broker connection and worker ping
+    'HISTORY_DAYS': 7,  # Days of heartbeat latency samples to keep
+    # The 'heartbeat' check (not run by default) fails when record_heartbeat is older than this
+    'HEARTBEAT_MAX_AGE': 15 * 60,
+}
+
+# Celery worker profiles, selected with CRM_WORKER_PROFILE (see crm/celery.py).
+# Queues and routes are in the Django settings (CELERY_TASK_QUEUES/ROUTES).
+WORKER_PROFILES = {
+    # Long, CPU/DB-heavy tasks: few processes, one task reserved at a time
+    'reports': {'queues': ['reports'], 'concurrency': 2, 'prefetch_multiplier': 1},
+    'imports': {'queues': ['imports'], 'concurrency': 2, 'prefetch_multiplier': 1},
+    # Short I/O-bound tasks: more processes and a deeper prefetch
+    'notifications': {'queues': ['notifications'], 'concurrency': 8, 'prefetch_multiplier': 4},
+    'default': {'queues': ['default'], 'concurrency': 4, 'prefetch_multiplier': 1},
+    # Everything in one worker, for development
+    'all': {'queues': ['default', 'reports', 'imports', 'notifications'], 'concurrency': 4, 'prefetch_multiplier': 1},
+}
+
+# Order archival (see crm/archive.py and `manage.py archive_orders`)
+ARCHIVE_SETTINGS = {
+    'HOT_MONTHS': 12,  # Months of orders kept in the Order table, including the current one
+    'DIR': '/tmp/crm_order_archive',  # Where archived months are exported
+    'FORMAT': 'ndjson',  # Export format: 'ndjson' (gzip) or 'parquet' (needs pyarrow)
+    'BATCH_SIZE': 1000,  # Orders moved to the archive per transaction
+}
+
+# Read replica routing (replicas are listed in DATABASE_REPLICAS)
+DB_ROUTING_SETTINGS = {
+    'GRAPHQL_PATH': '/graphql',  # Requests routed by GraphQL operation type
+    'STICKY_PRIMARY_SECONDS': 5,  # Reads stay on the primary this long after a mutation
+    'STICKY_COOKIE': 'crm_primary_until',  # Cookie carrying the sticky deadline
+}
+
+# Per-client rate limiting of /graphql by query complexity (see crm/ratelimit.py)
+RATE_LIMIT_SETTINGS = {
+    'ENABLED': True,
+    'CAPACITY': 100000,  # Bucket size: the most complexity a client can spend in a burst
+    'REFILL_PER_SECOND': 2000,  # Complexity points returned to every bucket per second
+    # Rows assumed per parent for a nested connection without first/last
+    # (e.g. the products of each order)
+    'NESTED_PAGE_SIZE': 10,
+    'API_KEY_HEADER': 'X-Api-Key',  # Clients sending this header are limited per key, others per IP
+    'TRUST_X_FORWARDED_FOR': False,  # Key by the first X-Forwarded-For address (behind a proxy only)
+    'REDIS_URL': None,  # e.g. 'redis://localhost:6379/1' to share buckets across processes
+    'KEY_PREFIX': 'crm:ratelimit:',  # Redis key prefix
+}
+
+# Change feed: the ChangeEvent outbox, the changesSince query and the
+# Redis stream relay (see crm/outbox.py)
+CHANGE_FEED_SETTINGS = {
+    'DEFAULT_LIMIT': 100,  # Events per changesSince page
+    'MAX_LIMIT': 1000,
+    # changesSince and the relay leave out events younger than this, so a
+    # transaction that commits a lower id late is not skipped by a consumer's
+    # cursor. It must exceed the longest gap between recording events and
+    # committing them: writers record events last (see crm/outbox.py), so the
+    # gap is the commit itself
+    'SETTLE_SECONDS': 5,
+    'REDIS_URL': None,  # e.g. 'redis://localhost:6379/2'; the relay does nothing without it
+    'STREAM': 'crm:changes',  # Redis stream the relay publishes to
+    'STREAM_MAXLEN': 1000000,  # Approximate length the stream is trimmed to
+    'RELAY_BATCH_SIZE': 500,  # Events published per transaction
+    'RETENTION_DAYS': 7,  # Events are deleted after this long (once published, with a REDIS_URL)
+}
+
 # Validation Settings
 VALIDATION_SETTINGS = {
+    # Accepted phone formats (compiled once by crm/validation.py)
     'PHONE_PATTERNS': [
         r'^\+\d{10,15}$',  # International format: +1234567890
         r'^\d{3}-\d{3}-\d{4}$',  # US format: 123-456-7890
     ],
+    'PHONE_ERROR': "Phone must be in format +1234567890 or 123-456-7890",
+    'DEFAULT_COUNTRY_CODE': '1',  # Prefixed to national numbers when normalizing to E.164
+    'EMAIL_PATTERN': (
+        r"^[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]+@"
+        r"[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?"
+        r"(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?)+$"
+    ),
+    'EMAIL_ERROR': "Invalid email format",
     'LOW_STOCK_THRESHOLD': 10,  # Products with stock below this are considered low stock
 }
 
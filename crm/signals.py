@@ -0,0 +1,103 @@
+"""
+Signal handlers for CRM application
+Keep the CustomerStats rollup in step with Customer and Order writes,
+correct the sales rollups when folded orders change, and invalidate the
+product cache (crm/catalog.py) on Product writes.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import catalog, rollups
+from .models import Customer, CustomerStats, Order, Product
+
+_stats_paused = ContextVar('crm_stats_paused', default=False)
+
+
+@contextmanager
+def stats_updates_paused():
+    """
+    Leave CustomerStats and the sales rollups alone for order deletes in
+    this block (archiving moves orders; purging reconciles by itself)
+    """
+    token = _stats_paused.set(True)
+    try:
+        yield
+    finally:
+        _stats_paused.reset(token)
+
+
+def _day(value):
+    # The calendar day TruncDate puts an order in
+    return timezone.localtime(value).date()
+
+
+@receiver(post_save, sender=Customer)
+def create_customer_stats(sender, instance, created, raw=False, **kwargs):
+    """Give every new customer an empty stats row"""
+    if created and not raw:
+        CustomerStats.objects.ensure(instance.pk)
+
+
+@receiver(pre_save, sender=Order)
+def remember_stored_order(sender, instance, raw=False, **kwargs):
+    """Note the stored customer and date of an edited order, in case they change"""
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._stored_order = Order.objects.filter(pk=instance.pk).values_list('customer_id', 'order_date').first()
+
+
+@receiver(post_save, sender=Order)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Fold new orders into CustomerStats; on edits recompute the customer(s)
+    and the sales rollup day(s) of the order
+    """
+    if raw:
+        return
+    if created:
+        # Its products are set next; the sales rollups fold it in later
+        instance._rollup_new = True
+        CustomerStats.objects.record_order(instance)
+        return
+    customer_ids, days = {instance.customer_id}, {_day(instance.order_date)}
+    stored = getattr(instance, '_stored_order', None)
+    if stored is not None:
+        customer_ids.add(stored[0])
+        days.add(_day(stored[1]))
+    CustomerStats.objects.refresh(list(customer_ids))
+    rollups.reconcile_on_commit(instance.pk, days)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def update_rollups_on_products_change(sender, instance, action, reverse, **kwargs):
+    """Recompute the product sales of an existing order's day when its products change"""
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if getattr(instance, '_rollup_new', False):
+        return
+    rollups.reconcile_on_commit(instance.pk, [_day(instance.order_date)])
+
+
+@receiver(post_delete, sender=Order)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    """Remove deleted orders from CustomerStats and the sales rollups"""
+    if _stats_paused.get():
+        return
+    CustomerStats.objects.forget_order(instance)
+    rollups.reconcile_on_commit(instance.pk, [_day(instance.order_date)])
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_cache_on_save(sender, instance, created, raw=False, **kwargs):
+    """Changed products invalidate cached records; new ones are loaded on first use"""
+    if not created and not raw:
+        catalog.bump_version()
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache_on_delete(sender, instance, **kwargs):
+    catalog.bump_version()
@@ -0,0 +1,170 @@
+"""
+Stock ledger for CRM application
+Stock changes are appended to StockMovement rather than written to the
+Product row, so restocks never contend on a hot row, and orders and
+decrements only lock their products to check the level. The live level is the Product.stock snapshot plus unfolded movements
+(Product.objects.with_current_stock()); compact_movements() periodically
+folds movements into the snapshot.
+"""
+from collections import Counter, OrderedDict
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import Product, StockMovement
+from .settings import CRM_SETTINGS, CRON_SETTINGS
+
+
+def merge_deltas(deltas):
+    """Sum (product_id, delta) pairs per product, preserving first-seen order"""
+    merged = OrderedDict()
+    for product_id, delta in deltas:
+        merged[product_id] = merged.get(product_id, 0) + delta
+    return merged
+
+
+def current_stock(product):
+    """Live stock level for a single product"""
+    return Product.objects.with_current_stock().values_list(
+        'current_stock', flat=True
+    ).get(pk=product.pk)
+
+
+def adjust_stock(deltas):
+    """
+    Record {product_id: delta} adjustments in one transaction. A delta that
+    would take a product's live stock below zero is not recorded. Products
+    receiving a negative delta are row-locked for the check so concurrent
+    decrements cannot both pass it; increments only insert.
+
+    Returns (applied, rejected, missing): the adjusted Products annotated with
+    their new `current_stock`, the Products whose delta was rejected, and
+    ids that do not exist.
+    """
+    product_ids = list(deltas)
+    with transaction.atomic():
+        decreasing = [product_id for product_id in product_ids if deltas[product_id] < 0]
+        if decreasing:
+            list(
+                Product.objects.select_for_update()
+                .filter(pk__in=decreasing)
+                .order_by('pk')
+                .values_list('pk', flat=True)
+            )
+        levels = dict(
+            Product.objects.with_current_stock()
+            .filter(pk__in=decreasing)
+            .values_list('pk', 'current_stock')
+        )
+        existing = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+
+        movements, rejected_ids, missing = [], [], []
+        for product_id in product_ids:
+            delta = deltas[product_id]
+            if product_id not in existing:
+                missing.append(product_id)
+            elif delta < 0 and levels[product_id] + delta < 0:
+                rejected_ids.append(product_id)
+            elif delta:
+                movements.append(StockMovement(
+                    product_id=product_id, quantity=delta, kind=StockMovement.ADJUSTMENT
+                ))
+        StockMovement.objects.bulk_create(movements)
+
+        products = Product.objects.with_current_stock().in_bulk(
+            [product_id for product_id in product_ids if product_id in existing]
+        )
+
+    applied = [products[product_id] for product_id in product_ids
+               if product_id in products and product_id not in rejected_ids]
+    rejected = [products[product_id] for product_id in rejected_ids]
+    return applied, rejected, missing
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def reserve_for_order(order, products):
+    """
+    Record one reservation movement per product line of a new order. With
+    CRM_SETTINGS['ORDER']['REJECT_INSUFFICIENT_STOCK'] on, the products are
+    row-locked while their live stock is checked, as in adjust_stock(), so
+    concurrent orders cannot oversell; raises InsufficientStock (call inside
+    the order's transaction, which it should roll back) when a product has
+    fewer units left than ordered.
+    """
+    counts = Counter(product.pk for product in products)
+    if CRM_SETTINGS['ORDER']['REJECT_INSUFFICIENT_STOCK']:
+        list(
+            Product.objects.select_for_update()
+            .filter(pk__in=counts)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        levels = dict(
+            Product.objects.with_current_stock()
+            .filter(pk__in=counts)
+            .values_list('pk', 'current_stock')
+        )
+        for product_id, count in counts.items():
+            if levels.get(product_id, 0) < count:
+                raise InsufficientStock(
+                    f"Insufficient stock for product ID {product_id}: "
+                    f"{levels.get(product_id, 0)} left, {count} ordered"
+                )
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=product_id, quantity=-count, kind=StockMovement.RESERVATION, order=order)
+        for product_id, count in counts.items()
+    ])
+
+
+def restock_low_stock(threshold, increment):
+    """
+    Record a restock movement for every product whose live stock is below
+    `threshold`. Returns the restocked Products annotated with their new
+    `current_stock`.
+    """
+    with transaction.atomic():
+        low_ids = list(
+            Product.objects.with_current_stock()
+            .filter(current_stock__lt=threshold)
+            .values_list('pk', flat=True)
+        )
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=product_id, quantity=increment, kind=StockMovement.RESTOCK)
+            for product_id in low_ids
+        ])
+        return list(Product.objects.with_current_stock().filter(pk__in=low_ids))
+
+
+def compact_movements(batch_size=None):
+    """
+    Fold unfolded movements into the Product.stock snapshots, one batch per
+    transaction. The movements stay in the ledger flagged as folded. Returns
+    the number of movements folded.
+    """
+    if batch_size is None:
+        batch_size = CRON_SETTINGS['STOCK_COMPACTION_BATCH_SIZE']
+    folded = 0
+    while True:
+        with transaction.atomic():
+            # Lock the batch so concurrent compactions cannot fold it twice
+            ids = list(
+                StockMovement.objects.select_for_update()
+                .filter(folded=False)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return folded
+            totals = (
+                StockMovement.objects.filter(pk__in=ids)
+                .order_by()
+                .values('product_id')
+                .annotate(total=Sum('quantity'))
+            )
+            for row in totals:
+                Product.objects.filter(pk=row['product_id']).update(stock=F('stock') + row['total'])
+            StockMovement.objects.filter(pk__in=ids).update(folded=True)
+            folded += len(ids)
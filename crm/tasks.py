@@ -1,87 +1,187 @@
 """
 Celery tasks for CRM application
 """
-import requests
-from celery import shared_task
-from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from celery import chord, shared_task
+from datetime import timedelta
+from django.utils import timezone
+
+from . import health, outbox, reminders, reports, retention, rollups, stock
+# shared_task binds to the current app: importing the tasks configures ours
+from .celery import app  # noqa: F401
+from .joblog import job_log
+from .models import HealthCheckSample
+from .settings import CRON_SETTINGS, HEALTH_SETTINGS
+
+
+@shared_task
+def generate_crm_report(run_key=None, chunk_size=None):
+    """
+    Generate the weekly CRM report (customers, orders, revenue) as a chord
+    of generate_crm_report_chunk tasks over order id ranges, merged by
+    finalize_crm_report. Runs are keyed by date: re-running the same key
+    only computes the missing chunks, and a finished run is not redone.
+    """
+    run, pending = reports.start_run(run_key or timezone.localdate().isoformat(), chunk_size)
+    if run.finished_at:
+        return reports.result(run)
+    if not pending:
+        return finalize_crm_report([], run.pk)
+
+    chord(generate_crm_report_chunk.s(chunk_id) for chunk_id in pending)(
+        finalize_crm_report.s(run.pk)
+    )
+    return {'run': run.key, 'chunks': len(pending)}
+
+
+# Chord header: keeps its result for finalize_crm_report
+@shared_task(bind=True, max_retries=3, default_retry_delay=30, ignore_result=False)
+def generate_crm_report_chunk(self, chunk_id):
+    """Aggregate one order id range of a report run (checkpointed in the DB)"""
+    try:
+        return reports.compute_chunk(chunk_id).pk
+    except Exception as exc:
+        raise self.retry(exc=exc)
 
 
 @shared_task
-def generate_crm_report():
+def finalize_crm_report(chunk_ids, run_id):
+    """Merge the chunk totals, write the JSON report and log the report line"""
+    with job_log('crm_report') as log:
+        data, finished_now = reports.finish_run(run_id)
+        if finished_now:
+            log.info(
+                f"Report: {data['customers']} customers, "
+                f"{data['orders']} orders, {data['revenue']} revenue",
+                customers=data['customers'],
+                orders=data['orders'],
+                revenue=data['revenue'],
+                run=data['run'],
+            )
+        else:
+            log.info(f"Report {data['run']} was already written", run=data['run'])
+    return data
+
+
+@shared_task
+def refresh_sales_rollups():
+    """
+    Fold orders created since the last run into the daily revenue and
+    product sales rollups.
+    """
+    with job_log('sales_rollups') as log:
+        processed = rollups.refresh_sales_rollups()
+        log.info(f"Rollups refreshed: {processed} new orders", orders=processed)
+    return {'orders': processed}
+
+
+@shared_task
+def compact_stock_ledger():
+    """Fold unfolded StockMovement entries into the product stock snapshots"""
+    with job_log('stock_compaction') as log:
+        folded = stock.compact_movements()
+        log.info(f"Stock ledger compacted: {folded} movements folded", movements=folded)
+    return {'movements': folded}
+
+
+@shared_task
+def send_order_reminders(days=None, batch_size=None):
+    """
+    Fan out reminders for orders from the last `days` days: page through
+    the orders by primary key and dispatch one send_order_reminder_batch
+    task per page, summarised by finalize_order_reminders.
+    """
+    days = CRON_SETTINGS['ORDER_REMINDER_DAYS'] if days is None else days
+    batch_size = batch_size or CRON_SETTINGS['ORDER_REMINDER_BATCH_SIZE']
+    since = timezone.now() - timedelta(days=days)
+    reminder_date = timezone.localdate().isoformat()
+
+    batches = [
+        send_order_reminder_batch.s(first_id, last_id, since.isoformat(), reminder_date)
+        for first_id, last_id in reminders.iter_order_id_ranges(since, batch_size)
+    ]
+    if not batches:
+        finalize_order_reminders([], days)
+        return 0
+
+    chord(batches)(finalize_order_reminders.s(days))
+    return len(batches)
+
+
+# Chord header: keeps its result for finalize_order_reminders
+@shared_task(bind=True, max_retries=3, default_retry_delay=30, ignore_result=False)
+def send_order_reminder_batch(self, first_id, last_id, since, reminder_date):
     """
-    Generate a weekly CRM report using GraphQL queries.
-    Fetches total customers, orders, and revenue.
+    Send reminders for one page of orders. Safe to retry: orders already
+    reminded on `reminder_date` are skipped.
     """
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    log_file = '/tmp/crm_report_log.txt'
-    
     try:
-        # Create GraphQL client
-        graphql_endpoint = "http://localhost:8000/graphql"
-        transport = RequestsHTTPTransport(url=graphql_endpoint)
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        
-        # GraphQL query to get total customers
-        customers_query = gql("""
-            query {
-                customers {
-                    id
-                }
-            }
-        """)
-        
-        # GraphQL query to get total orders and revenue
-        orders_query = gql("""
-            query {
-                orders {
-                    id
-                    totalAmount
-                }
-            }
-        """)
-        
-        # Execute queries
-        customers_result = client.execute(customers_query)
-        orders_result = client.execute(orders_query)
-        
-        # Extract data
-        customers = customers_result.get('customers', [])
-        orders = orders_result.get('orders', [])
-        
-        total_customers = len(customers)
-        total_orders = len(orders)
-        
-        # Calculate total revenue
-        total_revenue = sum(
-            float(order.get('totalAmount', 0)) 
-            for order in orders 
-            if order.get('totalAmount')
-        )
-        
-        # Format revenue to 2 decimal places
-        total_revenue_formatted = f"{total_revenue:.2f}"
-        
-        # Create report message
-        report_message = (
-            f"{timestamp} - Report: {total_customers} customers, "
-            f"{total_orders} orders, {total_revenue_formatted} revenue\n"
-        )
-        
-        # Log to file
-        with open(log_file, 'a') as f:
-            f.write(report_message)
-        
-        return {
-            'customers': total_customers,
-            'orders': total_orders,
-            'revenue': total_revenue
-        }
-        
-    except Exception as e:
-        # Log error
-        error_message = f"{timestamp} - Error generating CRM report: {str(e)}\n"
-        with open(log_file, 'a') as f:
-            f.write(error_message)
-        raise
+        return reminders.send_batch(first_id, last_id, since, reminder_date)
+    except Exception as exc:
+        raise self.retry(exc=exc)
+
+
+@shared_task
+def finalize_order_reminders(sent_counts, days):
+    """Log a summary line once every reminder batch has completed"""
+    total = sum(sent_counts)
+    with job_log('order_reminders') as log:
+        if sent_counts:
+            log.info(
+                f"Order reminders processed: {total} sent in {len(sent_counts)} batch(es)",
+                sent=total,
+                batches=len(sent_counts),
+            )
+        else:
+            log.info(f"No orders found in the last {days} days")
+    return total
+
+
+@shared_task
+def record_heartbeat():
+    """
+    Run the readiness checks in-process, log a heartbeat and record each
+    check's latency in HealthCheckSample, pruning samples past the
+    retention window.
+    """
+    results = health.run_checks()
+    with job_log('heartbeat') as log:
+        log.info("CRM is alive", checks=results)
+        for name, result in results.items():
+            if not result['ok']:
+                log.error(f"Health check failed: {name}", error=result['error'])
+
+    HealthCheckSample.objects.bulk_create([
+        HealthCheckSample(name=name, ok=result['ok'], latency_ms=result['latency_ms'], error=result['error'])
+        for name, result in results.items()
+    ])
+    cutoff = timezone.now() - timedelta(days=HEALTH_SETTINGS['HISTORY_DAYS'])
+    HealthCheckSample.objects.filter(created_at__lt=cutoff).delete()
+    return results
+
+
+@shared_task
+def relay_change_events():
+    """
+    Publish the change outbox to the Redis stream (when CHANGE_FEED_SETTINGS
+    has a REDIS_URL) and delete events past the retention window (see
+    outbox.prune()).
+    `manage.py relay_changes` does the same continuously.
+    """
+    publisher = outbox.get_publisher()
+    with job_log('change_relay') as log:
+        published = outbox.relay(publisher) if publisher is not None else 0
+        pruned = outbox.prune()
+        log.info(f"Change events: {published} published, {pruned} pruned", published=published, pruned=pruned)
+    return {'published': published, 'pruned': pruned}
+
+
+@shared_task
+def purge_archived_customers():
+    """
+    Delete customers archived longer than the retention period, with their
+    orders, in throttled batches (see crm/retention.py)
+    """
+    with job_log('customer_cleanup') as log:
+        customers, orders = retention.purge_archived_customers()
+        log.info(f"Purged {customers} archived customer(s) and {orders} order(s)", customers=customers, orders=orders)
+    return {'customers': customers, 'orders': orders}
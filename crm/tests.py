@@ -1,3 +1,1077 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from alx_backend_graphql_crm.schema import schema
+from . import archive, catalog, encoding, graphql_client, health, joblog, outbox, ratelimit, reports, retention, rollups, validation
+from .celery import app as celery_app
+from .middleware import HealthCheckMiddleware, RateLimitMiddleware, ReplicaRoutingMiddleware
+from .models import (
+    ArchivedOrder, ChangeEvent, Customer, CustomerStats, DailyProductSales, DailyRevenue, HealthCheckSample, Order,
+    OrderReminder, Product, ReportRun, RollupWatermark, StockMovement,
+)
+from .routers import ReplicaRouter
+from .settings import (
+    CHANGE_FEED_SETTINGS, CRM_SETTINGS, CRON_SETTINGS, DB_ROUTING_SETTINGS, GRAPHQL_SETTINGS, HEALTH_SETTINGS, RATE_LIMIT_SETTINGS,
+)
+from .stock import compact_movements, current_stock
+from .tasks import generate_crm_report, record_heartbeat, relay_change_events, send_order_reminder_batch, send_order_reminders
+
+# Celery configuration of the test classes that run tasks (EagerCeleryMixin)
+EAGER_CELERY = {
+    'broker_url': 'memory://',
+    'result_backend': 'cache+memory://',
+    'task_always_eager': True,
+    'task_eager_propagates': True,
+}
+
+
+class EagerCeleryMixin:
+    """Run tasks eagerly against Celery's in-memory broker and result backend"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        previous = {key: celery_app.conf[key] for key in EAGER_CELERY}
+        celery_app.conf.update(EAGER_CELERY)
+        cls.addClassCleanup(celery_app.conf.update, previous)
+
+
+ADJUST_STOCK = """
+    mutation AdjustStock($deltas: [StockDeltaInput]!) {
+        adjustStock(deltas: $deltas) {
+            products { id stock }
+            errors
+        }
+    }
+"""
+
+
+class AdjustStockTests(TestCase):
+    def setUp(self):
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        self.mouse = Product.objects.create(name='Mouse', price=Decimal('29.99'), stock=1)
+
+    def adjust(self, deltas):
+        result = schema.execute(ADJUST_STOCK, variables={'deltas': deltas})
+        self.assertIsNone(result.errors)
+        return result.data['adjustStock']
+
+    def test_applies_and_merges_deltas(self):
+        data = self.adjust([
+            {'productId': self.laptop.id, 'delta': 3},
+            {'productId': self.laptop.id, 'delta': -1},
+            {'productId': self.mouse.id, 'delta': 4},
+        ])
+        self.assertEqual(data['errors'], [])
+        self.assertEqual(current_stock(self.laptop), 7)
+        self.assertEqual(current_stock(self.mouse), 5)
+        self.assertEqual({p['stock'] for p in data['products']}, {7, 5})
+
+    def test_rejects_negative_stock_and_unknown_products(self):
+        data = self.adjust([
+            {'productId': self.laptop.id, 'delta': -2},
+            {'productId': self.mouse.id, 'delta': -2},
+            {'productId': 999999, 'delta': 1},
+        ])
+        self.assertEqual(len(data['errors']), 2)
+        self.assertEqual(len(data['products']), 1)
+        self.assertEqual(current_stock(self.laptop), 3)
+        self.assertEqual(current_stock(self.mouse), 1)
+
+    def test_adjustments_are_ledger_entries_until_compacted(self):
+        self.adjust([{'productId': self.laptop.id, 'delta': -4}])
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.stock, 5)
+        self.assertEqual(StockMovement.objects.filter(product=self.laptop, folded=False).count(), 1)
+
+        self.assertEqual(compact_movements(), 1)
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.stock, 1)
+        self.assertEqual(current_stock(self.laptop), 1)
+        self.assertFalse(StockMovement.objects.filter(folded=False).exists())
+
+    def test_low_stock_filter_reads_live_stock(self):
+        self.adjust([{'productId': self.laptop.id, 'delta': 10}])
+        result = schema.execute('{ allProducts(lowStock: true) { edges { node { name stock } } } }')
+        self.assertIsNone(result.errors)
+        nodes = [edge['node'] for edge in result.data['allProducts']['edges']]
+        self.assertEqual(nodes, [{'name': 'Mouse', 'stock': 1}])
+
+    def test_orders_cannot_oversell(self):
+        customer = Customer.objects.create(name='Olga', email='olga@example.com')
+        order = """mutation { createOrder(input: {customerId: "%s", productIds: [%s]}) { order { id } } }"""
+        result = schema.execute(order % (customer.pk, ', '.join(['"%s"' % self.mouse.pk] * 2)))
+        self.assertIn('Insufficient stock', result.errors[0].message)
+        self.assertIsNone(schema.execute(order % (customer.pk, '"%s"' % self.mouse.pk)).errors)
+        result = schema.execute(order % (customer.pk, '"%s"' % self.mouse.pk))
+        self.assertIn('0 left, 1 ordered', result.errors[0].message)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(current_stock(self.mouse), 0)
+
+        with mock.patch.dict(CRM_SETTINGS['ORDER'], {'REJECT_INSUFFICIENT_STOCK': False}):
+            self.assertIsNone(schema.execute(order % (customer.pk, '"%s"' % self.mouse.pk)).errors)
+        self.assertEqual(current_stock(self.mouse), -1)
+
+    def test_new_and_best_selling_products_read_stock_without_the_ledger(self):
+        with self.assertNumQueries(4):  # savepoint, insert, change event, release
+            result = schema.execute('mutation { createProduct(input: {name: "Pad", price: "2.00"}) { product { stock } } }')
+        self.assertEqual(result.data['createProduct']['product']['stock'], CRM_SETTINGS['PRODUCT']['DEFAULT_STOCK'])
+
+        customer = Customer.objects.create(name='Pia', email='pia@example.com')
+        for product in (self.laptop, self.mouse):
+            order = Order.objects.create(customer=customer, total_amount=product.price)
+            order.products.add(product)
+            Order.objects.filter(pk=order.pk).update(created_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+        rollups.refresh_sales_rollups()
+        today = datetime.now(timezone.utc).date().isoformat()
+        with self.assertNumQueries(2):  # rollup rows, products with their live stock
+            result = schema.execute(
+                '{ productSales(from: "%s", to: "%s") { units product { name stock } } }' % (today, today)
+            )
+        self.assertIsNone(result.errors)
+        self.assertEqual({row['product']['name']: row['product']['stock'] for row in result.data['productSales']},
+                         {'Laptop': 5, 'Mouse': 1})
+
+
+class AdjustStockConcurrencyTests(TransactionTestCase):
+    def test_parallel_workers_do_not_lose_updates(self):
+        product = Product.objects.create(name='Webcam', price=Decimal('49.99'), stock=0)
+        workers, rounds = 8, 25
+
+        def worker(_):
+            try:
+                for _ in range(rounds):
+                    result = schema.execute(
+                        ADJUST_STOCK,
+                        variables={'deltas': [{'productId': product.id, 'delta': 1}]},
+                    )
+                    assert result.errors is None, result.errors
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(worker, range(workers)))
+
+        self.assertEqual(current_stock(product), workers * rounds)
+
+    def test_parallel_decrements_cannot_oversell(self):
+        product = Product.objects.create(name='Dock', price=Decimal('89.99'), stock=6)
+        workers = 5
+
+        def worker(_):
+            try:
+                result = schema.execute(ADJUST_STOCK, variables={'deltas': [{'productId': product.id, 'delta': -2}]})
+                assert result.errors is None, result.errors
+                return result.data['adjustStock']
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(worker, range(workers)))
+
+        applied = [data for data in results if not data['errors']]
+        self.assertEqual(len(applied), 3)
+        self.assertTrue(all(data['products'] == [] and len(data['errors']) == 1
+                            for data in results if data['errors']))
+        self.assertEqual(sorted(data['products'][0]['stock'] for data in applied), [0, 2, 4])
+        self.assertEqual(current_stock(product), 0)
+        self.assertFalse(Product.objects.with_current_stock().filter(current_stock__lt=0).exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def route(self, payload, cookies=None):
+        """Return (read alias seen by the view, response) for a /graphql POST"""
+        seen = []
+
+        def view(request):
+            seen.append(ReplicaRouter().db_for_read(Product))
+            return HttpResponse()
+
+        request = RequestFactory().post(
+            '/graphql', data=json.dumps(payload), content_type='application/json'
+        )
+        request.COOKIES.update(cookies or {})
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen[0], response
+
+    def test_queries_read_from_replica(self):
+        alias, response = self.route({'query': '{ allProducts { edges { node { name } } } }'})
+        self.assertEqual(alias, 'replica')
+        self.assertNotIn(DB_ROUTING_SETTINGS['STICKY_COOKIE'], response.cookies)
+
+    def test_mutations_use_primary_and_pin_the_client(self):
+        alias, response = self.route({'query': 'mutation { updateLowStockProducts { message } }'})
+        self.assertEqual(alias, 'default')
+        cookie = response.cookies[DB_ROUTING_SETTINGS['STICKY_COOKIE']]
+
+        alias, _ = self.route({'query': '{ hello }'}, {cookie.key: cookie.value})
+        self.assertEqual(alias, 'default')
+        alias, _ = self.route({'query': '{ hello }'}, {cookie.key: str(time.time() - 1)})
+        self.assertEqual(alias, 'replica')
+
+    def test_operation_name_selects_operation(self):
+        document = 'query Stock { allProducts { totalCount } } mutation Restock { updateLowStockProducts { message } }'
+        self.assertEqual(self.route({'query': document, 'operationName': 'Stock'})[0], 'replica')
+        self.assertEqual(self.route({'query': document, 'operationName': 'Restock'})[0], 'default')
+
+    def test_writes_always_use_primary(self):
+        self.assertEqual(ReplicaRouter().db_for_write(Product), 'default')
+
+
+class RateLimitTests(SimpleTestCase):
+    ORDERS = '{ allOrders(first: 10) { edges { node { id products(first: 5) { edges { node { name } } } } } } }'
+
+    def setUp(self):
+        patchers = [
+            mock.patch.dict(RATE_LIMIT_SETTINGS, {'CAPACITY': 1000, 'REFILL_PER_SECOND': 10, 'REDIS_URL': None}),
+            mock.patch.object(ratelimit, '_store', ratelimit.MemoryStore()),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, payload, **headers):
+        request = RequestFactory().post(
+            '/graphql', data=json.dumps(payload), content_type='application/json', **headers
+        )
+        return RateLimitMiddleware(lambda request: HttpResponse())(request)
+
+    def test_complexity_scales_with_requested_pages(self):
+        self.assertEqual(ratelimit.query_complexity('{ hello }'), 1)
+        # allOrders + 10 * (edges + node + id + products + 5 * (edges + node + name))
+        self.assertEqual(ratelimit.query_complexity(self.ORDERS), 1 + 10 * (4 + 5 * 3))
+        query = 'query ($n: Int) { allOrders(first: $n) { edges { node { ...F } } } } fragment F on OrderType { id }'
+        self.assertEqual(ratelimit.query_complexity(query, {'n': 2}), 1 + 2 * 3)
+        # Connections selecting `edges` through fragments are priced per page too
+        query = '{ allOrders(first: 100) { ...F } } fragment F on OrderTypeConnection { edges { node { id } } }'
+        self.assertEqual(ratelimit.query_complexity(query), 1 + 100 * 3)
+        query = '{ allOrders(first: 100) { ... on OrderTypeConnection { edges { node { id } } } } }'
+        self.assertEqual(ratelimit.query_complexity(query), 1 + 100 * 3)
+
+    def test_expensive_queries_exhaust_the_bucket(self):
+        for _ in range(5):
+            self.assertEqual(self.post({'query': self.ORDERS}).status_code, 200)
+        response = self.post({'query': self.ORDERS})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        error = json.loads(response.content)['errors'][0]
+        self.assertEqual(error['extensions']['code'], 'RATE_LIMITED')
+        # Other clients have their own bucket
+        self.assertEqual(self.post({'query': self.ORDERS}, HTTP_X_API_KEY='partner').status_code, 200)
+
+    def test_queries_larger_than_the_bucket_are_rejected(self):
+        response = self.post({'query': '{ allOrders(first: 100) { edges { node { id } } } }'})
+        self.assertEqual(response.status_code, 200)
+        response = self.post({'query': '{ allCustomers { edges { node { orders { edges { node { id } } } } } } }'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['errors'][0]['extensions']['code'], 'QUERY_TOO_COMPLEX')
+
+
+class RateLimitDefaultsTests(SimpleTestCase):
+    QUERY = '{ allOrders { edges { node { id products { edges { node { name stock } } } } } } }'
+
+    def setUp(self):
+        patcher = mock.patch.object(ratelimit, '_store', ratelimit.MemoryStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_two_level_queries_pass_at_default_settings(self):
+        # A nested connection without first/last is priced at NESTED_PAGE_SIZE rows per parent
+        self.assertEqual(ratelimit.query_complexity(self.QUERY), 1 + 100 * (4 + 10 * 4))
+        self.assertTrue(RATE_LIMIT_SETTINGS['ENABLED'])
+        for _ in range(10):
+            self.assertIsNone(ratelimit.consume('ip:127.0.0.1', ratelimit.query_complexity(self.QUERY)))
+
+
+class BatchedGraphQLTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Gus', email='gus@example.com')
+        self.product = Product.objects.create(name='Lamp', price=Decimal('30.00'), stock=4)
+
+    def post(self, payload):
+        return self.client.post(
+            '/graphql', data=json.dumps(payload), content_type='application/json'
+        )
+
+    def test_batch_shares_lookups_across_operations(self):
+        customer = f'{{ customer(id: {self.customer.pk}) {{ name email }} }}'
+        batch = [{'id': 'a', 'query': customer}, {'id': 'b', 'query': customer}, {'query': '{ hello }'}]
+        with self.assertNumQueries(1):
+            response = self.post(batch)
+        results = response.json()
+        self.assertEqual([result['id'] for result in results], ['a', 'b', None])
+        self.assertEqual(results[1]['data']['customer']['name'], 'Gus')
+        self.assertEqual(results[2]['data'], {'hello': 'Hello, GraphQL!'})
+
+    def test_mutations_invalidate_lookups(self):
+        product = f'{{ product(id: {self.product.pk}) {{ stock }} }}'
+        adjust = {'query': ADJUST_STOCK, 'variables': {'deltas': [{'productId': self.product.pk, 'delta': 3}]}}
+        results = self.post([{'query': product}, adjust, {'query': product}]).json()
+        self.assertEqual(results[0]['data']['product']['stock'], 4)
+        self.assertEqual(results[2]['data']['product']['stock'], 7)
+
+    def test_order_customers_are_loaded_in_one_query(self):
+        for index in range(3):
+            customer = Customer.objects.create(name=f'Buyer {index}', email=f'buyer{index}@example.com')
+            Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+        with self.assertNumQueries(2):  # orders, customers
+            orders = self.post({'query': '{ orders { customer { name } } }'}).json()['data']['orders']
+        self.assertEqual(sorted(order['customer']['name'] for order in orders), ['Buyer 0', 'Buyer 1', 'Buyer 2'])
+        connection = '{ allOrders(first: 10) { edges { node { customer { name } } } } }'
+        with self.assertNumQueries(3):  # count, page, customers
+            edges = self.post({'query': connection}).json()['data']['allOrders']['edges']
+        self.assertEqual(len({edge['node']['customer']['name'] for edge in edges}), 3)
+
+    def test_batch_size_is_limited(self):
+        batch = [{'query': '{ hello }'}] * (GRAPHQL_SETTINGS['MAX_BATCH_SIZE'] + 1)
+        self.assertEqual(self.post(batch).status_code, 400)
+        self.assertEqual(self.post({'query': '{ hello }'}).json(), {'data': {'hello': 'Hello, GraphQL!'}})
+
+
+class JSONEncodingTests(TestCase):
+    def test_streamed_and_buffered_encodings_match(self):
+        value = {
+            'data': {'rows': [{'id': index, 'price': Decimal('9.90'), 'at': datetime(2026, 1, 2, tzinfo=timezone.utc)}
+                              for index in range(50)]},
+        }
+        encoded = encoding.dumps(value)
+        self.assertEqual(json.loads(encoded)['data']['rows'][1]['price'], '9.90')
+        self.assertEqual(json.loads(encoded)['data']['rows'][0]['at'], '2026-01-02T00:00:00+00:00')
+        chunks = list(encoding.iter_dumps(value, min_items=10, chunk_size=256))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(b''.join(chunks)), json.loads(encoded))
+
+    def test_large_lists_are_streamed(self):
+        Customer.objects.bulk_create(Customer(name=f'C{index}', email=f'c{index}@example.com') for index in range(5))
+        with mock.patch.dict(GRAPHQL_SETTINGS, {'STREAM_MIN_ITEMS': 5}):
+            response = self.client.post(
+                '/graphql', data=json.dumps({'query': '{ customers { name } }'}), content_type='application/json'
+            )
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))['data']['customers']), 5)
+
+
+class ListProjectionTests(TestCase):
+    def setUp(self):
+        customer = Customer.objects.create(name='Hal', email='hal@example.com')
+        product = Product.objects.create(name='Desk', price=Decimal('120.00'), stock=2)
+        StockMovement.objects.create(product=product, quantity=3)
+        order = Order.objects.create(customer=customer, total_amount=Decimal('120.00'))
+        order.products.add(product)
+
+    def execute(self, query, projection):
+        with mock.patch.dict(GRAPHQL_SETTINGS, {'LIST_PROJECTION': projection}):
+            result = schema.execute(query)
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_plain_columns_match_the_model_path(self):
+        query = '{ customers { id name email } products { id ...P } orders { id totalAmount orderDate } } ' \
+                'fragment P on ProductType { name price stock }'
+        with self.assertNumQueries(3):
+            projected = self.execute(query, True)
+        self.assertEqual(projected, self.execute(query, False))
+        self.assertEqual(projected['products'][0]['stock'], 5)
+
+    def test_relations_fall_back_to_models(self):
+        query = '{ orders { totalAmount customer { name } } customers { name lifetimeValue } }'
+        data = self.execute(query, True)
+        self.assertEqual(data['orders'][0]['customer']['name'], 'Hal')
+        self.assertEqual(data['customers'][0]['lifetimeValue'], '120.00')
+
+
+class ConnectionAggregatesTests(TestCase):
+    def test_aggregates_cover_the_filtered_set_not_the_page(self):
+        customer = Customer.objects.create(name='Ida', email='ida@example.com')
+        for amount in ('10.00', '20.50', '30.25', '5.00'):
+            Order.objects.create(customer=customer, total_amount=Decimal(amount))
+        query = """{
+            allOrders(first: 1, totalAmount_Gte: 10) {
+                edges { node { totalAmount } }
+                aggregates { count sumTotalAmount avgTotalAmount minTotalAmount maxTotalAmount }
+            }
+        }"""
+        with self.assertNumQueries(3):  # count, page, aggregates
+            result = schema.execute(query)
+        self.assertIsNone(result.errors)
+        connection = result.data['allOrders']
+        self.assertEqual(len(connection['edges']), 1)
+        self.assertEqual(connection['aggregates'], {
+            'count': 3, 'sumTotalAmount': '60.75', 'avgTotalAmount': '20.25',
+            'minTotalAmount': '10.00', 'maxTotalAmount': '30.25',
+        })
+
+
+class ApproximateCountTests(TestCase):
+    QUERY = """query Customers($after: String) {
+        allCustomers(first: 2, after: $after) { %s edges { node { name } } pageInfo { hasNextPage endCursor } }
+    }"""
+
+    def setUp(self):
+        cache.clear()
+        for index in range(5):
+            Customer.objects.create(name=f'Customer {index}', email=f'customer{index}@example.com')
+        patcher = mock.patch.dict(GRAPHQL_SETTINGS, {'APPROXIMATE_COUNTS': True})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute(self, fields='', after=None):
+        result = schema.execute(self.QUERY % fields, variables={'after': after})
+        self.assertIsNone(result.errors)
+        return result.data['allCustomers']
+
+    def test_pages_without_counting_and_caches_total_count(self):
+        with self.assertNumQueries(1):  # the page (one row over) only
+            page = self.execute()
+        self.assertEqual(len(page['edges']), 2)
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+
+        with self.assertNumQueries(2):  # page, count
+            page = self.execute('totalCount isExact')
+        self.assertEqual((page['totalCount'], page['isExact']), (5, True))
+
+        Customer.objects.create(name='Late', email='late@example.com')
+        with self.assertNumQueries(1):  # cached count
+            page = self.execute('totalCount isExact')
+        self.assertEqual((page['totalCount'], page['isExact']), (5, False))
+
+    def test_last_page_knows_its_total(self):
+        first = self.execute()
+        second = self.execute(after=first['pageInfo']['endCursor'])
+        with self.assertNumQueries(1):
+            last = self.execute('totalCount isExact', after=second['pageInfo']['endCursor'])
+        self.assertEqual(len(last['edges']), 1)
+        self.assertFalse(last['pageInfo']['hasNextPage'])
+        self.assertEqual((last['totalCount'], last['isExact']), (5, True))
+
+
+class ChangeFeedTests(TestCase):
+    FEED = """query Feed($cursor: String, $limit: Int) {
+        changesSince(cursor: $cursor, limit: $limit) {
+            events { cursor entity entityId action payload } cursor hasMore
+        }
+    }"""
+
+    def setUp(self):
+        patcher = mock.patch.dict(CHANGE_FEED_SETTINGS, {'SETTLE_SECONDS': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute(self, query, **variables):
+        result = schema.execute(query, variables=variables)
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_mutations_feed_changes_since_and_the_relay(self):
+        self.execute('mutation { createCustomer(input: {name: "Eve", email: "eve@example.com"}) { message } }')
+        self.execute('mutation { createProduct(input: {name: "Pen", price: "1.50", stock: 3}) { product { id } } }')
+        customer_pk = Customer.objects.get().pk
+        product_pk = Product.objects.get().pk
+        self.execute(f'mutation {{ createOrder(input: {{customerId: "{customer_pk}", productIds: ["{product_pk}"]}}) '
+                     '{ order { id } } }')
+
+        first = self.execute(self.FEED, limit=2)['changesSince']
+        self.assertEqual([(event['entity'], event['action']) for event in first['events']],
+                         [('customer', 'created'), ('product', 'created')])
+        self.assertTrue(first['hasMore'])
+        self.assertEqual(first['events'][1]['payload']['price'], '1.50')
+
+        rest = self.execute(self.FEED, cursor=first['cursor'])['changesSince']
+        self.assertEqual(len(rest['events']), 1)
+        self.assertEqual(rest['events'][0]['payload']['product_ids'], [product_pk])
+        self.assertFalse(rest['hasMore'])
+        self.assertEqual(self.execute(self.FEED, cursor=rest['cursor'])['changesSince']['events'], [])
+
+        publisher = outbox.MemoryStreamPublisher()
+        self.assertEqual(outbox.relay(publisher, batch_size=2), 3)
+        self.assertEqual(outbox.relay(publisher), 0)
+        self.assertEqual([entry['entity'] for entry in publisher.entries], ['customer', 'product', 'order'])
+        self.assertEqual(json.loads(publisher.entries[0]['payload'])['email'], 'eve@example.com')
+
+    def test_relay_task_without_redis_prunes_by_age(self):
+        customer = Customer.objects.create(name='Old', email='old@example.com')
+        outbox.record(customer)
+        outbox.record(customer, ChangeEvent.UPDATED)
+        ChangeEvent.objects.filter(action=ChangeEvent.CREATED).update(
+            created_at=datetime.now(timezone.utc) - timedelta(days=CHANGE_FEED_SETTINGS['RETENTION_DAYS'] + 1)
+        )
+        log_file = os.path.join(tempfile.mkdtemp(), 'relay.log')
+        with mock.patch.dict(CRON_SETTINGS, {'CHANGE_RELAY_LOG_FILE': log_file}):
+            self.assertEqual(relay_change_events(), {'published': 0, 'pruned': 1})
+        self.assertTrue(os.path.exists(log_file))
+        self.assertEqual(ChangeEvent.objects.get().action, ChangeEvent.UPDATED)
+
+    def test_prune_with_zero_days_keeps_only_unpublished_events(self):
+        customer = Customer.objects.create(name='Zed', email='zed@example.com')
+        outbox.record(customer)
+        outbox.record(customer, ChangeEvent.UPDATED)
+        ChangeEvent.objects.filter(action=ChangeEvent.CREATED).update(published_at=datetime.now(timezone.utc))
+        with mock.patch.dict(CHANGE_FEED_SETTINGS, {'REDIS_URL': 'redis://localhost:6379/2'}):
+            self.assertEqual(outbox.prune(days=0), 1)
+        self.assertEqual(ChangeEvent.objects.get().action, ChangeEvent.UPDATED)
+
+    def test_imported_customers_feed_changes(self):
+        path = os.path.join(tempfile.mkdtemp(), 'customers.csv')
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write('name,email,phone\nIda,ida@example.com,\nJon,jon@example.com,\n,bad,\n')
+        call_command('import_customers', path, stdout=io.StringIO(), stderr=io.StringIO())
+        events = self.execute(self.FEED)['changesSince']['events']
+        self.assertEqual([(event['entity'], event['action']) for event in events],
+                         [('customer', 'created'), ('customer', 'created')])
+        self.assertEqual({event['payload']['email'] for event in events}, {'ida@example.com', 'jon@example.com'})
+
+
+class CustomerRetentionTests(EagerCeleryMixin, TestCase):
+    def test_zero_days_is_not_the_default(self):
+        customer = Customer.objects.create(name='Recent', email='recent@example.com')
+        Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+        self.assertFalse(retention.inactive_customers().exists())
+        self.assertEqual(list(retention.inactive_customers(days=0)), [customer])
+        self.assertEqual(send_order_reminders.delay(days=0).get(), 0)
+        self.assertEqual(send_order_reminders.delay().get(), 1)
+
+    def test_archives_inactive_customers_then_purges_them_in_batches(self):
+        now = datetime.now(timezone.utc)
+        active = Customer.objects.create(name='Active', email='active@example.com')
+        Order.objects.create(customer=active, total_amount=Decimal('5.00'))
+        idle = Customer.objects.create(name='Idle', email='idle@example.com')
+        order = Order.objects.create(customer=idle, total_amount=Decimal('9.00'))
+        Order.objects.filter(pk=order.pk).update(order_date=now - timedelta(days=400))
+        CustomerStats.objects.refresh([idle.pk])
+
+        self.assertEqual(retention.archive_customers(retention.inactive_customers(days=365), batch_size=1), 1)
+        self.assertEqual(list(Customer.objects.all()), [active])
+        self.assertEqual(ChangeEvent.objects.filter(action=ChangeEvent.ARCHIVED).get().entity_id, idle.pk)
+        result = schema.execute('{ customer(id: "%s") { name } orders { customer { name } } }' % idle.pk)
+        self.assertIsNone(result.errors)
+        self.assertIsNone(result.data['customer'])
+        self.assertEqual(sorted(order['customer']['name'] for order in result.data['orders']), ['Active', 'Idle'])
+        # The email is free for a new sign-up
+        Customer.objects.create(name='Idle again', email='idle@example.com')
+
+        self.assertEqual(retention.purge_archived_customers(retention_days=30, pause=0), (0, 0))
+        purged = retention.purge_archived_customers(
+            retention_days=30, batch_size=1, pause=0, now=now + timedelta(days=31)
+        )
+        self.assertEqual(purged, (1, 1))
+        self.assertFalse(Customer.all_objects.filter(pk=idle.pk).exists())
+        self.assertEqual(Order.objects.get().customer, active)
+        deleted = ChangeEvent.objects.filter(action=ChangeEvent.DELETED)
+        self.assertEqual([(event.entity, event.entity_id) for event in deleted],
+                         [('order', order.pk), ('customer', idle.pk)])
+
+    def test_purged_archived_orders_feed_changes(self):
+        now = datetime.now(timezone.utc)
+        customer = Customer.objects.create(name='Gone', email='gone@example.com')
+        product = Product.objects.create(name='Cup', price=Decimal('3.00'), stock=5)
+        order = Order.objects.create(customer=customer, total_amount=Decimal('3.00'))
+        order.products.add(product)
+        Order.objects.filter(pk=order.pk).update(order_date=datetime(2024, 1, 15, tzinfo=timezone.utc))
+        archive.move_orders(datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2024, 2, 1, tzinfo=timezone.utc))
+        Customer.all_objects.filter(pk=customer.pk).update(archived_at=now - timedelta(days=31))
+
+        self.assertEqual(retention.purge_archived_customers(retention_days=30, pause=0, now=now), (1, 1))
+        event = ChangeEvent.objects.get(action=ChangeEvent.DELETED, entity='order')
+        self.assertEqual((event.entity_id, event.payload['product_ids']), (order.pk, [product.pk]))
+        self.assertFalse(ArchivedOrder.objects.exists())
+
+
+class ProductCacheTests(TestCase):
+    QUERY = '{ order(id: "%s") { products { edges { node { name price } } } } }'
+
+    def setUp(self):
+        catalog.get_cache().clear()
+        self.customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        self.pen = Product.objects.create(name='Pen', price=Decimal('1.50'), stock=10)
+        self.ink = Product.objects.create(name='Ink', price=Decimal('4.00'), stock=10)
+
+    def execute(self, query):
+        result = schema.execute(query)
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_serves_names_and_prices_from_the_cache_until_a_product_changes(self):
+        order = self.execute(
+            'mutation { createOrder(input: {customerId: "%s", productIds: ["%s", "%s", "%s"]}) '
+            '{ order { id totalAmount } } }' % (self.customer.pk, self.pen.pk, self.pen.pk, self.ink.pk)
+        )['createOrder']['order']
+        self.assertEqual(order['totalAmount'], '7.00')
+        order_pk = Order.objects.get().pk
+
+        with self.assertNumQueries(3):  # order, catalogue version, order lines
+            data = self.execute(self.QUERY % order_pk)
+        self.assertEqual([edge['node'] for edge in data['order']['products']['edges']],
+                         [{'name': 'Ink', 'price': '4.00'}, {'name': 'Pen', 'price': '1.50'}])
+        self.assertEqual((catalog.stats()['hits'], catalog.stats()['misses']), (2, 2))
+
+        self.pen.price = Decimal('2.00')
+        self.pen.save()
+        data = self.execute(self.QUERY % order_pk)
+        self.assertEqual(data['order']['products']['edges'][1]['node']['price'], '2.00')
+        self.assertEqual(catalog.stats()['invalidations'], 1)
+
+        # Stock is read live, not from the cache
+        data = self.execute('{ order(id: "%s") { products { edges { node { name stock } } } } }' % order_pk)
+        self.assertEqual([edge['node']['stock'] for edge in data['order']['products']['edges']], [9, 8])
+
+
+class ArchiveOrdersTests(TestCase):
+    ORDERS = """
+        query Orders($from: DateTime) {
+            allOrders(orderDate_Gte: $from) {
+                edges { node { totalAmount products { edges { node { name } } } } }
+            }
+        }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        self.mouse = Product.objects.create(name='Mouse', price=Decimal('29.99'), stock=50)
+        self.old = self.create_order(Decimal('29.99'), datetime(2024, 1, 15, tzinfo=timezone.utc))
+        self.new = self.create_order(Decimal('59.98'), datetime(2024, 3, 2, tzinfo=timezone.utc))
+
+    def create_order(self, total, order_date):
+        order = Order.objects.create(customer=self.customer, total_amount=total)
+        order.products.set([self.mouse])
+        Order.objects.filter(pk=order.pk).update(order_date=order_date)
+        return order
+
+    def orders(self, date_from=None):
+        result = schema.execute(self.ORDERS, variables={'from': date_from})
+        self.assertIsNone(result.errors)
+        return [
+            (edge['node']['totalAmount'], [product['node']['name'] for product in edge['node']['products']['edges']])
+            for edge in result.data['allOrders']['edges']
+        ]
+
+    def test_archives_closed_months_and_queries_them_by_date(self):
+        directory = tempfile.mkdtemp()
+        cutoff = datetime(2024, 3, 1, tzinfo=timezone.utc)
+        results = list(archive.archive_orders(cutoff, directory, 'ndjson'))
+
+        self.assertEqual([(start.month, moved) for start, moved, _ in results], [(1, 1), (2, 0)])
+        with gzip.open(results[0][2], 'rt') as handle:
+            record = json.loads(handle.readline())
+        self.assertEqual((record['id'], record['product_ids']), (self.old.pk, [self.mouse.pk]))
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [self.new.pk])
+        self.assertTrue(ArchivedOrder.objects.filter(pk=self.old.pk).exists())
+        stats = CustomerStats.objects.get(customer=self.customer)
+        self.assertEqual((stats.order_count, stats.lifetime_value), (2, Decimal('89.97')))
+
+        self.assertEqual(self.orders(), [('59.98', ['Mouse'])])
+        self.assertEqual(self.orders('2024-02-01T00:00:00+00:00'), [('59.98', ['Mouse'])])
+        self.assertEqual(
+            self.orders('2024-01-01T00:00:00+00:00'),
+            [('59.98', ['Mouse']), ('29.99', ['Mouse'])],
+        )
+        # Aggregates merge the hot and archived orders
+        result = schema.execute(
+            '{ allOrders(orderDate_Gte: "2024-01-01T00:00:00+00:00") { aggregates { count sumTotalAmount minOrderDate } } }'
+        )
+        self.assertEqual(result.data['allOrders']['aggregates'], {
+            'count': 2, 'sumTotalAmount': '89.97', 'minOrderDate': '2024-01-15T00:00:00+00:00',
+        })
+
+    def test_order_by_is_rejected_when_the_archive_is_included(self):
+        list(archive.archive_orders(datetime(2024, 3, 1, tzinfo=timezone.utc), tempfile.mkdtemp(), 'ndjson'))
+        query = '{ allOrders(orderDate_Gte: "%s", orderBy: "%s") { edges { node { totalAmount } } } }'
+
+        def totals(date_from, order_by):
+            result = schema.execute(query % (date_from, order_by))
+            self.assertIsNone(result.errors)
+            return [edge['node']['totalAmount'] for edge in result.data['allOrders']['edges']]
+
+        result = schema.execute(query % ('2024-01-01T00:00:00+00:00', 'total_amount'))
+        self.assertIn("orderBy 'total_amount' is not supported", result.errors[0].message)
+        self.assertEqual(totals('2024-01-01T00:00:00+00:00', '-order_date'), ['59.98', '29.99'])
+        self.assertEqual(totals('2024-01-01T00:00:00+00:00', 'order_date'), ['29.99', '59.98'])
+        # Hot-only date ranges take any ordering
+        self.create_order(Decimal('10.00'), datetime(2024, 3, 5, tzinfo=timezone.utc))
+        self.assertEqual(totals('2024-03-01T00:00:00+00:00', 'total_amount'), ['10.00', '59.98'])
+
+
+class CeleryRoutingTests(EagerCeleryMixin, TestCase):
+    def queue(self, task_name):
+        return celery_app.amqp.router.route({}, task_name)['queue'].name
+
+    def test_tasks_are_routed_to_their_queues(self):
+        self.assertEqual(self.queue('crm.tasks.generate_crm_report'), 'reports')
+        self.assertEqual(self.queue('crm.tasks.send_order_reminder_batch'), 'notifications')
+        self.assertEqual(self.queue('crm.tasks.finalize_order_reminders'), 'notifications')
+        self.assertEqual(self.queue('crm.tasks.record_heartbeat'), 'default')
+
+    def test_only_chord_headers_keep_results(self):
+        self.assertTrue(generate_crm_report.ignore_result)
+        self.assertFalse(send_order_reminder_batch.ignore_result)
+
+    def test_reminder_chord_runs_eagerly(self):
+        customer = Customer.objects.create(name='Bob', email='bob@example.com')
+        orders = [Order.objects.create(customer=customer, total_amount=Decimal('10.00')) for _ in range(3)]
+        self.assertEqual(send_order_reminders.delay(batch_size=2).get(), 2)
+        self.assertEqual(
+            set(OrderReminder.objects.values_list('order_id', flat=True)),
+            {order.pk for order in orders},
+        )
+
+
+class CrmReportTests(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        customer = Customer.objects.create(name='Carol', email='carol@example.com')
+        for amount in ('10.00', '20.50', '5.25', '4.25', '60.00'):
+            Order.objects.create(customer=customer, total_amount=Decimal(amount))
+        self.report_file = os.path.join(tempfile.mkdtemp(), 'report.json')
+        patcher = mock.patch.dict(CRON_SETTINGS, {'CRM_REPORT_FILE': self.report_file})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_report_is_merged_from_chunks(self):
+        generate_crm_report.delay(run_key='week-1', chunk_size=2)
+
+        run = ReportRun.objects.get(key='week-1')
+        self.assertGreater(run.chunks.count(), 1)
+        self.assertFalse(run.chunks.filter(computed_at__isnull=True).exists())
+        self.assertEqual((run.customers, run.orders, run.revenue), (1, 5, Decimal('100.00')))
+        with open(self.report_file) as handle:
+            self.assertEqual(json.load(handle)['revenue'], '100.00')
+
+    def test_retried_run_resumes_from_checkpoints(self):
+        run, pending = reports.start_run('week-2', chunk_size=2)
+        # A chunk computed before the failure is not recomputed
+        reports.compute_chunk(pending[0])
+        with mock.patch.object(reports, 'compute_chunk', wraps=reports.compute_chunk) as compute:
+            generate_crm_report.delay(run_key='week-2')
+        self.assertEqual(sorted(call.args[0] for call in compute.call_args_list), pending[1:])
+        run.refresh_from_db()
+        self.assertEqual((run.orders, run.revenue), (5, Decimal('100.00')))
+
+        finished_at = run.finished_at
+        self.assertEqual(generate_crm_report.delay(run_key='week-2').get()['orders'], 5)
+        run.refresh_from_db()
+        self.assertEqual(run.finished_at, finished_at)
+
+    def test_chunks_read_hot_and_archived_orders_in_one_statement(self):
+        run, pending = reports.start_run('week-3', chunk_size=10)
+        Order.objects.filter(pk__in=Order.objects.order_by('pk').values('pk')[:2]).update(
+            order_date=datetime(2024, 1, 15, tzinfo=timezone.utc)
+        )
+        archive.move_orders(datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2024, 2, 1, tzinfo=timezone.utc))
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+        with self.assertNumQueries(4):  # chunk, hot and archived totals, checkpoint, reload
+            chunk = reports.compute_chunk(pending[0])
+        self.assertEqual((chunk.orders, chunk.revenue), (5, Decimal('100.00')))
+
+
+class CustomerValidationTests(TestCase):
+    def test_batch_errors_are_reported_per_row(self):
+        Customer.objects.create(name='Dana', email='dana@example.com')
+        customers, errors = validation.validate_customers([
+            {'name': 'Eve', 'email': ' eve@Example.COM ', 'phone': '555-123-4567'},
+            {'name': 'Finn', 'email': 'finn@example.com', 'phone': '+441234567890'},
+            {'name': '', 'email': 'not-an-email', 'phone': '(555) 123 4567'},
+            {'name': 'Eve again', 'email': 'eve@example.com'},
+            {'name': 'Dana', 'email': 'dana@example.com'},
+        ])
+        self.assertEqual(customers[0], {'name': 'Eve', 'email': 'eve@example.com', 'phone': '+15551234567'})
+        self.assertEqual(customers[1]['phone'], '+441234567890')
+        self.assertEqual(customers[2:], [None, None, None])
+        self.assertEqual(errors[2], [
+            "Name is required", validation.EMAIL_ERROR, validation.PHONE_ERROR,
+        ])
+        self.assertEqual(errors[3], ["Email 'eve@example.com' already exists"])
+        self.assertEqual(errors[4], ["Email 'dana@example.com' already exists"])
+
+
+class CustomerStatsTests(TestCase):
+    def setUp(self):
+        self.ann = Customer.objects.create(name='Ann', email='ann@example.com')
+        self.bob = Customer.objects.create(name='Bob', email='bob@example.com')
+
+    def snapshot(self):
+        return {
+            stats.customer_id: (stats.order_count, stats.lifetime_value, stats.last_order_date)
+            for stats in CustomerStats.objects.all()
+        }
+
+    def assertMatchesRebuild(self):
+        maintained = self.snapshot()
+        CustomerStats.objects.rebuild(batch_size=1)
+        self.assertEqual(maintained, self.snapshot())
+        return maintained
+
+    def test_create_delete_and_reassign_match_a_rebuild(self):
+        first = Order.objects.create(customer=self.ann, total_amount=Decimal('10.00'))
+        second = Order.objects.create(customer=self.ann, total_amount=Decimal('5.50'))
+        Order.objects.create(customer=self.bob, total_amount=Decimal('2.25'))
+        stats = self.assertMatchesRebuild()
+        self.assertEqual(stats[self.ann.pk][:2], (2, Decimal('15.50')))
+
+        second.delete()
+        stats = self.assertMatchesRebuild()
+        self.assertEqual(stats[self.ann.pk], (1, Decimal('10.00'), first.order_date))
+
+        first.customer = self.bob
+        first.save()
+        stats = self.assertMatchesRebuild()
+        self.assertEqual(stats[self.ann.pk], (0, Decimal('0.00'), None))
+        self.assertEqual(stats[self.bob.pk][:2], (2, Decimal('12.25')))
+
+    def test_archived_orders_and_customers_are_kept(self):
+        old = Order.objects.create(customer=self.ann, total_amount=Decimal('30.00'))
+        Order.objects.filter(pk=old.pk).update(order_date=datetime(2024, 1, 15, tzinfo=timezone.utc))
+        Order.objects.create(customer=self.ann, total_amount=Decimal('4.00'))
+        list(archive.archive_orders(datetime(2024, 2, 1, tzinfo=timezone.utc), tempfile.mkdtemp(), 'ndjson'))
+        self.assertTrue(ArchivedOrder.objects.filter(pk=old.pk).exists())
+        stats = self.assertMatchesRebuild()
+        self.assertEqual(stats[self.ann.pk][:2], (2, Decimal('34.00')))
+
+        retention.archive_customers(Customer.objects.filter(pk=self.ann.pk))
+        Order.objects.get(customer_id=self.ann.pk).delete()
+        stats = self.assertMatchesRebuild()
+        self.assertEqual(stats[self.ann.pk][:2], (1, Decimal('30.00')))
+        self.assertEqual(stats[self.ann.pk][2], datetime(2024, 1, 15, tzinfo=timezone.utc))
+        # A rebuild also repairs the archived customer's row
+        CustomerStats.objects.filter(customer_id=self.ann.pk).update(order_count=0, lifetime_value=0)
+        CustomerStats.objects.rebuild()
+        self.assertEqual(self.snapshot(), stats)
+
+
+class SalesRollupTests(TestCase):
+    DAY = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Gus', email='gus@example.com')
+        self.pen = Product.objects.create(name='Pen', price=Decimal('1.50'), stock=10)
+        self.ink = Product.objects.create(name='Ink', price=Decimal('4.00'), stock=10)
+
+    def create_order(self, total, products, order_date=DAY):
+        order = Order.objects.create(customer=self.customer, total_amount=Decimal(total))
+        order.products.set(products)
+        Order.objects.filter(pk=order.pk).update(order_date=order_date)
+        order.refresh_from_db()
+        return order
+
+    def rollup(self):
+        revenue = {row.date: (row.revenue, row.order_count) for row in DailyRevenue.objects.all()}
+        units = {(row.date, row.product_id): row.units for row in DailyProductSales.objects.all()}
+        return revenue, units
+
+    def test_folds_past_the_watermark_after_the_settle_window(self):
+        first = self.create_order('5.50', [self.pen, self.ink])
+        self.assertEqual(rollups.refresh_sales_rollups(), 0)  # Still settling
+        self.assertEqual(rollups.refresh_sales_rollups(settle_seconds=0), 1)
+        second = self.create_order('1.50', [self.pen])
+        self.assertEqual(rollups.refresh_sales_rollups(batch_size=1, settle_seconds=0), 1)
+        self.assertEqual(rollups.refresh_sales_rollups(settle_seconds=0), 0)
+
+        self.assertEqual(RollupWatermark.objects.get(name=rollups.SALES_ROLLUP).last_order_id, second.pk)
+        day = self.DAY.date()
+        self.assertEqual(self.rollup(), (
+            {day: (Decimal('7.00'), 2)},
+            {(day, self.pen.pk): 2, (day, self.ink.pk): 1},
+        ))
+        self.assertLess(first.pk, second.pk)
+
+    def test_edits_and_deletes_reconcile_folded_days(self):
+        kept = self.create_order('5.50', [self.pen, self.ink])
+        moved = self.create_order('4.00', [self.ink])
+        rollups.refresh_sales_rollups(settle_seconds=0)
+        unfolded = self.create_order('9.00', [self.pen])
+
+        day, next_day = self.DAY.date(), self.DAY.date() + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.order_date = self.DAY + timedelta(days=1)
+            moved.total_amount = Decimal('3.00')
+            moved.save()
+            kept.products.remove(self.ink)
+            unfolded.delete()
+        self.assertEqual(self.rollup(), (
+            {day: (Decimal('5.50'), 1), next_day: (Decimal('3.00'), 1)},
+            {(day, self.pen.pk): 1, (next_day, self.ink.pk): 1},
+        ))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kept.delete()
+        expected = ({next_day: (Decimal('3.00'), 1)}, {(next_day, self.ink.pk): 1})
+        self.assertEqual(self.rollup(), expected)
+        DailyRevenue.objects.all().delete()
+        self.assertEqual(rollups.rebuild_sales_rollups(), 1)
+        self.assertEqual(self.rollup(), expected)
+
+    def test_changes_reconcile_once_per_transaction_and_skip_unfolded_orders(self):
+        orders = [self.create_order('1.50', [self.pen]) for _ in range(3)]
+        rollups.refresh_sales_rollups(settle_seconds=0)
+        unfolded = self.create_order('4.00', [self.ink])
+        with mock.patch.object(rollups, '_recompute_days', wraps=rollups._recompute_days) as recompute:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                unfolded.total_amount = Decimal('5.00')
+                unfolded.save()
+                unfolded.products.add(self.pen)
+            self.assertEqual(len(callbacks), 1)
+            recompute.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                Order.objects.filter(pk__in=[order.pk for order in orders[:2]]).delete()
+                orders[2].total_amount = Decimal('2.00')
+                orders[2].save()
+            self.assertEqual(len(callbacks), 1)
+            recompute.assert_called_once()
+        self.assertEqual(self.rollup()[0], {self.DAY.date(): (Decimal('2.00'), 1)})
+        rollups.refresh_sales_rollups(settle_seconds=0)
+        self.assertEqual(self.rollup(), (
+            {self.DAY.date(): (Decimal('7.00'), 2)},
+            {(self.DAY.date(), self.pen.pk): 2, (self.DAY.date(), self.ink.pk): 1},
+        ))
+
+    def test_purged_and_archived_orders(self):
+        self.create_order('30.00', [self.pen], order_date=datetime(2024, 1, 15, tzinfo=timezone.utc))
+        self.create_order('5.50', [self.pen, self.ink])
+        rollups.refresh_sales_rollups(settle_seconds=0)
+        list(archive.archive_orders(datetime(2024, 2, 1, tzinfo=timezone.utc), tempfile.mkdtemp(), 'ndjson'))
+        self.assertEqual(len(self.rollup()[0]), 2)
+        rollups.rebuild_sales_rollups()
+        self.assertEqual(self.rollup()[0][datetime(2024, 1, 15).date()], (Decimal('30.00'), 1))
+
+        retention.archive_customers(Customer.objects.all())
+        purged = retention.purge_archived_customers(
+            retention_days=1, pause=0, now=datetime.now(timezone.utc) + timedelta(days=2)
+        )
+        self.assertEqual(purged, (1, 2))
+        self.assertEqual(self.rollup(), ({}, {}))
+
+
+class JobLogTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'job.log')
+
+    def lines(self, path=None):
+        with open(path or self.path) as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_buffers_records_until_the_job_ends(self):
+        with joblog.job_log('heartbeat', path=self.path) as log:
+            log.info("first", count=1)
+            log.warning("second")
+            self.assertFalse(os.path.exists(self.path))
+        records = self.lines()
+        self.assertEqual([record['message'] for record in records], ['first', 'second', 'job finished'])
+        self.assertEqual((records[0]['count'], records[2]['status']), (1, 'ok'))
+
+    def test_flushes_with_an_error_record_when_the_job_raises(self):
+        with self.assertRaises(ValueError):
+            with joblog.job_log('heartbeat', path=self.path) as log:
+                log.info("started")
+                raise ValueError("boom")
+        records = self.lines()
+        self.assertEqual(records[0]['message'], 'started')
+        self.assertEqual(
+            (records[1]['level'], records[1]['status'], records[1]['error']), ('error', 'error', 'boom')
+        )
+
+    def test_rotates_at_max_bytes_and_prunes_old_backups(self):
+        for run in range(5):
+            with joblog.job_log('heartbeat', path=self.path, max_bytes=300, backup_count=2) as log:
+                log.info(f"run {run}", padding='x' * 100)
+        # Each run writes ~350 bytes, so every run after the first rotates
+        files = sorted(name for name in os.listdir(os.path.dirname(self.path)) if not name.endswith('.lock'))
+        self.assertEqual(files, ['job.log', 'job.log.1', 'job.log.2'])
+        self.assertEqual(self.lines()[0]['message'], 'run 4')
+        self.assertEqual(self.lines(f"{self.path}.1")[0]['message'], 'run 3')
+        self.assertEqual(self.lines(f"{self.path}.2")[0]['message'], 'run 2')
+
+    def test_appends_below_max_bytes(self):
+        for run in range(3):
+            with joblog.job_log('heartbeat', path=self.path, max_bytes=10000, backup_count=2) as log:
+                log.info(f"run {run}")
+        self.assertEqual(len(self.lines()), 6)
+        self.assertFalse(os.path.exists(f"{self.path}.1"))
+
+
+class GraphQLClientRetryTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(GRAPHQL_SETTINGS, {'CLIENT_RETRIES': 2, 'CLIENT_BACKOFF_FACTOR': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute(self, text):
+        from gql import gql
+        from gql.transport.exceptions import TransportServerError
+
+        session = mock.Mock()
+        session.execute.side_effect = TransportServerError("unavailable", 503)
+        with mock.patch.object(graphql_client, 'get_session', return_value=session):
+            with self.assertRaises(TransportServerError):
+                graphql_client.execute(gql(text))
+        return session.execute.call_count
+
+    def test_queries_are_retried_but_mutations_are_not(self):
+        self.assertEqual(self.execute('{ hello }'), 3)
+        self.assertEqual(self.execute('mutation { updateLowStockProducts { message } }'), 1)
+
+    def test_the_transport_only_retries_connection_errors(self):
+        policy = graphql_client._retry_policy()
+        self.assertEqual((policy.connect, policy.read, policy.status), (2, 0, 0))
+        self.assertFalse(policy.is_retry('POST', 503))
+
+
+class HealthCheckTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(HEALTH_SETTINGS, {'CHECKS': ['database', 'migrations', 'heartbeat']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.reset_cache()
+        self.addCleanup(self.reset_cache)
+
+    def reset_cache(self):
+        health._cached.update(at=None, results=None)
+
+    def beat(self):
+        log_file = os.path.join(tempfile.mkdtemp(), 'heartbeat.log')
+        with mock.patch.dict(CRON_SETTINGS, {'HEARTBEAT_LOG_FILE': log_file}):
+            return record_heartbeat()
+
+    def test_middleware_answers_before_the_rest_of_the_stack(self):
+        get_response = mock.Mock()
+        response = HealthCheckMiddleware(get_response)(RequestFactory().get('/healthz'))
+        self.assertEqual(response.status_code, 200)
+        get_response.assert_not_called()
+        # Probes address pods by IP: ALLOWED_HOSTS (CommonMiddleware) is never consulted
+        response = self.client.get('/healthz', HTTP_HOST='10.1.2.3')
+        self.assertEqual((response.status_code, response.json()['status']), (200, 'ok'))
+
+    def test_ready_after_a_heartbeat(self):
+        results = self.beat()
+        self.assertEqual(set(HealthCheckSample.objects.values_list('name', flat=True)), set(results))
+        response = self.client.get('/readyz', HTTP_HOST='10.1.2.3')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(check['ok'] for check in response.json()['checks'].values()))
+
+    def test_unavailable_when_the_heartbeat_is_stale(self):
+        self.beat()
+        HealthCheckSample.objects.update(created_at=datetime.now(timezone.utc) - timedelta(hours=1))
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        checks = response.json()['checks']
+        self.assertFalse(checks['heartbeat']['ok'])
+        self.assertTrue(checks['database']['ok'])
+
+    def test_unavailable_when_the_database_fails(self):
+        self.beat()
+        with mock.patch.dict(health.CHECKS, {'database': mock.Mock(side_effect=Exception("connection refused"))}):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['database']['error'], 'connection refused')
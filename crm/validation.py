@@ -0,0 +1,158 @@
+"""
+Customer input validation for CRM application
+Patterns from VALIDATION_SETTINGS are compiled once at import. Validators
+take whole lists and return per-index errors, so single mutations, bulk
+mutations and imports share one code path. Valid phones are normalized to
+E.164 (+<country code><number>).
+"""
+import re
+
+from .models import Customer
+from .settings import VALIDATION_SETTINGS
+
+_PHONE = re.compile('|'.join(f"(?:{pattern})" for pattern in VALIDATION_SETTINGS['PHONE_PATTERNS']))
+_EMAIL = re.compile(VALIDATION_SETTINGS['EMAIL_PATTERN'])
+_NON_DIGITS = re.compile(r'\D')
+_SEPARATORS = str.maketrans('', '', ' -().')
+
+PHONE_ERROR = VALIDATION_SETTINGS['PHONE_ERROR']
+EMAIL_ERROR = VALIDATION_SETTINGS['EMAIL_ERROR']
+COUNTRY_CODE = VALIDATION_SETTINGS['DEFAULT_COUNTRY_CODE']
+
+# Emails checked against the database per query
+EXISTING_EMAIL_CHUNK = 500
+
+
+def normalize_phone(phone):
+    """E.164 form of a phone that matched one of the PHONE_PATTERNS"""
+    if phone[0] == '+':
+        digits = phone[1:]
+        if digits.isdigit():
+            return phone
+    else:
+        digits = phone.translate(_SEPARATORS)
+        if digits.isdigit():
+            return f"+{COUNTRY_CODE}{digits}"
+    digits = _NON_DIGITS.sub('', phone)
+    return '+' + digits if phone[0] == '+' else f"+{COUNTRY_CODE}{digits}"
+
+
+def normalize_email(email):
+    """Strip whitespace and lowercase the domain part"""
+    email = email.strip()
+    at = email.rfind('@')
+    if at < 1:
+        return email
+    domain = email[at + 1:]
+    lowered = domain.lower()
+    return email if domain == lowered else email[:at + 1] + lowered
+
+
+def validate_phones(phones):
+    """
+    Validate a list of optional phones. Returns (phones, errors): the E.164
+    phone ('' when blank, None when invalid) per index, and {index: message}.
+    """
+    match = _PHONE.fullmatch
+    normalized, errors = [], {}
+    append = normalized.append
+    for index, phone in enumerate(phones):
+        if not phone:
+            append('')
+        elif match(phone):
+            append(normalize_phone(phone))
+        else:
+            append(None)
+            errors[index] = PHONE_ERROR
+    return normalized, errors
+
+
+def validate_emails(emails):
+    """
+    Validate a list of required emails. Returns (emails, errors): the
+    normalized email (None when invalid) per index, and {index: message}.
+    """
+    match = _EMAIL.fullmatch
+    normalized, errors = [], {}
+    append = normalized.append
+    for index, email in enumerate(emails):
+        email = normalize_email(email) if email else ''
+        if not email:
+            append(None)
+            errors[index] = "Email is required"
+        elif match(email):
+            append(email)
+        else:
+            append(None)
+            errors[index] = EMAIL_ERROR
+    return normalized, errors
+
+
+def existing_emails(emails):
+    """The subset of `emails` already used by a customer"""
+    emails = list(emails)
+    found = set()
+    for start in range(0, len(emails), EXISTING_EMAIL_CHUNK):
+        found.update(
+            Customer.objects.filter(email__in=emails[start:start + EXISTING_EMAIL_CHUNK])
+            .values_list('email', flat=True)
+        )
+    return found
+
+
+def validate_customers(rows, check_existing=True):
+    """
+    Validate customer rows (mappings with name, email and optional phone).
+    Returns (customers, errors): a cleaned {'name', 'email', 'phone'} dict
+    per index (None for rejected rows) and {index: [messages]}. An email
+    repeated within the batch is rejected after its first occurrence; with
+    `check_existing`, emails already in the database are rejected too.
+    Rejected rows do not claim their email.
+    """
+    phone_match = _PHONE.fullmatch
+    email_match = _EMAIL.fullmatch
+    # First pass: formats, one row at a time without per-row allocations
+    # for valid rows
+    cleaned, errors = [], {}
+    append = cleaned.append
+    for index, row in enumerate(rows):
+        get = row.get
+        name = get('name')
+        name = name.strip() if name else ''
+        email = get('email')
+        email = normalize_email(email) if email else ''
+        phone = get('phone') or ''
+        messages = None
+        if not name:
+            messages = ["Name is required"]
+        if not email:
+            messages = (messages or []) + ["Email is required"]
+        elif not email_match(email):
+            messages = (messages or []) + [EMAIL_ERROR]
+        if phone:
+            if phone_match(phone):
+                phone = normalize_phone(phone)
+            else:
+                messages = (messages or []) + [PHONE_ERROR]
+        if messages:
+            errors[index] = messages
+            append(None)
+        else:
+            append((name, email, phone))
+
+    # Second pass: duplicates within the batch and emails already in use
+    taken = existing_emails({row[1] for row in cleaned if row}) if check_existing else set()
+    customers, seen = [], set()
+    append = customers.append
+    for index, row in enumerate(cleaned):
+        if row is None:
+            append(None)
+            continue
+        email = row[1]
+        if email in taken or email in seen:
+            errors[index] = [f"Email '{email}' already exists"]
+            append(None)
+            continue
+        seen.add(email)
+        append({'name': row[0], 'email': email, 'phone': row[2]})
+    return customers, errors
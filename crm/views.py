@@ -1,3 +1,89 @@
-from django.shortcuts import render
+"""
+Views for CRM application
+"""
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from graphene_django.views import GraphQLView, HttpError
+from graphql import OperationType
 
-# Create your views here.
+from . import encoding, ratelimit
+from .loaders import clear_loader
+from .settings import GRAPHQL_SETTINGS
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView that also accepts batched requests: a JSON array of
+    operations, executed in order within one request and answered with an
+    array of results (each with its `id` and `status`). The operations share
+    the request context, so the request-scoped loaders (crm/loaders.py)
+    deduplicate lookups across the batch; a mutation clears them so later
+    operations read its writes.
+
+    Responses are encoded by crm/encoding.py (orjson when installed), and
+    a single result holding a list of at least
+    GRAPHQL_SETTINGS['STREAM_MIN_ITEMS'] items is streamed.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        # Decided per request: graphene-django only supports batch-only views
+        self.batch = self._is_batch(request)
+        if self.batch:
+            self.graphiql = False
+        self._stream = None
+        response = super().dispatch(request, *args, **kwargs)
+        if self._stream is None:
+            return response
+        return StreamingHttpResponse(
+            self._stream, status=response.status_code, content_type='application/json'
+        )
+
+    def json_encode(self, request, d, pretty=False):
+        pretty = bool(self.pretty or pretty or request.GET.get('pretty'))
+        min_items = GRAPHQL_SETTINGS['STREAM_MIN_ITEMS']
+        if min_items and not pretty and not self.batch and encoding.largest_list(d) >= min_items:
+            # dispatch() sends this instead of the (empty) buffered content
+            self._stream = encoding.iter_dumps(d, min_items)
+            return b''
+        content = encoding.dumps(d, pretty=pretty)
+        # graphene-django joins batch results as strings
+        return content.decode('utf-8') if self.batch else content
+
+    def _is_batch(self, request):
+        return (
+            request.method == 'POST'
+            and self.get_content_type(request) == 'application/json'
+            and request.body.lstrip()[:1] == b'['
+        )
+
+    def parse_body(self, request):
+        data = super().parse_body(request)
+        if not self.batch:
+            return data
+        if not all(isinstance(entry, dict) for entry in data):
+            raise HttpError(HttpResponseBadRequest("Each batched operation must be a JSON object."))
+        if len(data) > GRAPHQL_SETTINGS['MAX_BATCH_SIZE']:
+            raise HttpError(HttpResponseBadRequest(
+                f"Batch of {len(data)} operations exceeds the limit of {GRAPHQL_SETTINGS['MAX_BATCH_SIZE']}."
+            ))
+        return data
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        mutation = self._is_mutation(query, operation_name)
+        if mutation:
+            clear_loader(request)
+        result = super().execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if mutation:
+            clear_loader(request)
+        return result
+
+    @staticmethod
+    def _is_mutation(query, operation_name):
+        if not query or 'mutation' not in query:
+            return False
+        try:
+            operation = ratelimit.select_operation(ratelimit.parse_query(query), operation_name)
+        except Exception:
+            return False
+        return operation is not None and operation.operation == OperationType.MUTATION